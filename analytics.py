@@ -0,0 +1,378 @@
+"""
+Incremental annotation analytics.
+
+Every annotation belongs to a (text, category) group, and each group adds a
+fixed amount to four aggregate tables:
+- annotator_stats: per user and category, annotations and matched,
+  unmatched and undetected entities
+- agreement_stats: per category and pair of annotators, the 2x2 table of
+  their verdicts on the entities both labelled (the inputs of Cohen's kappa)
+- text_category_stats: per group, its annotators and the entities they
+  agree or disagree on
+- matcher_stats: per category and method, the matcher's true/false
+  positives/negatives against the annotators' verdicts
+
+A write takes the contributions of the groups it touches before and after the
+change and adds the difference in the same transaction, so the tables always
+equal a full recomputation. lock_texts() serializes writers of the same notes
+first; without it two concurrent saves of one group could both snapshot the
+old state and count their change on top of it. The dashboard only reads these tables, so its cost
+does not grow with the number of annotations.
+
+Matcher stats cover 'exact', which is re-run on the note, and every other
+method whose matches prematch.py stored for it. Stored matches at a stale
+threshold are still counted; rebuild after re-running prematch.py.
+
+Usage:
+    python analytics.py rebuild
+"""
+import argparse
+import json
+from collections import Counter, defaultdict
+
+from flask import Flask
+from sqlalchemy import delete, select, update
+
+from exact_matching import find_exact_matches
+from models import (
+    configure_database, db, User, TextIndex, MatchResult, PrecomputedMatch,
+    AnnotatorStats, AgreementStats, TextCategoryStats, MatcherStats
+)
+
+STAT_MODELS = (AnnotatorStats, AgreementStats, TextCategoryStats, MatcherStats)
+REBUILD_BATCH_SIZE = 500        # Notes whose groups are recomputed per statement batch
+TOP_DISPUTED = 20          # Most disputed (text, category) groups on the dashboard
+
+# (annotator a matched, annotator b matched) -> agreement_stats column
+PAIR_COLUMNS = {
+    (True, True): 'both_matched',
+    (False, False): 'both_unmatched',
+    (True, False): 'only_a_matched',
+    (False, True): 'only_b_matched',
+}
+
+
+def decode(value):
+    return json.loads(value) if value else []
+
+
+def verdicts(row):
+    """Entity -> True (matched) or False (unmatched) for the entities an annotation labelled."""
+    labels = {entity: False for entity in decode(row.unmatched)}
+    labels.update((entity, True) for entity in decode(row.matched))
+    return labels
+
+
+def group_contribution(deltas, text, text_pk, category, rows, precomputed):
+    """
+    Add the aggregates of one (text, category) group to `deltas`.
+    Args:
+        deltas: Dict of (model, primary key) -> Counter of column values
+        text: The note text
+        text_pk: TextIndex.id of the note
+        category: Entity category
+        rows: The group's match_result rows
+        precomputed: Dict of method -> set of entities prematch.py matched
+    """
+    labelled = {}
+    exact = {}
+    for row in rows:
+        labels = verdicts(row)
+        labelled[row.user_id] = labels
+        matched = sum(labels.values())
+        stats = deltas[(AnnotatorStats, (row.user_id, category))]
+        stats['annotations'] += 1
+        stats['matched'] += matched
+        stats['unmatched'] += len(labels) - matched
+        stats['undetected'] += len(decode(row.undetected_entity))
+
+        if row.entities not in exact:
+            exact[row.entities] = {m['entity'] for m in find_exact_matches(text, decode(row.entities))}
+        for method, predicted in dict(precomputed, exact=exact[row.entities]).items():
+            stats = deltas[(MatcherStats, (category, method))]
+            for entity, is_match in labels.items():
+                if entity in predicted:
+                    stats['true_positives' if is_match else 'false_positives'] += 1
+                else:
+                    stats['false_negatives' if is_match else 'true_negatives'] += 1
+
+    users = sorted(labelled)
+    for i, user_a in enumerate(users):
+        for user_b in users[i + 1:]:
+            stats = deltas[(AgreementStats, (category, user_a, user_b))]
+            for entity in labelled[user_a].keys() & labelled[user_b].keys():
+                stats[PAIR_COLUMNS[labelled[user_a][entity], labelled[user_b][entity]]] += 1
+
+    votes = defaultdict(list)
+    for labels in labelled.values():
+        for entity, is_match in labels.items():
+            votes[entity].append(is_match)
+    stats = deltas[(TextCategoryStats, (text_pk, category))]
+    stats['annotators'] += len(rows)
+    for entity_votes in votes.values():
+        if len(entity_votes) > 1:
+            stats['agreed' if len(set(entity_votes)) == 1 else 'disagreed'] += 1
+
+
+def collect(session, text_pks, groups=None, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Aggregates of the groups of some notes.
+    Args:
+        session: Session to read with
+        text_pks: TextIndex.id of the notes
+        groups: Set of (text_pk, category) to restrict to; every category when None
+    Returns:
+        Dict of (model, primary key) -> Counter of column values
+    """
+    deltas = defaultdict(Counter)
+    text_pks = sorted(set(text_pks))
+    for start in range(0, len(text_pks), batch_size):
+        batch = text_pks[start:start + batch_size]
+        rows = defaultdict(list)
+        for row in session.execute(
+            select(MatchResult.text_id, MatchResult.category, MatchResult.user_id, MatchResult.entities,
+                   MatchResult.matched, MatchResult.unmatched, MatchResult.undetected_entity)
+            .where(MatchResult.text_id.in_(batch))
+        ):
+            if groups is None or (row.text_id, row.category) in groups:
+                rows[(row.text_id, row.category)].append(row)
+        if not rows:
+            continue
+
+        texts = {
+            row.id: row for row in
+            session.execute(select(TextIndex.id, TextIndex.text_id, TextIndex.text).where(TextIndex.id.in_(batch)))
+        }
+        precomputed = defaultdict(dict)
+        for row in session.execute(
+            select(PrecomputedMatch.text_id, PrecomputedMatch.category, PrecomputedMatch.method,
+                   PrecomputedMatch.matches)
+            .where(PrecomputedMatch.text_id.in_([t.text_id for t in texts.values()]),
+                   PrecomputedMatch.method != 'exact')
+        ):
+            precomputed[(row.text_id, row.category)][row.method] = {m['entity'] for m in decode(row.matches)}
+
+        for (text_pk, category), group_rows in rows.items():
+            text = texts[text_pk]
+            group_contribution(deltas, text.text, text_pk, category, group_rows,
+                               precomputed[(text.text_id, category)])
+    return deltas
+
+
+def lock_texts(session, text_pks):
+    """
+    Hold off other writers of these notes until the transaction ends; call before reading them.
+    SQLite has a single writer, so the transaction starts with BEGIN IMMEDIATE unless an
+    earlier INSERT/UPDATE already took the write lock (pysqlite only opens transactions for
+    DML). Other databases lock the notes' text_index rows with SELECT ... FOR UPDATE, in id
+    order so that two writers never wait on each other.
+    """
+    if session.get_bind().dialect.name == 'sqlite':
+        if not session.connection().connection.dbapi_connection.in_transaction:
+            session.connection().exec_driver_sql('BEGIN IMMEDIATE')
+        return
+    text_pks = sorted(set(text_pks))
+    for start in range(0, len(text_pks), REBUILD_BATCH_SIZE):
+        session.execute(
+            select(TextIndex.id).where(TextIndex.id.in_(text_pks[start:start + REBUILD_BATCH_SIZE]))
+            .order_by(TextIndex.id).with_for_update()
+        ).all()
+
+
+def snapshot(session, groups):
+    """Aggregates of (text_pk, category) groups, taken before changing their annotations (after lock_texts)."""
+    groups = set(groups)
+    return collect(session, {text_pk for text_pk, _ in groups}, groups)
+
+
+def record_changes(session, groups, before):
+    """Apply the change of the groups' aggregates since `before` = snapshot(session, groups)."""
+    after = snapshot(session, groups)
+    changes = {}
+    for key in after.keys() | before.keys():
+        columns = {
+            column: after[key][column] - before[key][column]
+            for column in after[key].keys() | before[key].keys()
+        }
+        if any(columns.values()):
+            changes[key] = columns
+    add_to_stats(session, changes)
+
+
+def add_to_stats(session, changes):
+    """Add column increments to the aggregate rows, creating missing rows (upsert)."""
+    by_model = defaultdict(list)
+    for (model, key), columns in changes.items():
+        by_model[model].append((key, columns))
+
+    dialect = session.get_bind().dialect.name
+    for model, entries in by_model.items():
+        table = model.__table__
+        key_names = [column.name for column in table.primary_key.columns]
+        counter_names = [column.name for column in table.columns if column.name not in key_names]
+        rows = [
+            dict(zip(key_names, key), **{name: columns.get(name, 0) for name in counter_names})
+            for key, columns in entries
+        ]
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            statement = dialect_insert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=key_names,
+                set_={name: table.c[name] + statement.excluded[name] for name in counter_names}
+            )
+            session.execute(statement, rows)
+            continue
+        for row in rows:
+            matches = [table.c[name] == row[name] for name in key_names]
+            result = session.execute(
+                update(table).where(*matches).values({name: table.c[name] + row[name] for name in counter_names})
+            )
+            if result.rowcount == 0:
+                session.execute(table.insert().values(row))
+
+
+def rebuild(session, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Recompute every aggregate from match_result. Does not commit.
+    Returns:
+        Number of notes with annotations
+    """
+    for model in STAT_MODELS:
+        session.execute(delete(model.__table__))
+    notes = 0
+    last_pk = 0
+    while True:
+        text_pks = list(session.scalars(
+            select(MatchResult.text_id).where(MatchResult.text_id > last_pk)
+            .group_by(MatchResult.text_id).order_by(MatchResult.text_id).limit(batch_size)
+        ))
+        if not text_pks:
+            break
+        add_to_stats(session, collect(session, text_pks, batch_size=batch_size))
+        notes += len(text_pks)
+        last_pk = text_pks[-1]
+    return notes
+
+
+def ratio(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+
+def f1_score(precision, recall):
+    if precision is None or recall is None:
+        return None
+    return ratio(2 * precision * recall, precision + recall) or 0.0
+
+
+def cohen_kappa(both_matched, both_unmatched, only_a_matched, only_b_matched):
+    """Cohen's kappa of two annotators from their 2x2 verdict table; None without shared items."""
+    items = both_matched + both_unmatched + only_a_matched + only_b_matched
+    if not items:
+        return None
+    observed = (both_matched + both_unmatched) / items
+    a_matched = (both_matched + only_a_matched) / items
+    b_matched = (both_matched + only_b_matched) / items
+    expected = a_matched * b_matched + (1 - a_matched) * (1 - b_matched)
+    if expected == 1:
+        return 1.0  # Both gave every item the same single verdict
+    return round((observed - expected) / (1 - expected), 4)
+
+
+def agreement_summary(stats):
+    table = {column: stats[column] for column in PAIR_COLUMNS.values()}
+    items = sum(table.values())
+    return dict(
+        table,
+        items=items,
+        observed_agreement=ratio(table['both_matched'] + table['both_unmatched'], items),
+        kappa=cohen_kappa(**table)
+    )
+
+
+def dashboard(session, top=TOP_DISPUTED):
+    """
+    Every aggregate, shaped for the /analytics endpoint.
+    Reads only the aggregate tables (sized by users, categories and methods)
+    and the `top` most disputed groups through their index.
+    """
+    usernames = dict(session.execute(select(User.id, User.username)).all())
+
+    annotators = [
+        {
+            'user_id': row.user_id, 'username': usernames.get(row.user_id), 'category': row.category,
+            'annotations': row.annotations, 'matched': row.matched, 'unmatched': row.unmatched,
+            'undetected': row.undetected
+        }
+        for row in session.scalars(
+            select(AnnotatorStats).where(AnnotatorStats.annotations > 0)
+            .order_by(AnnotatorStats.user_id, AnnotatorStats.category)
+        )
+    ]
+
+    agreement = {}
+    for row in session.scalars(select(AgreementStats).order_by(
+            AgreementStats.category, AgreementStats.user_a, AgreementStats.user_b)):
+        counts = {column: getattr(row, column) for column in PAIR_COLUMNS.values()}
+        if not any(counts.values()):
+            continue
+        category = agreement.setdefault(row.category, {'pairs': [], 'pooled': Counter()})
+        category['pairs'].append(dict(
+            agreement_summary(counts),
+            user_a=row.user_a, user_b=row.user_b,
+            username_a=usernames.get(row.user_a), username_b=usernames.get(row.user_b)
+        ))
+        category['pooled'].update(counts)
+    for category in agreement.values():
+        # Every pair's items pooled into one table
+        category['pooled'] = agreement_summary(category['pooled'])
+
+    matchers = []
+    for row in session.scalars(select(MatcherStats).order_by(MatcherStats.category, MatcherStats.method)):
+        precision = ratio(row.true_positives, row.true_positives + row.false_positives)
+        recall = ratio(row.true_positives, row.true_positives + row.false_negatives)
+        matchers.append({
+            'category': row.category, 'method': row.method,
+            'true_positives': row.true_positives, 'false_positives': row.false_positives,
+            'false_negatives': row.false_negatives, 'true_negatives': row.true_negatives,
+            'precision': precision, 'recall': recall,
+            'f1': f1_score(precision, recall)
+        })
+
+    disputed = [
+        {'text_id': row.text_id, 'category': row.category, 'annotators': row.annotators,
+         'agreed': row.agreed, 'disagreed': row.disagreed}
+        for row in session.execute(
+            select(TextIndex.text_id, TextCategoryStats.category, TextCategoryStats.annotators,
+                   TextCategoryStats.agreed, TextCategoryStats.disagreed)
+            .join(TextIndex, TextIndex.id == TextCategoryStats.text_id)
+            .where(TextCategoryStats.disagreed > 0)
+            .order_by(TextCategoryStats.disagreed.desc(), TextCategoryStats.text_id.desc(),
+                      TextCategoryStats.category.desc())
+            .limit(top)
+        )
+    ]
+
+    return {'annotators': annotators, 'agreement': agreement, 'matchers': matchers, 'disputed': disputed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the annotation analytics aggregates.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = subparsers.add_parser('rebuild', help="Recompute every aggregate from the annotations")
+    rebuild_parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE, help="Notes per batch")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    configure_database(app)
+    with app.app_context():
+        notes = rebuild(db.session, args.batch_size)
+        db.session.commit()
+        print(f"✅ Rebuilt analytics for {notes} annotated notes")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,90 +1,162 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
-from sqlalchemy.orm import joinedload
-from flask_sqlalchemy import SQLAlchemy
-from markupsafe import Markup
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, stream_with_context, g
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from markupsafe import Markup, escape
 from werkzeug.security import generate_password_hash, check_password_hash
+import csv
+import io
 import re
 import json
 import os
+import time
 from dotenv import load_dotenv 
-from sentence_transformers import SentenceTransformer, util 
 import numpy as np
+from embedding_cache import EmbeddingCache
+from exact_matching import find_exact_matches, get_exact_matcher
+from fuzzy_matching import find_fuzzy_matches
+from span_matching import find_span_matches, span_encode_inputs, cosine_similarity_matrix
+from vector_index import ChunkIndex
+from inference import EncodeBatcher, ModelLoader, ModelNotReady
+from encoders import load_encoder
+from importer import ENTITY_KEY, insert_ignoring_duplicates, iter_import, update_category_counts
+from models import db, configure_database, User, TextIndex, TextEntity, MatchResult, PrecomputedMatch, MatchThreshold
+from analytics import (
+    lock_texts, snapshot as analytics_snapshot, record_changes as record_analytics, dashboard as analytics_dashboard
+)
+from calibration import CalibratedThresholds, enqueue as queue_calibration
+from migrations import upgrade
+from instrumentation import (
+    configure_logging, timed, observe_encode_batch, render_sample, SlowRequestProfiler,
+    STAGE_SECONDS, REQUEST_SECONDS, ENCODE_BATCH_SIZE, ENCODE_BATCH_SECONDS
+)
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', '123456')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URI', 'sqlite:///entities.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# DATABASE_URI (SQLite by default, PostgreSQL supported) and its engine settings
+configure_database(app)
 
 # Global configuration parameters
 SEMANTIC_MATCH_THRESHOLD = 0.8  # Threshold for semantic matching (0-1)
 FUZZY_MATCH_THRESHOLD = 80     # Threshold for fuzzy matching (0-100)
+# Per-category thresholds fitted by `python calibration.py run` override the two above;
+# each process re-reads them this often
+THRESHOLD_RELOAD_SECONDS = int(os.getenv('THRESHOLD_RELOAD_SECONDS', '30'))
+EMBEDDING_CACHE_SIZE = 10000   # Max embeddings kept in memory (older ones stay on disk)
+# Max embeddings kept on disk, least recently used evicted first (~3 KB each at 768 dimensions)
+EMBEDDING_DISK_CACHE_SIZE = int(os.getenv('EMBEDDING_DISK_CACHE_SIZE', '200000'))
+MODEL_NAME = os.getenv('MODEL_NAME', 'pritamdeka/S-PubMedBert-MS-MARCO')
+# 'background': start loading at import, serve non-model routes meanwhile
+# 'lazy': load on first use
+# 'eager': load at import, e.g. in a pre-fork master so workers share it copy-on-write
+MODEL_LOAD_MODE = os.getenv('MODEL_LOAD_MODE', 'background')
+MODEL_READY_TIMEOUT = 20       # Seconds a model-backed request waits for loading before a 503
+# Encoder backend: 'torch' (fp32), 'torch-int8' (dynamically quantized) or 'onnx' (ONNX Runtime)
+ENCODER_BACKEND = os.getenv('ENCODER_BACKEND', 'torch')
+ONNX_INTRA_OP_THREADS = int(os.getenv('ONNX_INTRA_OP_THREADS', '0')) or None  # None = one per core
+MATCH_METHODS = ('sentence', 'span', 'fuzzy', 'exact')
+MODEL_FREE_METHODS = ('fuzzy', 'exact')  # Methods that never wait for the sentence model
+TEXT_PAGE_SIZE = 100           # Texts per page on the landing page and /texts
+MAX_TEXT_PAGE_SIZE = 1000      # Upper bound for the per_page parameter of /texts
+TEXT_PREVIEW_LENGTH = 40       # Characters of note text included in listings
+REVIEW_PAGE_SIZE = 100         # Annotations per page on /review and /annotations
+MAX_REVIEW_PAGE_SIZE = 1000    # Upper bound for the per_page parameter of /annotations
+REVIEW_PREVIEW_LENGTH = 100    # Characters of note text shown with text=preview
+EXPORT_BATCH_SIZE = 1000       # Rows fetched from the cursor per chunk of /annotations/export
+ANALYTICS_TOP_DISPUTED = 20    # Most disputed (text, category) groups listed by /analytics
+MAX_ANALYTICS_TOP_DISPUTED = 500
+VECTOR_INDEX_NPROBE = 8        # Inverted lists scanned per corpus-wide search
+MODEL_BATCH_MAX_SIZE = 64      # Strings per coalesced forward pass
+MODEL_BATCH_MAX_WAIT_MS = 5    # How long a request waits for others to share its forward pass
+MODEL_ENCODE_TIMEOUT = 60      # Seconds a request waits for its forward pass before failing
+IMPORT_BATCH_SIZE = 1000       # Records per transaction during /import_database
+IMPORT_ERRORS_SHOWN = 20       # Per-line import errors listed in the flash message
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' (one object per line) or 'text'
+# Profile every request with cProfile and keep reports of those slower than this (0 = off)
+PROFILE_SLOW_REQUEST_MS = int(os.getenv('PROFILE_SLOW_REQUEST_MS', '0'))
 
-db = SQLAlchemy(app)
+# Log ids, counts and timings only: note texts and entities are PHI
+configure_logging(app.logger, LOG_LEVEL, LOG_FORMAT)
 
-# Initialize the sentence transformer model with S-PubMedBert-MS-MARCO
-model = SentenceTransformer('pritamdeka/S-PubMedBert-MS-MARCO')
+def load_sentence_model():
+    # Backends import torch/onnxruntime themselves: those imports alone take seconds
+    return load_encoder(
+        MODEL_NAME,
+        backend=ENCODER_BACKEND,
+        onnx_dir=os.path.join(app.instance_path, 'onnx'),
+        intra_op_threads=ONNX_INTRA_OP_THREADS
+    )
 
-class User(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    password = db.Column(db.String(120), nullable=False)
+# Initialize the sentence transformer model with S-PubMedBert-MS-MARCO off the import path;
+# `model` proxies encode() and blocks until loading has finished
+model = ModelLoader(load_sentence_model)
+if MODEL_LOAD_MODE == 'eager':
+    model.load()
+elif MODEL_LOAD_MODE == 'background':
+    model.start()
 
-class MatchResult(db.Model):
-    __tablename__ = 'match_result'
-    id = db.Column(db.Integer, primary_key=True)
-    text_id = db.Column(db.String(50), db.ForeignKey('text_index.text_id'), nullable=False)
-    category = db.Column(db.String(80), nullable=False)
-    entities = db.Column(db.Text, nullable=False)
-    matched = db.Column(db.Text, nullable=True)
-    unmatched = db.Column(db.Text, nullable=True)
-    undetected_entity = db.Column(db.Text, nullable=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+# Request threads encode through the batcher so concurrent annotators share forward passes
+encoder = EncodeBatcher(
+    model, max_batch_size=MODEL_BATCH_MAX_SIZE, max_wait_ms=MODEL_BATCH_MAX_WAIT_MS,
+    on_batch=observe_encode_batch, timeout=MODEL_ENCODE_TIMEOUT
+)
 
-    text = db.relationship('TextIndex', backref='match_results')
+# Embeddings are cached by content hash in memory and in instance/embeddings.db
+embedding_cache = EmbeddingCache(
+    os.path.join(app.instance_path, 'embeddings.db'),
+    # Backends agree only within a tolerance, so each keeps its own cache entries
+    model_name=MODEL_NAME if ENCODER_BACKEND == 'torch' else f"{MODEL_NAME}@{ENCODER_BACKEND}",
+    max_items=EMBEDDING_CACHE_SIZE,
+    max_disk_items=EMBEDDING_DISK_CACHE_SIZE
+)
 
-    __table_args__ = (
-        db.UniqueConstraint('user_id', 'text_id', 'category', name='unique_annotation'),
-    )
+# Corpus-wide chunk index, built offline with `python vector_index.py build`
+VECTOR_INDEX_DIR = os.path.join(app.instance_path, 'vector_index')
+chunk_index = ChunkIndex(VECTOR_INDEX_DIR, model_name=MODEL_NAME)
 
-class TextIndex(db.Model):
-    __tablename__ = 'text_index'
-    id = db.Column(db.Integer, primary_key=True)
-    text_id = db.Column(db.String(50), unique=True, nullable=False)
-    text = db.Column(db.Text, nullable=False)
+profiler = None
+if PROFILE_SLOW_REQUEST_MS:
+    profiler = SlowRequestProfiler(os.path.join(app.instance_path, 'profiles'), PROFILE_SLOW_REQUEST_MS)
 
-def safe_read_jsonl(file_path):
-    """Safely read and parse JSONL file with error handling."""
-    try:
-        with open(file_path, 'r') as f:
-            return [json.loads(line) for line in f]
-    except FileNotFoundError:
-        app.logger.error(f"File not found: {file_path}")
-        return []
-    except json.JSONDecodeError as e:
-        app.logger.error(f"JSON decode error in {file_path}: {str(e)}")
-        return []
-    except Exception as e:
-        app.logger.error(f"Error reading {file_path}: {str(e)}")
-        return []
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def observe_query_time(conn, cursor, statement, parameters, context, executemany):
+    STAGE_SECONDS.observe(time.perf_counter() - conn.info.pop('query_started'), 'db_query')
 
-def load_all_records_from_jsonl(file_path='database.jsonl'):
-    records = []
-    data = safe_read_jsonl(file_path)
-    
-    for record in data:
-        text = record.get("text", "")
-        text_id = record.get("text_id", "")
-        for key, value in record.items():
-            if key not in ["text", "text_id"]:
-                records.append({
-                    "text": text,
-                    "text_id": text_id,
-                    "category": key,
-                    "entities": value
-                })
-    return records
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.profile = profiler.start() if profiler else None
+
+@app.after_request
+def observe_request(response):
+    seconds = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unknown'
+    REQUEST_SECONDS.observe(seconds, endpoint, request.method, response.status_code)
+    app.logger.info('request', extra={
+        'endpoint': endpoint,
+        'http_method': request.method,
+        'status': response.status_code,
+        'duration_ms': round(seconds * 1000, 2)
+    })
+    if profiler:
+        report = profiler.finish(g.profile, endpoint, seconds)
+        if report:
+            app.logger.warning('slow request profiled', extra={
+                'endpoint': endpoint, 'duration_ms': round(seconds * 1000, 2), 'profile': report
+            })
+    return response
+
+def get_text_categories(text_id):
+    """Return the categories of a text in import order."""
+    rows = db.session.query(TextEntity.category).filter_by(text_id=text_id) \
+        .group_by(TextEntity.category).order_by(db.func.min(TextEntity.id)).all()
+    return [category for (category,) in rows]
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -118,14 +190,9 @@ def format_text_for_display(text):
         # Ensure proper newline handling
         formatted_text = formatted_text.replace('\n', '\r\n')
         
-        print("Original text:", text)
-        print("Formatted text:", formatted_text)
-        
         return formatted_text
-    except Exception as e:
-        print(f"Error in format_text_for_display: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        app.logger.exception('format_text_for_display failed')
         return text
 
 @app.route('/annotate/<int:text_id>')
@@ -136,135 +203,327 @@ def annotate(text_id):
     formatted_text = format_text_for_display(record.text)
     return render_template("index.html", text=formatted_text)
 
-def get_semantic_matches(text, entities, method='sentence'):
+def load_calibrated_thresholds():
+    # Own connection: a failed read (table not migrated yet) must not abort the request's transaction
+    with db.engine.connect() as conn:
+        return conn.execute(db.select(MatchThreshold.category, MatchThreshold.method, MatchThreshold.threshold)).all()
+
+calibrated_thresholds = CalibratedThresholds(load_calibrated_thresholds, THRESHOLD_RELOAD_SECONDS)
+
+def get_match_threshold(method, category=None):
+    """Return the threshold of a matching method: the category's calibrated one if any, else the global one."""
+    if method == 'exact':
+        return 1.0  # Exact occurrences only
+    default = FUZZY_MATCH_THRESHOLD if method == 'fuzzy' else SEMANTIC_MATCH_THRESHOLD
+    if category is None:
+        return default
+    return calibrated_thresholds.get(category, method, default)
+
+def get_semantic_matches(text, entities, method='sentence', encode=None, category=None):
     """
-    Find matches between text and entities using either sentence transformer or fuzzy matching.
+    Find matches between text and entities using sentence transformer, span, fuzzy or exact matching.
     Args:
         text: The text to search in
         entities: List of entities to find
-        method: 'sentence' for sentence transformer or 'fuzzy' for fuzzy matching
+        method: 'sentence' for sentence transformer, 'span' for the best matching
+            sentence/window chunk per entity, 'fuzzy' for fuzzy matching, or 'exact'
+            for every word-boundary, case-insensitive occurrence
+        encode: Optional callable mapping a list of strings to embeddings
+            (defaults to the cached, micro-batched model)
+        category: Entity category, to use its calibrated threshold
     """
+    if encode is None:
+        encode = lambda strings: embedding_cache.encode(encoder, strings)
+
+    def timed_encode(strings):
+        with timed('encode'):
+            return encode(strings)
+
     try:
-        print(f"\nProcessing text: {text}")
-        print(f"Looking for entities: {entities}")
-        print(f"Using method: {method}")
-        
-        # Use the global threshold based on method
-        threshold = SEMANTIC_MATCH_THRESHOLD if method == 'sentence' else FUZZY_MATCH_THRESHOLD
-        print(f"Using threshold: {threshold}")
+        # The category's calibrated threshold, or the global one for the method
+        threshold = get_match_threshold(method, category)
         
         matches = []
         
         if method == 'sentence':
-            # Get embeddings for text and entities
-            text_embedding = model.encode(text, convert_to_tensor=True)
-            entity_embeddings = model.encode(entities, convert_to_tensor=True)
+            # Get embeddings for text and entities (cached by content hash)
+            text_embedding = timed_encode([text])[0]
+            entity_embeddings = timed_encode(entities)
             
             # Calculate cosine similarity
-            similarities = util.pytorch_cos_sim(text_embedding, entity_embeddings)[0]
+            with timed('similarity'):
+                similarities = cosine_similarity_matrix(text_embedding[None, :], entity_embeddings)[0]
             
-            print("\nDetailed similarity scores:")
-            for i, entity in enumerate(entities):
-                similarity = similarities[i].item()
-                print(f"Entity: {entity}, Similarity: {similarity:.4f}")
-                
-                if similarity >= threshold:
-                    # Find the position in text where this entity appears
-                    # Use word boundary and case-insensitive search
-                    pattern = re.compile(r'\b' + re.escape(entity) + r'\b', re.IGNORECASE)
-                    match = pattern.search(text)
-                    
-                    match_data = {
-                        'entity': entity,
-                        'similarity': similarity
-                    }
-                    
-                    if match:
-                        start = match.start()
-                        end = match.end()
-                        matched_text = text[start:end]
-                        print(f"Found exact match for '{entity}' at position {start} with similarity {similarity:.4f}")
-                        print(f"Matched text: '{matched_text}'")
-                        match_data.update({
+            with timed('offsets'):
+                # Locate every occurrence of the entities that pass the threshold in one scan
+                passing = [(entity, float(similarity)) for entity, similarity in zip(entities, similarities)
+                           if similarity >= threshold]
+                occurrences = {}
+                for entity, start, end in get_exact_matcher([entity for entity, _ in passing]).finditer(text):
+                    occurrences.setdefault(entity, []).append((start, end))
+
+                for entity, similarity in passing:
+                    if entity not in occurrences:
+                        matches.append({'entity': entity, 'similarity': similarity})
+                    for start, end in occurrences.get(entity, []):
+                        matches.append({
+                            'entity': entity,
+                            'similarity': similarity,
                             'start': start,
                             'end': end,
-                            'matched_text': matched_text
+                            'matched_text': text[start:end]
                         })
-                    else:
-                        print(f"No exact match found in text for '{entity}' but has high similarity {similarity:.4f}")
-                    
-                    matches.append(match_data)
-                else:
-                    print(f"Similarity {similarity:.4f} below threshold {threshold} for '{entity}'")
         
+        elif method == 'span':
+            # Entities x chunks similarity in one matrix; chunk embeddings are
+            # cached by content, so a reloaded note is not re-encoded
+            with timed('span_match'):
+                matches = find_span_matches(text, entities, threshold, encode=timed_encode)
+
+        elif method == 'exact':
+            # Every occurrence of every entity in one pass with the cached matcher
+            with timed('offsets'):
+                matches = find_exact_matches(text, entities)
+
         else:  # fuzzy matching
-            from fuzzywuzzy import fuzz
-            
-            for entity in entities:
-                # Try exact match first with word boundaries
-                pattern = re.compile(r'\b' + re.escape(entity) + r'\b', re.IGNORECASE)
-                match = pattern.search(text)
-                if match:
-                    start = match.start()
-                    end = match.end()
-                    matched_text = text[start:end]
-                    print(f"Found exact match for '{entity}'")
-                    print(f"Matched text: '{matched_text}'")
-                    matches.append({
-                        'entity': entity,
-                        'start': start,
-                        'end': end,
-                        'matched_text': matched_text,
-                        'similarity': 1.0
-                    })
-                else:
-                    # Try fuzzy matching
-                    words = text.split()
-                    for i in range(len(words)):
-                        for j in range(i + 1, min(i + 4, len(words) + 1)):
-                            phrase = ' '.join(words[i:j])
-                            ratio = fuzz.ratio(entity.lower(), phrase.lower())
-                            if ratio >= threshold:
-                                start = text.find(phrase)
-                                end = start + len(phrase)
-                                matched_text = text[start:end]
-                                print(f"Found fuzzy match for '{entity}' with ratio {ratio}")
-                                print(f"Matched text: '{matched_text}'")
-                                matches.append({
-                                    'entity': entity,
-                                    'start': start,
-                                    'end': end,
-                                    'matched_text': matched_text,
-                                    'similarity': ratio / 100.0  # Convert to 0-1 scale
-                                })
+            # Exact matches first, then all remaining entities scored against
+            # the text's n-grams in one batched rapidfuzz call
+            with timed('fuzzy_match'):
+                matches = find_fuzzy_matches(text, entities, threshold)
         
-        print(f"\nFinal matches found: {matches}")
+        app.logger.debug('matched entities', extra={
+            'method': method, 'entities': len(entities), 'matches': len(matches), 'threshold': threshold
+        })
         return matches
-    except Exception as e:
-        print(f"Error in get_semantic_matches: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        app.logger.exception('get_semantic_matches failed', extra={'method': method})
         return []
 
+def get_note_matches(text, entities_by_category, method='sentence'):
+    """
+    Match every category of a note with a single forward pass.
+    The strings all categories need (the text or its chunks plus every entity)
+    are deduplicated and encoded as one batch, then each category is matched
+    against those vectors.
+    Args:
+        text: The note text
+        entities_by_category: Dict of category -> list of entities
+        method: 'sentence', 'span', 'fuzzy' or 'exact'
+    Returns:
+        Dict of category -> list of matches
+    """
+    encode = None
+    if method not in MODEL_FREE_METHODS:
+        if method == 'span':
+            strings = [s for entities in entities_by_category.values() for s in span_encode_inputs(text, entities)]
+        else:
+            strings = [text] + [e for entities in entities_by_category.values() for e in entities]
+        strings = list(dict.fromkeys(strings))
+        with timed('encode'):
+            vectors = dict(zip(strings, embedding_cache.encode(encoder, strings))) if strings else {}
+        encode = lambda batch: np.stack([vectors[s] for s in batch])
+
+    return {
+        category: get_semantic_matches(text, entities, method=method, encode=encode, category=category)
+        for category, entities in entities_by_category.items()
+    }
+
+def invalid_match_method(method):
+    """Return a 400 response if `method` is not one of MATCH_METHODS, None otherwise."""
+    if method not in MATCH_METHODS:
+        return jsonify({'error': f"method must be one of {', '.join(MATCH_METHODS)}"}), 400
+    return None
+
+def wait_for_model():
+    """Wait up to MODEL_READY_TIMEOUT for the model; returns a 503 response if it is not ready."""
+    try:
+        model.get(timeout=MODEL_READY_TIMEOUT)
+        return None
+    except ModelNotReady as e:
+        return jsonify({'error': str(e), 'model': model.state}), 503, {'Retry-After': '5'}
+
+def client_disconnected():
+    """Whether the client has gone away; only the ASGI serving mode (asgi.py) can tell."""
+    disconnected = request.environ.get('clinmatch.disconnected')
+    return disconnected is not None and disconnected.is_set()
+
+@app.route('/healthz')
+def healthz():
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness probe: 200 once the sentence model is loaded, 503 before."""
+    body = {'model': model.state, 'load_seconds': model.load_seconds}
+    return jsonify(body), (200 if model.ready else 503)
+
+@app.route('/embedding_cache/stats')
+def embedding_cache_stats():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    return jsonify(embedding_cache.stats())
+
+@app.route('/inference/stats')
+def inference_stats():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    return jsonify(encoder.stats())
+
+@app.route('/asgi/stats')
+def asgi_stats():
+    """Inference pool counters when served by asgi.py; 404 under a WSGI server."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    pool = request.environ.get('clinmatch.inference_pool')
+    if pool is None:
+        return jsonify({'error': 'Not served by asgi.py'}), 404
+    return jsonify(pool.stats())
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text-format metrics of this process."""
+    cache = embedding_cache.stats()
+    batches = encoder.stats()
+    body = '\n'.join([
+        STAGE_SECONDS.render(),
+        REQUEST_SECONDS.render(),
+        ENCODE_BATCH_SIZE.render(),
+        ENCODE_BATCH_SECONDS.render(),
+        render_sample('clinmatch_embedding_cache_lookups_total', 'Embedding cache lookups by result', 'counter', [
+            ({'result': 'memory_hit'}, cache['memory_hits']),
+            ({'result': 'disk_hit'}, cache['disk_hits']),
+            ({'result': 'miss'}, cache['misses']),
+        ]),
+        render_sample('clinmatch_embedding_cache_hit_ratio', 'Share of lookups served from the cache', 'gauge',
+                      [({}, cache['hit_rate'])]),
+        render_sample('clinmatch_embedding_cache_memory_items', 'Embeddings held in memory', 'gauge',
+                      [({}, cache['memory_items'])]),
+        render_sample('clinmatch_encode_queued_requests', 'Encode requests waiting for a batch', 'gauge',
+                      [({}, batches['queued_requests'])]),
+        render_sample('clinmatch_model_ready', '1 once the sentence model is loaded', 'gauge',
+                      [({}, int(model.ready))]),
+    ]) + '\n'
+    return app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+@app.route('/search_entities')
+def search_entities():
+    """Return the note chunks most similar to an entity string across the whole corpus."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    if not chunk_index.exists():
+        return jsonify({'error': 'Vector index not built. Run: python vector_index.py build'}), 503
+    k = min(max(request.args.get('k', 10, type=int), 1), 100)
+    nprobe = max(request.args.get('nprobe', VECTOR_INDEX_NPROBE, type=int), 1)
+    not_ready = wait_for_model()
+    if not_ready:
+        return not_ready
+
+    query_embedding = embedding_cache.encode(encoder, [query])[0]
+    try:
+        hits = chunk_index.search(query_embedding, k=k, nprobe=nprobe)
+    except ValueError as e:  # Index built with another model, or torn by a crashed append
+        app.logger.error('vector index unusable', extra={'error': str(e)})
+        return jsonify({'error': str(e)}), 503
+
+    chunks = [chunk_index.chunk(row) for row, _ in hits]
+    texts = {
+        t.id: t for t in TextIndex.query.filter(TextIndex.id.in_({text_pk for text_pk, _, _ in chunks}))
+    }
+    results = []
+    for (text_pk, start, end), (_, similarity) in zip(chunks, hits):
+        text_record = texts.get(text_pk)
+        if not text_record:
+            continue
+        results.append({
+            'text_id': text_record.text_id,
+            'start': start,
+            'end': end,
+            'chunk': text_record.text[start:end],
+            'similarity': similarity
+        })
+    return jsonify({'query': query, 'results': results})
+
+@app.route('/notes/<string:text_id>/matches')
+def note_matches(text_id):
+    """Return a note's text, its categories with done-status, and the matches of every category."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    text_record = TextIndex.query.filter_by(text_id=text_id).first()
+    if not text_record:
+        return jsonify({'error': 'Text not found'}), 404
+    method = request.args.get('method', 'sentence')
+    invalid = invalid_match_method(method)
+    if invalid:
+        return invalid
+
+    entities_by_category = {}
+    for category, entity in db.session.query(TextEntity.category, TextEntity.entity) \
+            .filter_by(text_id=text_id).order_by(TextEntity.id):
+        entities_by_category.setdefault(category, []).append(entity)
+    done = {
+        category for (category,) in db.session.query(MatchResult.category).filter_by(
+            user_id=session['user_id'],
+            text_id=text_record.id
+        )
+    }
+
+    # Categories precomputed by prematch.py at their current threshold are served as stored
+    precomputed = {
+        row.category: row for row in PrecomputedMatch.query.filter_by(text_id=text_id, method=method)
+        if row.threshold == get_match_threshold(method, row.category)
+    }
+    to_match = {
+        category: entities for category, entities in entities_by_category.items()
+        if category not in precomputed
+    }
+    if to_match and method not in MODEL_FREE_METHODS:
+        not_ready = wait_for_model()
+        if not_ready:
+            return not_ready
+    if client_disconnected():
+        return jsonify({'error': 'Client disconnected'}), 499
+    matches = get_note_matches(text_record.text, to_match, method=method)
+
+    categories = []
+    for category, entities in entities_by_category.items():
+        if category in precomputed:
+            entities = json.loads(precomputed[category].entities)
+            category_matches = json.loads(precomputed[category].matches)
+        else:
+            category_matches = matches[category]
+        categories.append({
+            'name': category,
+            'done': category in done,
+            'entities': entities,
+            'matches': category_matches
+        })
+
+    with timed('serialize'):
+        return jsonify({
+            'text_id': text_record.text_id,
+            'text': format_text_for_display(text_record.text),
+            'method': method,
+            'categories': categories
+        })
+
 @app.route('/get_text/<int:text_id>')
 def get_text(text_id):
     record = TextIndex.query.get(text_id)
     if not record:
         return jsonify({'error': 'Text not found'}), 404
 
-    entities = []
-    with open("database.jsonl", "r") as f:
-        for line in f:
-            data = json.loads(line)
-            if data.get("text_id") == record.text_id:
-                for k, v in data.items():
-                    if k not in ["text", "text_id"]:
-                        entities.extend(v)
+    entities = [
+        entity for (entity,) in db.session.query(TextEntity.entity)
+        .filter_by(text_id=record.text_id).order_by(TextEntity.id)
+    ]
 
     # Format the text before sending
     formatted_text = format_text_for_display(record.text)
-    print(f"Original text: {record.text}")
-    print(f"Formatted text: {formatted_text}")
 
     # Return both the formatted text and entities
     return jsonify({
@@ -275,93 +534,273 @@ def get_text(text_id):
 @app.route('/get_categories/<string:text_id>')
 def get_categories(text_id):
     text_record = TextIndex.query.get_or_404(text_id)
-    with open('database.jsonl', 'r') as f:
-        for line in f:
-            record = json.loads(line)
-            if record.get("text_id") == text_record.text_id:
-                categories = [k for k in record.keys() if k not in ["text", "text_id"]]
-                result_categories = []
-                for category in categories:
-                    match_result = MatchResult.query.filter_by(
-                        user_id=session['user_id'],
-                        text_id=text_record.id,
-                        category=category
-                    ).first()
-                    result_categories.append({
-                        'name': category,
-                        'done': match_result is not None
-                    })
-                return jsonify({'categories': result_categories})
-    return jsonify({'categories': []})
+    done = {
+        category for (category,) in db.session.query(MatchResult.category).filter_by(
+            user_id=session['user_id'],
+            text_id=text_record.id
+        )
+    }
+    result_categories = [
+        {'name': category, 'done': category in done}
+        for category in get_text_categories(text_record.text_id)
+    ]
+    return jsonify({'categories': result_categories})
 
 @app.route('/get_entities/<string:text_id>/<category>')
 def get_entities(text_id, category):
     try:
-        print(f"\nGetting entities for text_id: {text_id}, category: {category}")
-        
         # Get the text record for the specific text_id
         text_record = TextIndex.query.filter_by(text_id=text_id).first()
         if not text_record:
             return jsonify({'error': 'Text not found'}), 404
-            
-        print(f"Found text: {text_record.text}")
         
         # Get matching method from query parameters
         method = request.args.get('method', 'sentence')
+        invalid = invalid_match_method(method)
+        if invalid:
+            return invalid
+
+        # Serve results computed offline by prematch.py when they match the current threshold
+        threshold = get_match_threshold(method, category)
+        precomputed = PrecomputedMatch.query.filter_by(
+            text_id=text_id,
+            category=category,
+            method=method
+        ).first()
+        if precomputed and precomputed.threshold == threshold:
+            return jsonify({
+                'entities': json.loads(precomputed.entities),
+                'matches': json.loads(precomputed.matches)
+            })
         
         # Only process entities for the current text_id and category
-        with open('database.jsonl', 'r') as f:
-            for line in f:
-                record = json.loads(line)
-                if record.get("text_id") == text_id and category in record:
-                    entities = record.get(category, [])
-                    print(f"Found entities for category {category}: {entities}")
-                    
-                    # Get matches only for the current text and category
-                    matches = get_semantic_matches(text_record.text, entities, method=method)
-                    print(f"Returning matches for text_id {text_id} and category {category}: {matches}")
-                    
-                    return jsonify({
-                        'entities': entities,
-                        'matches': matches
-                    })
-        
-        # If no matching record found
-        return jsonify({'entities': [], 'matches': []})
+        entities = [
+            entity for (entity,) in db.session.query(TextEntity.entity)
+            .filter_by(text_id=text_id, category=category).order_by(TextEntity.id)
+        ]
+        if not entities:
+            return jsonify({'entities': [], 'matches': []})
+
+        # Fuzzy and exact matching never need the model; the other methods wait for it to load
+        if method not in MODEL_FREE_METHODS:
+            not_ready = wait_for_model()
+            if not_ready:
+                return not_ready
+        if client_disconnected():
+            return jsonify({'error': 'Client disconnected'}), 499
+
+        # Get matches only for the current text and category
+        matches = get_semantic_matches(text_record.text, entities, method=method, category=category)
+
+        with timed('serialize'):
+            return jsonify({
+                'entities': entities,
+                'matches': matches
+            })
         
     except Exception as e:
-        print(f"Error in get_entities: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception('get_entities failed', extra={'text_id': text_id, 'category': category})
         return jsonify({'error': str(e)}), 500
 
+def query_text_status(user_id, status='all', after_id=0, limit=TEXT_PAGE_SIZE):
+    """
+    Annotation status of texts in id order, starting after a given TextIndex.id.
+    Texts are read by keyset on TextIndex.id; each text's expected categories come
+    from TextIndex.category_count and its done categories from one probe of the
+    (user_id, text_id, category) index, so a page never aggregates the whole corpus.
+    Args:
+        user_id: The annotator whose progress is reported
+        status: 'all', 'pending' or 'annotated'
+        after_id: Only texts with a larger TextIndex.id (the last id of the previous page)
+        limit: Maximum number of texts to return
+    Returns:
+        List of dicts with id, text_id, preview, categories, done and is_annotated
+    """
+    done_count = db.select(db.func.count(MatchResult.id)).where(
+        MatchResult.user_id == user_id, MatchResult.text_id == TextIndex.id
+    ).correlate(TextIndex).scalar_subquery()
+
+    query = db.select(
+        TextIndex.id,
+        TextIndex.text_id,
+        db.func.substr(TextIndex.text, 1, TEXT_PREVIEW_LENGTH),
+        TextIndex.category_count,
+        done_count
+    ).where(TextIndex.id > after_id)
+    if status == 'pending':
+        query = query.where(done_count < TextIndex.category_count)
+    elif status == 'annotated':
+        query = query.where(done_count >= TextIndex.category_count)
+
+    return [{
+        'id': row_id,
+        'text_id': text_id,
+        'preview': preview,
+        'categories': categories,
+        'done': min(done, categories),
+        'is_annotated': done >= categories
+    } for row_id, text_id, preview, categories, done in
+        db.session.execute(query.order_by(TextIndex.id).limit(limit))]
+
 @app.route('/')
 def index():
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    all_records = load_all_records_from_jsonl()
-    annotated = MatchResult.query.filter_by(user_id=session['user_id']).all()
-    annotated_map = {(r.text.text_id, r.category) for r in annotated}
-
-    texts = TextIndex.query.all()
-    text_status = []
-
-    for text_obj in texts:
-        related_records = [r for r in all_records if r['text_id'] == text_obj.text_id]
-        all_categories = list(set(r['category'] for r in related_records))
-        remaining = [cat for cat in all_categories if (text_obj.text_id, cat) not in annotated_map]
-        is_annotated = len(remaining) == 0
-        text_status.append({
-            'text_id': text_obj.text_id,
-            'text': text_obj.text,
-            'is_annotated': is_annotated
-        })
+    # Only the first page is rendered; the page fetches further ones from /texts
+    text_status = query_text_status(session['user_id'], status='pending', limit=TEXT_PAGE_SIZE + 1)
+    has_more = len(text_status) > TEXT_PAGE_SIZE
+    text_status = text_status[:TEXT_PAGE_SIZE]
+
+    return render_template(
+        'index.html', text_status=text_status, has_more=has_more,
+        next_after=text_status[-1]['id'] if text_status else 0
+    )
+
+@app.route('/texts')
+def list_texts():
+    """
+    Keyset-paginated texts with the current user's annotation status.
+    Pass the returned next_after as `after` to fetch the next page, so texts
+    annotated in the meantime do not shift the pages of status=pending.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    status = request.args.get('status', 'all')
+    if status not in ('all', 'pending', 'annotated'):
+        return jsonify({'error': 'status must be one of all, pending, annotated'}), 400
+    after = max(request.args.get('after', 0, type=int), 0)
+    per_page = min(max(request.args.get('per_page', TEXT_PAGE_SIZE, type=int), 1), MAX_TEXT_PAGE_SIZE)
+
+    texts = query_text_status(session['user_id'], status=status, after_id=after, limit=per_page + 1)
+    page = texts[:per_page]
+    return jsonify({
+        'texts': page,
+        'per_page': per_page,
+        'has_more': len(texts) > per_page,
+        'next_after': page[-1]['id'] if page else after
+    })
+
+@app.template_filter('entity_list')
+def decode_entity_list(value):
+    """Decode a stored entity list; rows saved before JSON storage hold comma-joined strings."""
+    if not value:
+        return []
+    if value.startswith('['):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value.split(', ')
+
+def validate_annotation(annotation):
+    """Return an error message for an invalid annotation payload, or None."""
+    if not isinstance(annotation, dict):
+        return 'Invalid data format'
+    if not annotation.get('text_id'):
+        return 'text_id is required'
+    fields = [annotation.get(key, {}) for key in ('entities', 'matched', 'unmatched', 'undetected_entity')]
+    if not all(isinstance(d, dict) for d in fields):
+        return 'Invalid data format'
+    return None
+
+def chunked(values, size=500):
+    """Split a list so IN (...) queries stay below SQLite's bound-parameter limit."""
+    values = list(values)
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+def save_annotations(user_id, annotations):
+    """
+    Upsert the annotations of many notes and categories in one transaction.
+    Texts and existing annotations are looked up with one set-based query each;
+    unknown texts are created together with their entities.
+    Args:
+        user_id: Annotating user
+        annotations: List of validated /save payloads
+    Returns:
+        (created, updated, new TextIndex rows)
+    """
+    text_ids = {str(a['text_id']) for a in annotations}
+    texts = {}
+    for batch in chunked(text_ids):
+        texts.update((t.text_id, t) for t in TextIndex.query.filter(TextIndex.text_id.in_(batch)))
 
-    return render_template('index.html', text_status=text_status)
+    new_text_rows = {}
+    entity_rows = []
+    for annotation in annotations:
+        text_id = str(annotation['text_id'])
+        if text_id in texts or text_id in new_text_rows:
+            continue
+        new_text_rows[text_id] = {'text_id': text_id, 'text': annotation.get('text', '')}
+        entity_rows.extend(
+            {'text_id': text_id, 'category': category, 'entity': entity}
+            for category, entity_list in annotation.get('entities', {}).items()
+            if isinstance(entity_list, list)
+            for entity in entity_list
+        )
+    new_texts = []
+    if new_text_rows:
+        # Batched multi-row INSERT ... RETURNING, so new ids come back without a query per text
+        new_texts = list(db.session.scalars(
+            db.insert(TextIndex).returning(TextIndex), list(new_text_rows.values())
+        ))
+        texts.update((t.text_id, t) for t in new_texts)
+    if entity_rows:
+        db.session.execute(insert_ignoring_duplicates(db.session, TextEntity.__table__, ENTITY_KEY), entity_rows)
+        update_category_counts(db.session, TextIndex.__table__, TextEntity.__table__, list(new_text_rows))
+
+    text_pks = [t.id for t in texts.values()]
+    # Concurrent saves of the same notes queue here, so the lookups and the analytics snapshot below
+    # see every committed change
+    lock_texts(db.session, text_pks)
+    existing = {}
+    for batch in chunked(text_pks):
+        existing.update(
+            ((text_pk, category), row_id) for row_id, text_pk, category in
+            db.session.query(MatchResult.id, MatchResult.text_id, MatchResult.category)
+            .filter(MatchResult.user_id == user_id, MatchResult.text_id.in_(batch))
+        )
+
+    inserts = {}
+    updates = {}
+    for annotation in annotations:
+        text_pk = texts[str(annotation['text_id'])].id
+        for category, entity_list in annotation.get('entities', {}).items():
+            if not isinstance(entity_list, list):
+                continue
+            row = {
+                'entities': json.dumps(entity_list),
+                'matched': json.dumps(annotation.get('matched', {}).get(category, [])),
+                'unmatched': json.dumps(annotation.get('unmatched', {}).get(category, [])),
+                'undetected_entity': json.dumps(annotation.get('undetected_entity', {}).get(category, [])),
+            }
+            key = (text_pk, category)
+            if key in existing:
+                updates[key] = dict(row, id=existing[key])
+            else:
+                inserts[key] = dict(row, text_id=text_pk, category=category, user_id=user_id)
+
+    # Analytics aggregates change by the difference of the touched groups, in the same transaction
+    groups = set(inserts) | set(updates)
+    analytics_before = analytics_snapshot(db.session, groups)
+    if inserts:
+        db.session.execute(db.insert(MatchResult), list(inserts.values()))
+    if updates:
+        db.session.execute(db.update(MatchResult), list(updates.values()))
+    record_analytics(db.session, groups, analytics_before)
+    queue_calibration(db.session, groups)
+    db.session.commit()
+    return len(inserts), len(updates), new_texts
 
 @app.route('/save', methods=['POST'])
 def save():
+    """
+    Save annotations. The body is either one annotation
+    ({text_id, text, entities, matched, unmatched, undetected_entity}, each
+    list keyed by category) or {"annotations": [...]} with many of them.
+    Existing annotations of the same user, text and category are updated.
+    """
     if 'user_id' not in session:
         return jsonify({'status': 'error', 'message': 'Not authenticated'}), 401
 
@@ -370,65 +809,264 @@ def save():
         if not data:
             return jsonify({'status': 'error', 'message': 'No data provided'}), 400
 
-        text = data.get('text', '')
-        entities_dict = data.get('entities', {})
-        matched_dict = data.get('matched', {})
-        unmatched_dict = data.get('unmatched', {})
-        undetected_entity_dict = data.get('undetected_entity', {})
-        text_id = data.get('text_id', '')
+        annotations = data.get('annotations', [data]) if isinstance(data, dict) else None
+        if not isinstance(annotations, list) or not annotations:
+            return jsonify({'status': 'error', 'message': 'Invalid data format'}), 400
+        for i, annotation in enumerate(annotations):
+            error = validate_annotation(annotation)
+            if error:
+                message = error if len(annotations) == 1 else f'Annotation {i}: {error}'
+                return jsonify({'status': 'error', 'message': message}), 400
 
-        if not text_id:
-            return jsonify({'status': 'error', 'message': 'text_id is required'}), 400
+        created, updated, new_texts = save_annotations(session['user_id'], annotations)
 
-        if not all(isinstance(d, dict) for d in [entities_dict, matched_dict, unmatched_dict, undetected_entity_dict]):
-            return jsonify({'status': 'error', 'message': 'Invalid data format'}), 400
+        if new_texts and chunk_index.exists() and not model.ready:
+            app.logger.warning('model still loading; new texts not added to the vector index',
+                               extra={'texts': len(new_texts)})
+        elif new_texts and chunk_index.exists():
+            # Make the new notes searchable without rebuilding the index
+            for text_record in new_texts:
+                try:
+                    chunk_index.add_text(encoder, text_record.id, text_record.text)
+                except Exception as e:
+                    app.logger.error('could not add text to the vector index',
+                                     extra={'text_id': text_record.text_id, 'error': str(e)})
 
-        text_record = TextIndex.query.filter_by(text_id=text_id).first()
-        if not text_record:
-            text_record = TextIndex(text=text, text_id=text_id)
-            db.session.add(text_record)
-            db.session.commit()
+        return jsonify({'status': 'success', 'created': created, 'updated': updated})
 
-        for category, entity_list in entities_dict.items():
-            if not isinstance(entity_list, list):
-                continue
+    except Exception as e:
+        db.session.rollback()
+        app.logger.exception('save failed')
+        return jsonify({'status': 'error', 'message': str(e)}), 500
 
-            # Check if this category has already been annotated
-            existing = MatchResult.query.filter_by(
-                user_id=session['user_id'],
-                text_id=text_record.id,
-                category=category
-            ).first()
+@app.route('/import_database', methods=['GET', 'POST'])
+def import_database():
+    """
+    Stream a JSONL upload into text_index/text_entity in bounded batches.
+    Clients sending `Accept: application/x-ndjson` get one progress line per
+    batch followed by the final report; the form gets a flashed summary.
+    """
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    if request.method == 'GET':
+        return render_template('import_database.html')
 
-            if existing:
-                continue
+    upload = request.files.get('file_input')
+    if not upload or not upload.filename:
+        flash('No file selected.', 'warning')
+        return redirect(url_for('import_database'))
 
-            result = MatchResult(
-                text_id=text_record.id,
-                category=category,
-                entities=", ".join(entity_list),
-                matched=", ".join(matched_dict.get(category, [])),
-                unmatched=", ".join(unmatched_dict.get(category, [])),
-                undetected_entity=", ".join(undetected_entity_dict.get(category, [])),
-                user_id=session['user_id']
-            )
-            db.session.add(result)
+    def import_reports():
+        # Werkzeug spools large uploads to a temporary file, so this reads from disk line by line.
+        # The byte lines are decoded by iter_import: wrapping the SpooledTemporaryFile in
+        # io.TextIOWrapper fails before Python 3.11, which added the readable() it needs.
+        return iter_import(upload.stream, db.session, TextIndex.__table__, TextEntity.__table__, batch_size=IMPORT_BATCH_SIZE)
 
-        db.session.commit()
-        return jsonify({'status': 'success'})
+    if request.accept_mimetypes.best == 'application/x-ndjson':
+        def generate():
+            report = None
+            try:
+                for report in import_reports():
+                    yield json.dumps({'lines': report.lines, 'imported': report.imported,
+                                      'error_count': report.error_count}) + '\n'
+            except Exception as e:
+                # The response has started, so the failure is reported as the last line; batches
+                # committed before it stay imported
+                db.session.rollback()
+                app.logger.exception('import failed', extra={'upload': upload.filename})
+                yield json.dumps({'error': str(e), 'report': report.to_dict() if report else None}) + '\n'
+                return
+            yield json.dumps({'report': report.to_dict()}) + '\n'
+        return app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
 
+    try:
+        for report in import_reports():
+            app.logger.info('import progress', extra={
+                'lines': report.lines, 'imported': report.imported, 'error_count': report.error_count
+            })
     except Exception as e:
         db.session.rollback()
-        print(f"Error in save endpoint: {str(e)}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        app.logger.exception('import failed', extra={'upload': upload.filename})
+        flash(f'Import failed: {escape(str(e))}', 'danger')
+        return redirect(url_for('import_database'))
+
+    summary = report.to_dict()
+    STAGE_SECONDS.observe(report.elapsed - report.write_seconds, 'jsonl_parse')
+    STAGE_SECONDS.observe(report.write_seconds, 'db_write')
+    app.logger.info('import finished', extra={
+        'upload': upload.filename, 'imported': summary['imported'], 'records_per_s': summary['records_per_s']
+    })
+    flash(
+        f"Imported {summary['imported']} new texts with {summary['entities']} entities "
+        f"({summary['skipped_existing']} already existed) from {summary['lines']} lines "
+        f"in {summary['elapsed_s']}s.", 'success'
+    )
+    if report.error_count:
+        items = ''.join(
+            f"<li>Line {e['line']}: {escape(e['error'])}</li>" for e in report.errors[:IMPORT_ERRORS_SHOWN]
+        )
+        more = report.error_count - min(len(report.errors), IMPORT_ERRORS_SHOWN)
+        if more:
+            items += f"<li>... and {more} more</li>"
+        flash(f"{report.error_count} lines were skipped:<ul>{items}</ul>", 'warning')
+    return redirect(url_for('import_database'))
+
+ANNOTATION_FIELDS = ('id', 'text_id', 'category', 'entities', 'matched', 'unmatched', 'undetected_entity')
+
+def annotation_query(user_id, category=None, text_id=None, text='none'):
+    """
+    Select a user's annotations in id order, with the public text_id of their note.
+    Args:
+        user_id: Owner of the annotations
+        category: Only this category, if given
+        text_id: Only this note (TextIndex.text_id), if given
+        text: 'none' leaves the note body out, 'preview' adds its first
+            REVIEW_PREVIEW_LENGTH characters and 'full' the whole body
+    """
+    columns = [
+        MatchResult.id, TextIndex.text_id, MatchResult.category, MatchResult.entities,
+        MatchResult.matched, MatchResult.unmatched, MatchResult.undetected_entity
+    ]
+    if text == 'preview':
+        columns.append(db.func.substr(TextIndex.text, 1, REVIEW_PREVIEW_LENGTH).label('text'))
+    elif text == 'full':
+        columns.append(TextIndex.text.label('text'))
+    query = db.select(*columns).join(TextIndex, TextIndex.id == MatchResult.text_id) \
+        .where(MatchResult.user_id == user_id)
+    if category:
+        query = query.where(MatchResult.category == category)
+    if text_id:
+        query = query.where(TextIndex.text_id == text_id)
+    return query.order_by(MatchResult.id)
+
+def annotation_to_dict(row):
+    annotation = {
+        'id': row.id,
+        'text_id': row.text_id,
+        'category': row.category,
+        'entities': decode_entity_list(row.entities),
+        'matched': decode_entity_list(row.matched),
+        'unmatched': decode_entity_list(row.unmatched),
+        'undetected_entity': decode_entity_list(row.undetected_entity),
+    }
+    if 'text' in row._fields:
+        annotation['text'] = row.text
+    return annotation
+
+def annotation_filters():
+    """Read the category, text_id and text filters shared by /annotations and its export; returns (filters, error)."""
+    text = request.args.get('text', 'none')
+    if text not in ('none', 'preview', 'full'):
+        return None, 'text must be one of none, preview, full'
+    return {
+        'category': request.args.get('category') or None,
+        'text_id': request.args.get('text_id') or None,
+        'text': text
+    }, None
 
 @app.route('/review')
 def review():
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    
-    results = MatchResult.query.options(joinedload(MatchResult.text)).filter_by(user_id=session['user_id']).all()
-    return render_template('review.html', results=results)
+
+    # Only the first page is rendered; the page fetches further ones from /annotations
+    rows = db.session.execute(
+        annotation_query(session['user_id'], text='preview').limit(REVIEW_PAGE_SIZE + 1)
+    ).all()
+    categories = [
+        category for (category,) in db.session.query(MatchResult.category)
+        .filter_by(user_id=session['user_id']).distinct().order_by(MatchResult.category)
+    ]
+    return render_template(
+        'review.html',
+        results=[annotation_to_dict(row) for row in rows[:REVIEW_PAGE_SIZE]],
+        has_more=len(rows) > REVIEW_PAGE_SIZE,
+        categories=categories
+    )
+
+@app.route('/annotations')
+def list_annotations():
+    """
+    Keyset-paginated annotations of the current user, oldest first.
+    Pass the returned next_after as `after` to fetch the next page; filter
+    with `category` and `text_id`, and add note bodies with text=preview|full.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    filters, error = annotation_filters()
+    if error:
+        return jsonify({'error': error}), 400
+    after = max(request.args.get('after', 0, type=int), 0)
+    per_page = min(max(request.args.get('per_page', REVIEW_PAGE_SIZE, type=int), 1), MAX_REVIEW_PAGE_SIZE)
+
+    rows = db.session.execute(
+        annotation_query(session['user_id'], **filters).where(MatchResult.id > after).limit(per_page + 1)
+    ).all()
+    annotations = [annotation_to_dict(row) for row in rows[:per_page]]
+    return jsonify({
+        'annotations': annotations,
+        'per_page': per_page,
+        'has_more': len(rows) > per_page,
+        'next_after': annotations[-1]['id'] if annotations else after
+    })
+
+@app.route('/annotations/export')
+def export_annotations():
+    """
+    Stream the current user's annotations as CSV (format=csv) or JSON lines
+    (format=jsonl, default), with the same filters as /annotations.
+    Rows are read from the cursor EXPORT_BATCH_SIZE at a time (a server-side
+    cursor on PostgreSQL), so memory stays flat however many rows there are.
+    In CSV, entity lists are JSON arrays.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    export_format = request.args.get('format', 'jsonl')
+    if export_format not in ('csv', 'jsonl'):
+        return jsonify({'error': 'format must be csv or jsonl'}), 400
+    filters, error = annotation_filters()
+    if error:
+        return jsonify({'error': error}), 400
+    statement = annotation_query(session['user_id'], **filters).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    fields = ANNOTATION_FIELDS + (('text',) if filters['text'] != 'none' else ())
+
+    def generate():
+        exported = 0
+        if export_format == 'csv':
+            yield ','.join(fields) + '\r\n'
+        for rows in db.session.execute(statement).partitions():
+            annotations = [annotation_to_dict(row) for row in rows]
+            exported += len(annotations)
+            if export_format == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows(
+                    [json.dumps(a[f]) if isinstance(a[f], list) else a[f] for f in fields] for a in annotations
+                )
+                yield buffer.getvalue()
+            else:
+                yield ''.join(json.dumps(a) + '\n' for a in annotations)
+        app.logger.info('exported annotations', extra={'format': export_format, 'rows': exported})
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return app.response_class(
+        stream_with_context(generate()), mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=annotations.{export_format}'}
+    )
+
+@app.route('/analytics')
+def analytics():
+    """
+    Annotation analytics: per-annotator counts, pairwise agreement with
+    Cohen's kappa, matcher precision/recall per category and the most
+    disputed notes. Served from the aggregate tables kept by analytics.py.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    top = min(max(request.args.get('top', ANALYTICS_TOP_DISPUTED, type=int), 0), MAX_ANALYTICS_TOP_DISPUTED)
+    return jsonify(analytics_dashboard(db.session, top))
 
 @app.route('/delete/<int:record_id>', methods=['POST'])
 def delete_record(record_id):
@@ -440,13 +1078,19 @@ def delete_record(record_id):
         if record.user_id != session['user_id']:
             return jsonify({'status': 'error', 'message': 'Not authorized to delete this record'}), 403
 
+        groups = {(record.text_id, record.category)}
+        lock_texts(db.session, [record.text_id])
+        analytics_before = analytics_snapshot(db.session, groups)
         db.session.delete(record)
+        db.session.flush()
+        record_analytics(db.session, groups, analytics_before)
+        queue_calibration(db.session, groups)
         db.session.commit()
-        print(f"Successfully deleted record {record_id}")  # Debug log
+        app.logger.info('deleted annotation', extra={'record_id': record_id})
         return jsonify({'status': 'success', 'message': 'Record deleted successfully'})
     except Exception as e:
         db.session.rollback()
-        print(f"Error deleting record {record_id}: {str(e)}")  # Debug log
+        app.logger.exception('delete failed', extra={'record_id': record_id})
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/change_password', methods=['GET', 'POST'])
@@ -476,7 +1120,7 @@ def change_password():
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        upgrade(db.engine)
         if not User.query.first():
             db.session.add(User(username='admin', password=generate_password_hash('admin')))
             db.session.commit()
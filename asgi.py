@@ -0,0 +1,272 @@
+"""
+ASGI serving mode.
+
+Runs the Flask app under any ASGI server, for example:
+
+    uvicorn asgi:application --host 127.0.0.1 --port 8000
+
+Requests are handled on an asyncio event loop, and the Flask handlers run in
+two separate thread pools:
+- Inference routes (model encoding and fuzzy scoring) run in a small bounded
+  pool. When the pool and its queue are full, new inference requests are
+  answered with 429 and Retry-After straight from the event loop, so
+  overload never builds an unbounded backlog.
+- Every other route (login, review, saving, static pages) runs in its own
+  pool. A slow forward pass cannot hold up these routes, as it can when
+  sync gunicorn threads serve both kinds of request.
+
+When a client disconnects, its queued inference job is dropped before it
+runs. Handlers that are already running can poll
+`request.environ['clinmatch.disconnected']` (a threading.Event) and give up
+early. Response bodies are streamed chunk by chunk with bounded buffering,
+so NDJSON progress and exports stream as they do under gunicorn.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app
+
+# Inference work is CPU-bound: a couple of threads keep the cores busy while
+# the EncodeBatcher coalesces their requests into shared forward passes
+INFERENCE_WORKERS = int(os.getenv('ASGI_INFERENCE_WORKERS', '2'))
+INFERENCE_QUEUE_SIZE = int(os.getenv('ASGI_INFERENCE_QUEUE_SIZE', '16'))  # Waiting requests before 429s
+LIGHT_WORKERS = int(os.getenv('ASGI_LIGHT_WORKERS', '16'))
+INFERENCE_RETRY_AFTER = 1       # Seconds suggested to clients that get a 429
+BODY_SPOOL_SIZE = 1024 * 1024   # Request bodies larger than this are spooled to disk
+
+# Routes that run the model or fuzzy scoring
+INFERENCE_PATH_PREFIXES = ('/get_entities/', '/notes/', '/search_entities')
+
+
+def is_inference_path(path):
+    return path.startswith(INFERENCE_PATH_PREFIXES)
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope; `body` is a file object positioned at 0."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]) if server[1] is not None else '80',
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            if key in environ:
+                # HTTP/2 servers split Cookie into one header per pair; it is joined with '; ', not ','
+                value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+            environ[key] = value
+    return environ
+
+
+async def read_body(receive):
+    """Read the request body into a spooled file; returns None if the client disconnected first."""
+    body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_SIZE)
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            body.close()
+            return None
+        body.write(message.get('body', b''))
+        if not message.get('more_body', False):
+            body.seek(0)
+            return body
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class InferencePool:
+    """
+    Bounded thread pool for inference requests.
+    Args:
+        workers: Requests processed at the same time
+        queue_size: Requests allowed to wait for a free worker; more are rejected
+    """
+
+    def __init__(self, workers, queue_size):
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='inference')
+        self.capacity = workers + queue_size
+        # Only updated on the event loop thread, so no lock is needed
+        self.in_flight = 0
+        self.rejected = 0
+        self.cancelled = 0
+
+    def try_acquire(self):
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'capacity': self.capacity,
+            'rejected': self.rejected,
+            'cancelled': self.cancelled,
+        }
+
+
+class AsgiApp:
+    """
+    ASGI application serving a WSGI app from two thread pools.
+    Args:
+        wsgi_app: The WSGI application (the Flask app)
+        inference_workers: Threads for inference routes
+        inference_queue_size: Inference requests that may wait before 429s are returned
+        light_workers: Threads for every other route
+    """
+
+    def __init__(self, wsgi_app, inference_workers=INFERENCE_WORKERS,
+                 inference_queue_size=INFERENCE_QUEUE_SIZE, light_workers=LIGHT_WORKERS):
+        self.wsgi_app = wsgi_app
+        self.inference = InferencePool(inference_workers, inference_queue_size)
+        self.light_executor = ThreadPoolExecutor(light_workers, thread_name_prefix='light')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise NotImplementedError(f"Unsupported ASGI scope type: {scope['type']}")
+
+        if not is_inference_path(scope['path']):
+            await self.handle(scope, receive, send, self.light_executor)
+            return
+
+        if not self.inference.try_acquire():
+            flask_app.logger.warning('inference queue full; request rejected', extra={
+                'path': scope['path'], 'capacity': self.inference.capacity
+            })
+            await self.send_json(
+                send, 429, '{"error": "Too many matching requests in progress, retry shortly"}',
+                [(b'retry-after', str(INFERENCE_RETRY_AFTER).encode())]
+            )
+            return
+        try:
+            await self.handle(scope, receive, send, self.inference.executor)
+        finally:
+            self.inference.release()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.inference.executor.shutdown(wait=False, cancel_futures=True)
+                self.light_executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def send_json(send, status, body, headers=()):
+        body = body.encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                        *headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def handle(self, scope, receive, send, executor):
+        """Run the WSGI app for one request in `executor`, cancelling it if the client disconnects."""
+        body = await read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_running_loop()
+        disconnected = threading.Event()
+        environ = build_environ(scope, body)
+        environ['clinmatch.disconnected'] = disconnected
+        environ['clinmatch.inference_pool'] = self.inference  # Read by the /asgi/stats route
+
+        future = executor.submit(self.run_wsgi, environ, send, loop, disconnected)
+        job = asyncio.wrap_future(future)
+        watcher = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            await asyncio.wait({job, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not job.done():
+                # The client is gone: drop the job if it is still queued, otherwise
+                # let the handler see the flag, and wait so the pool slot stays accounted
+                disconnected.set()
+                if future.cancel():
+                    if executor is self.inference.executor:
+                        self.inference.cancelled += 1
+                    return
+            await asyncio.shield(job)
+        finally:
+            watcher.cancel()
+            body.close()
+
+    def run_wsgi(self, environ, send, loop, disconnected):
+        """Worker thread: call the WSGI app and stream its response through the event loop."""
+        if disconnected.is_set():
+            return  # Cancelled as it was being picked up
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+        def forward(message):
+            # Blocks until the server has taken the message, which bounds buffering
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def send_start():
+            if not response.get('sent'):
+                forward({'type': 'http.response.start', 'status': response['status'],
+                         'headers': response['headers']})
+                response['sent'] = True
+
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in iterable:
+                if disconnected.is_set():
+                    return
+                if chunk:
+                    send_start()
+                    forward({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not disconnected.is_set():
+                send_start()
+                forward({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except Exception:
+            if not disconnected.is_set():
+                raise
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+
+application = AsgiApp(flask_app)
@@ -0,0 +1,197 @@
+"""
+Load test for the ASGI serving mode (asgi.py).
+
+Drives the ASGI application in-process, without a network server, and
+compares two request-scheduling setups:
+- asgi: inference routes go to the bounded inference pool, which answers
+  429 when it is full, and every other route goes to its own pool.
+- shared-pool: every request shares one thread pool with no queue limit,
+  like the threads of a sync gunicorn worker.
+
+In each setup a few clients keep loading the index and /review pages, first
+alone and then while --heavy-clients saturate /notes/<id>/matches with notes
+the embedding cache has not seen. The report has p50/p95/p99 latency of the
+lightweight routes in both phases, heavy-route throughput, 429s, and how many
+queued heavy requests were dropped after their clients disconnected.
+
+Usage:
+    python benchmarks/bench_asgi.py [--heavy-clients 32] [--light-clients 4] [--duration 10] [--method sentence]
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'requests': 0}
+    pick = lambda q: round(1000 * latencies[min(len(latencies) - 1, int(q * len(latencies)))], 2)
+    return {'requests': len(latencies), 'p50_ms': pick(0.5), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99)}
+
+
+async def call(application, path, cookie, disconnect_after=None):
+    """Send one GET through the ASGI app; returns the status, or None if the client disconnected first."""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'root_path': '', 'query_string': query.encode(), 'server': ('bench', 80),
+        'client': ('127.0.0.1', 0), 'headers': [(b'host', b'bench'), (b'cookie', cookie.encode())],
+    }
+    gone = asyncio.Event()
+    done = asyncio.Event()
+    sent_body = False
+    status = {}
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await gone.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status['code'] = message['status']
+        elif not message.get('more_body', False):
+            done.set()
+
+    async def hang_up():
+        await asyncio.sleep(disconnect_after)
+        if not done.is_set():
+            gone.set()
+
+    if disconnect_after is not None:
+        asyncio.ensure_future(hang_up())
+    try:
+        await application(scope, receive, send)
+    finally:
+        gone.set()  # Let the app's disconnect watcher finish
+    return status.get('code') if done.is_set() else None
+
+
+async def run_phase(application, cookie, light_paths, heavy_paths, args):
+    """Run the light clients, and the heavy ones if heavy_paths is given, for args.duration seconds."""
+    deadline = time.perf_counter() + args.duration
+    light_latencies = []
+    heavy = {'ok': 0, 'rejected': 0, 'errors': 0, 'latencies': []}
+
+    async def light_client(i):
+        rng = random.Random(i)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await call(application, rng.choice(light_paths), cookie)
+            light_latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(args.think_ms / 1000)
+
+    async def heavy_client(i):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            status = await call(application, next(heavy_paths), cookie)
+            if status == 200:
+                heavy['ok'] += 1
+                heavy['latencies'].append(time.perf_counter() - started)
+            elif status == 429:
+                heavy['rejected'] += 1
+                await asyncio.sleep(0.05)  # A client honouring Retry-After would wait longer
+            else:
+                heavy['errors'] += 1
+
+    clients = [light_client(i) for i in range(args.light_clients)]
+    if heavy_paths is not None:
+        clients += [heavy_client(i) for i in range(args.heavy_clients)]
+    await asyncio.gather(*clients)
+    result = {'light': percentiles(light_latencies)}
+    if heavy_paths is not None:
+        result['heavy'] = dict(percentiles(heavy.pop('latencies')), **heavy,
+                               ok_per_s=round(heavy['ok'] / args.duration, 1))
+    return result
+
+
+async def cancellation(application, cookie, heavy_paths, args):
+    """Fire a burst of heavy requests whose clients hang up after 50 ms."""
+    statuses = await asyncio.gather(*[
+        call(application, next(heavy_paths), cookie, disconnect_after=0.05) for _ in range(args.heavy_clients)
+    ])
+    return {'requests': len(statuses), 'answered': sum(s is not None for s in statuses)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the ASGI serving mode.")
+    parser.add_argument('--heavy-clients', type=int, default=32)
+    parser.add_argument('--light-clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per phase")
+    parser.add_argument('--think-ms', type=float, default=20, help="Pause between a light client's requests")
+    parser.add_argument('--method', default='sentence', help="Matching method of the heavy requests")
+    parser.add_argument('--notes', type=int, default=5000, help="Synthetic notes, so heavy requests miss the cache")
+    parser.add_argument('--inference-workers', type=int, default=2)
+    parser.add_argument('--inference-queue', type=int, default=16)
+    parser.add_argument('--threads', type=int, default=8, help="Threads of the shared-pool setup")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.setdefault('DATABASE_URI', f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('MODEL_LOAD_MODE', 'eager')
+
+    import app
+    from asgi import AsgiApp
+    from bench_suite import generate_corpus, isolate_embedding_cache
+    from importer import stream_import
+    from migrations import upgrade
+
+    corpus = os.path.join(tmp, 'corpus.jsonl')
+    generate_corpus(corpus, os.path.join(tmp, 'gold.jsonl'), args.notes, 13,
+                    os.path.join(ROOT, 'database.jsonl'), 0.15)
+    with app.app.app_context():
+        with contextlib.redirect_stdout(sys.stderr):  # Keep stdout for the JSON report
+            upgrade(app.db.engine)
+        with open(corpus, 'r', encoding='utf-8') as f:
+            stream_import(f, app.db.session, app.TextIndex.__table__, app.TextEntity.__table__)
+        user = app.User(username='bench', password='x')
+        app.db.session.add(user)
+        app.db.session.commit()
+        cookie = f"session={app.app.session_interface.get_signing_serializer(app.app).dumps({'user_id': user.id})}"
+
+    light_paths = ['/', '/review', '/login', '/healthz']
+
+    shared = AsgiApp(app.app, inference_workers=args.threads, inference_queue_size=10 ** 9)
+    shared.light_executor = shared.inference.executor
+    setups = {
+        'asgi': AsgiApp(app.app, inference_workers=args.inference_workers,
+                        inference_queue_size=args.inference_queue, light_workers=args.threads),
+        'shared-pool': shared,
+    }
+    report = {'args': vars(args), 'setups': {}}
+    for name, application in setups.items():
+        # Every setup starts from a cold cache and walks the same notes
+        isolate_embedding_cache(app, os.path.join(tmp, name))
+        heavy_paths = itertools.cycle(f'/notes/synthetic-{i}/matches?method={args.method}' for i in range(args.notes))
+        idle = asyncio.run(run_phase(application, cookie, light_paths, None, args))
+        saturated = asyncio.run(run_phase(application, cookie, light_paths, heavy_paths, args))
+        report['setups'][name] = {'idle': idle, 'saturated': saturated}
+        if name == 'asgi':
+            before = dict(application.inference.stats())
+            report['setups'][name]['cancellation'] = dict(
+                asyncio.run(cancellation(application, cookie, heavy_paths, args)),
+                dropped_before_running=application.inference.cancelled - before['cancelled']
+            )
+        print(f"{name}: light p95 idle {idle['light'].get('p95_ms')} ms, "
+              f"saturated {saturated['light'].get('p95_ms')} ms", file=sys.stderr)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
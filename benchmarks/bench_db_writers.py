@@ -0,0 +1,125 @@
+"""
+Concurrent writers against the annotation database.
+
+Starts --workers processes (like gunicorn workers), each saving and deleting
+annotations through /save and /delete as its own user, and reports
+throughput, latency percentiles and failed requests ('database is locked')
+per SQLite configuration. With --database-uri the same load runs against any
+other backend, e.g. PostgreSQL.
+
+Usage:
+    python benchmarks/bench_db_writers.py [--workers 8] [--ops 200] [--database-uri postgresql://...]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SQLITE_CONFIGS = {
+    # The previous engine: rollback journal, synchronous=FULL and pysqlite's default 5 s timeout
+    'rollback-journal': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_BUSY_TIMEOUT_MS': '5000'},
+    'wal': {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL', 'SQLITE_BUSY_TIMEOUT_MS': '5000'},
+}
+
+SETUP = r'''
+import sys
+import app
+from migrations import upgrade
+with app.app.app_context():
+    upgrade(app.db.engine)
+    app.db.session.execute(app.db.insert(app.User), [
+        {'username': f'bench{i}', 'password': 'x'} for i in range(int(sys.argv[1]))
+    ])
+    app.db.session.execute(app.db.insert(app.TextIndex), [
+        {'text_id': f'bench-{i}', 'text': f'Patient {i} has fever and cough.'} for i in range(int(sys.argv[2]))
+    ])
+    app.db.session.commit()
+'''
+
+WORKER = r'''
+import io, contextlib, json, sys, time
+import app
+worker, ops, texts = int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3])
+client = app.app.test_client()
+with app.app.app_context():
+    user_id = app.User.query.filter_by(username=f'bench{worker}').first().id
+with client.session_transaction() as s:
+    s['user_id'] = user_id
+latencies, failures = [], 0
+with contextlib.redirect_stdout(io.StringIO()):
+    for i in range(ops):
+        text_id = f'bench-{(worker * 7919 + i) % texts}'
+        started = time.perf_counter()
+        response = client.post('/save', json={
+            'text_id': text_id, 'text': '',
+            'entities': {f'category_{c}': ['fever', 'cough'] for c in range(3)},
+            'matched': {'category_0': ['fever']}
+        })
+        if response.status_code != 200:
+            failures += 1
+        elif i % 4 == 3:
+            # Delete one of the rows just written
+            with app.app.app_context():
+                row = app.MatchResult.query.filter_by(user_id=user_id).first()
+            if row and client.post(f'/delete/{row.id}').status_code != 200:
+                failures += 1
+        latencies.append(time.perf_counter() - started)
+print(json.dumps({'latencies': latencies, 'failures': failures}))
+'''
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(env, args):
+    subprocess.run([sys.executable, '-c', SETUP, str(args.workers), str(args.texts)],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+    processes = [
+        subprocess.Popen([sys.executable, '-c', WORKER, str(w), str(args.ops), str(args.texts)],
+                         cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        for w in range(args.workers)
+    ]
+    results = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in processes]
+    latencies = [l for r in results for l in r['latencies']]
+    # Workers start together, so the slowest worker's total time is the wall time of the run
+    wall = max(sum(r['latencies']) for r in results)
+    return {
+        'requests': len(latencies),
+        'failures': sum(r['failures'] for r in results),
+        'requests_per_s': round(len(latencies) / wall, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent /save and /delete writers.")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=200, help="Saves per worker")
+    parser.add_argument('--texts', type=int, default=500)
+    parser.add_argument('--database-uri', default=None, help="Benchmark this (empty) database instead of SQLite")
+    args = parser.parse_args()
+
+    report = {}
+    base_env = dict(os.environ, MODEL_LOAD_MODE='lazy')
+    if args.database_uri:
+        report[args.database_uri.split(':')[0]] = run(dict(base_env, DATABASE_URI=args.database_uri), args)
+    else:
+        for name, settings in SQLITE_CONFIGS.items():
+            with tempfile.TemporaryDirectory() as tmp:
+                env = dict(base_env, DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'bench.db')}", **settings)
+                report[name] = run(env, args)
+            print(f"{name}: {report[name]}")
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
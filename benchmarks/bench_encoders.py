@@ -0,0 +1,130 @@
+"""
+Accuracy and speed of the encoder backends in encoders.py.
+
+Each backend runs in its own process (so peak RSS is attributable) and scores
+every (text, entity) pair of the corpus the way get_semantic_matches does.
+Scores are compared with the fp32 torch backend; the run fails if any score
+drifts by more than --tolerance.
+
+Usage:
+    python benchmarks/bench_encoders.py [--model NAME] [--backends torch,torch-int8,onnx] [--tolerance 0.02]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def load_pairs(file_path):
+    texts, entity_lists = [], []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            for key, value in record.items():
+                if key not in ["text", "text_id"] and value:
+                    texts.append(record["text"])
+                    entity_lists.append(value)
+    return texts, entity_lists
+
+
+def run_backend(args):
+    """Worker process: load one backend, time it and print scores as JSON."""
+    from encoders import load_encoder
+    from span_matching import cosine_similarity_matrix
+
+    texts, entity_lists = load_pairs(args.input)
+    started = time.perf_counter()
+    encoder = load_encoder(args.model, backend=args.worker, onnx_dir=args.onnx_dir, intra_op_threads=args.threads)
+    load_s = time.perf_counter() - started
+    encoder.encode(entity_lists[0])  # Warm-up
+
+    # Request-shaped latency: one note plus one category's entities, as in /get_entities
+    latencies = []
+    scores = []
+    for _ in range(args.repeat):
+        scores = []
+        for text, entities in zip(texts, entity_lists):
+            t = time.perf_counter()
+            text_embedding = encoder.encode([text])
+            entity_embeddings = encoder.encode(entities)
+            latencies.append(time.perf_counter() - t)
+            scores.extend(cosine_similarity_matrix(text_embedding, entity_embeddings)[0].tolist())
+    latencies.sort()
+
+    # Bulk throughput, as in prematch.py
+    corpus = sorted({s for text, entities in zip(texts, entity_lists) for s in [text] + entities})
+    t = time.perf_counter()
+    encoder.encode(corpus, batch_size=32)
+    bulk_s = time.perf_counter() - t
+
+    print(json.dumps({
+        'load_s': round(load_s, 2),
+        'request_p50_ms': round(1000 * latencies[len(latencies) // 2], 1),
+        'request_p95_ms': round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 1),
+        'bulk_strings_per_s': round(len(corpus) / bulk_s, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'scores': scores,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare encoder backends for accuracy and speed.")
+    parser.add_argument('--model', default='pritamdeka/S-PubMedBert-MS-MARCO')
+    parser.add_argument('--input', default=os.path.join(ROOT, 'database.jsonl'))
+    parser.add_argument('--backends', default='torch,torch-int8,onnx')
+    parser.add_argument('--threads', type=int, default=None, help="ONNX Runtime intra-op threads")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=0.02, help="Max allowed |cosine - fp32 cosine|")
+    parser.add_argument('--threshold', type=float, default=0.8, help="Match threshold for decision agreement")
+    parser.add_argument('--onnx-dir', default=None, help="Where ONNX exports are kept (default: a temp dir)")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_backend(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        onnx_dir = args.onnx_dir or tmp
+        results = {}
+        backends = args.backends.split(',')
+        if 'torch' not in backends:
+            backends.insert(0, 'torch')  # Reference scores
+        for backend in backends:
+            command = [
+                sys.executable, os.path.abspath(__file__), '--worker', backend, '--model', args.model,
+                '--input', args.input, '--repeat', str(args.repeat), '--onnx-dir', onnx_dir
+            ]
+            if args.threads:
+                command += ['--threads', str(args.threads)]
+            out = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            results[backend] = json.loads(out.strip().splitlines()[-1])
+
+    reference = np.array(results['torch']['scores'])
+    report = {'model': args.model, 'pairs': len(reference), 'tolerance': args.tolerance, 'backends': {}}
+    failed = False
+    for backend, result in results.items():
+        scores = np.array(result.pop('scores'))
+        drift = float(np.abs(scores - reference).max())
+        agreement = float(np.mean((scores >= args.threshold) == (reference >= args.threshold)))
+        result.update({'max_abs_cosine_diff': round(drift, 5), 'threshold_agreement': round(agreement, 4)})
+        result['within_tolerance'] = drift <= args.tolerance
+        failed = failed or not result['within_tolerance']
+        report['backends'][backend] = result
+
+    print(json.dumps(report, indent=2))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Compare the cached multi-pattern ExactMatcher with the previous one-regex-per-entity
+exact lookup, per category list and for a whole-corpus vocabulary.
+
+The previous lookup compiled a pattern per entity per request; Python's re
+cache (512 patterns) hides that for small vocabularies, so it is timed both
+with a warm and a cold cache. Parity is checked against an overlapping
+per-entity search, since the matcher returns every occurrence rather than the
+first one.
+
+Usage:
+    python benchmarks/bench_exact.py [--input database.jsonl] [--repeat 200] [--vocabulary 20000]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exact_matching import ExactMatcher, find_exact_matches  # noqa: E402
+
+
+def legacy_exact_matches(text, entities):
+    """First word-boundary occurrence of each entity, one compiled pattern per entity."""
+    matches = []
+    for entity in entities:
+        match = re.compile(r'\b' + re.escape(entity) + r'\b', re.IGNORECASE).search(text)
+        if match:
+            matches.append((entity, match.start(), match.end()))
+    return matches
+
+
+def all_occurrences(text, entities):
+    """Every (possibly overlapping) occurrence, one entity at a time: the parity reference."""
+    found = set()
+    for entity in dict.fromkeys(entities):
+        if entity.strip():
+            for m in re.finditer(r'\b(?=(' + re.escape(entity) + r')\b)', text, re.IGNORECASE):
+                found.add((entity, m.start(), m.end(1)))
+    return found
+
+
+def load_cases(file_path):
+    cases = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            cases.extend(
+                (record["text"], value) for key, value in record.items()
+                if key not in ["text", "text_id"] and value
+            )
+    return cases
+
+
+def time_calls(call, cases, repeat, purge=False):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text, entities in cases:
+            if purge:
+                re.purge()
+            call(text, entities)
+    elapsed = time.perf_counter() - started
+    return round(1e6 * elapsed / (repeat * len(cases)), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the multi-pattern exact matcher.")
+    parser.add_argument('--input', default='database.jsonl')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--vocabulary', type=int, default=20000, help="Synthetic entities added to the corpus vocabulary")
+    args = parser.parse_args()
+
+    cases = load_cases(args.input)
+    mismatches = sum(
+        set(ExactMatcher(entities).finditer(text)) != all_occurrences(text, entities) for text, entities in cases
+    )
+    per_category = {
+        'legacy_warm_re_cache_us': time_calls(legacy_exact_matches, cases, args.repeat),
+        'legacy_cold_re_cache_us': time_calls(legacy_exact_matches, cases, max(1, args.repeat // 10), purge=True),
+        'matcher_us': time_calls(find_exact_matches, cases, args.repeat),
+    }
+
+    # One matcher for the whole corpus vocabulary, scanned over every note
+    vocabulary = list(dict.fromkeys(
+        [e for _, entities in cases for e in entities] + [f"term {i} finding {i % 97}" for i in range(args.vocabulary)]
+    ))
+    texts = list(dict.fromkeys(text for text, _ in cases))
+    started = time.perf_counter()
+    matcher = ExactMatcher(vocabulary)
+    build_s = time.perf_counter() - started
+    started = time.perf_counter()
+    occurrences = sum(len(list(matcher.finditer(text))) for text in texts)
+    matcher_s = time.perf_counter() - started
+    started = time.perf_counter()
+    for text in texts:
+        legacy_exact_matches(text, vocabulary)
+    legacy_s = time.perf_counter() - started
+
+    print(json.dumps({
+        'cases': len(cases),
+        'parity_mismatches': mismatches,
+        'per_category': per_category,
+        'corpus_vocabulary': {
+            'entities': len(vocabulary),
+            'texts': len(texts),
+            'occurrences': occurrences,
+            'build_s': round(build_s, 3),
+            'matcher_s': round(matcher_s, 4),
+            'legacy_s': round(legacy_s, 3),
+            'speedup': round(legacy_s / matcher_s, 1) if matcher_s else None,
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Compare the batched rapidfuzz engine in fuzzy_matching.py with the previous
+per-entity double loop of get_semantic_matches on the sample corpus.
+
+Usage:
+    python benchmarks/bench_fuzzy.py [--input database.jsonl] [--repeat 20] [--threshold 80] [--typos]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzy_matching import find_fuzzy_matches  # noqa: E402
+
+try:
+    from fuzzywuzzy import fuzz as legacy_fuzz
+except ImportError:  # fuzzywuzzy is no longer a dependency; rapidfuzz's ratio is a faster stand-in
+    from rapidfuzz import fuzz as legacy_fuzz
+
+
+def legacy_fuzzy_matches(text, entities, threshold):
+    """The fuzzy branch of get_semantic_matches before the batched engine, minus its prints."""
+    matches = []
+    for entity in entities:
+        pattern = re.compile(r'\b' + re.escape(entity) + r'\b', re.IGNORECASE)
+        match = pattern.search(text)
+        if match:
+            matches.append({
+                'entity': entity,
+                'start': match.start(),
+                'end': match.end(),
+                'matched_text': text[match.start():match.end()],
+                'similarity': 1.0
+            })
+        else:
+            words = text.split()
+            for i in range(len(words)):
+                for j in range(i + 1, min(i + 4, len(words) + 1)):
+                    phrase = ' '.join(words[i:j])
+                    ratio = round(legacy_fuzz.ratio(entity.lower(), phrase.lower()))
+                    if ratio >= threshold:
+                        start = text.find(phrase)
+                        matches.append({
+                            'entity': entity,
+                            'start': start,
+                            'end': start + len(phrase),
+                            'matched_text': phrase,
+                            'similarity': ratio / 100.0
+                        })
+    return matches
+
+
+def add_typo(entity):
+    """Drop the middle character so the entity no longer matches exactly."""
+    middle = len(entity) // 2
+    return entity[:middle] + entity[middle + 1:]
+
+
+def load_cases(file_path, typos=False):
+    cases = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            for key, value in record.items():
+                if key not in ["text", "text_id"] and value:
+                    cases.append((record["text"], [add_typo(e) for e in value] if typos else value))
+    return cases
+
+
+def time_engine(engine, cases, threshold, repeat):
+    latencies = []
+    results = []
+    for _ in range(repeat):
+        results = []
+        for text, entities in cases:
+            started = time.perf_counter()
+            results.append(engine(text, entities, threshold))
+            latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    total = sum(latencies)
+    return results, {
+        'calls': len(latencies),
+        'total_s': round(total, 4),
+        'mean_ms': round(1000 * total / len(latencies), 3),
+        'p95_ms': round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 3),
+        'calls_per_s': round(len(latencies) / total, 1) if total else None,
+    }
+
+
+def compare(legacy_results, new_results):
+    """Count entities found by each engine and how many legacy offsets pointed at the wrong occurrence."""
+    legacy_entities = new_entities = wrong_offsets = 0
+    for legacy, new in zip(legacy_results, new_results):
+        legacy_entities += len({m['entity'] for m in legacy})
+        new_entities += len({m['entity'] for m in new})
+        new_spans = {(m['entity'], m['start'], m['end']) for m in new}
+        wrong_offsets += sum(1 for m in legacy if (m['entity'], m['start'], m['end']) not in new_spans)
+    return {
+        'legacy_entities_found': legacy_entities,
+        'new_entities_found': new_entities,
+        'legacy_matches_not_in_new': wrong_offsets,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fuzzy matching engines.")
+    parser.add_argument('--input', default='database.jsonl')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--threshold', type=int, default=80)
+    parser.add_argument('--typos', action='store_true', help="Misspell every entity to exercise the fuzzy path")
+    args = parser.parse_args()
+
+    cases = load_cases(args.input, typos=args.typos)
+    legacy_results, legacy_stats = time_engine(legacy_fuzzy_matches, cases, args.threshold, args.repeat)
+    new_results, new_stats = time_engine(find_fuzzy_matches, cases, args.threshold, args.repeat)
+
+    report = {
+        'cases': len(cases),
+        'legacy_scorer': legacy_fuzz.__name__,
+        'legacy': legacy_stats,
+        'batched': new_stats,
+        'speedup': round(legacy_stats['total_s'] / new_stats['total_s'], 2) if new_stats['total_s'] else None,
+        'parity': compare(legacy_results, new_results),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
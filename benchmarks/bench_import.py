@@ -0,0 +1,80 @@
+"""
+Throughput and memory of the streaming JSONL import.
+
+Generates synthetic corpora by cycling the records of database.jsonl under
+fresh text_ids (with a small share of invalid lines), imports each one into
+an empty temporary SQLite database in a fresh interpreter and reports
+records/sec and peak RSS. Peak RSS should stay flat as the file grows.
+
+Usage:
+    python benchmarks/bench_import.py [--sizes 100000,1000000] [--batch-size 1000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, resource, sys
+import app
+from importer import stream_import
+with app.app.app_context():
+    app.db.create_all()
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        report = stream_import(
+            f, app.db.session, app.TextIndex.__table__, app.TextEntity.__table__,
+            batch_size=int(sys.argv[2])
+        )
+    summary = report.to_dict()
+    summary.pop('errors')
+    summary['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print(json.dumps(summary))
+'''
+
+
+def generate_corpus(path, lines, invalid_every=1000):
+    with open(os.path.join(ROOT, 'database.jsonl'), 'r', encoding='utf-8') as f:
+        templates = [json.loads(line) for line in f if line.strip()]
+    with open(path, 'w', encoding='utf-8') as out:
+        for i in range(lines):
+            if invalid_every and i % invalid_every == invalid_every - 1:
+                out.write('{"text_id": "broken", "text": \n')
+                continue
+            record = dict(templates[i % len(templates)])
+            record['text_id'] = f"bench-{i}"
+            out.write(json.dumps(record) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming JSONL import.")
+    parser.add_argument('--sizes', default='100000,1000000', help="Comma-separated line counts")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(s) for s in args.sizes.split(',')):
+            corpus = os.path.join(tmp, f'corpus-{size}.jsonl')
+            generate_corpus(corpus, size)
+            db_path = os.path.join(tmp, f'import-{size}.db')
+            env = dict(os.environ, MODEL_LOAD_MODE='lazy', DATABASE_URI=f'sqlite:///{db_path}')
+            out = subprocess.run(
+                [sys.executable, '-c', PROBE, corpus, str(args.batch_size)], cwd=ROOT, env=env,
+                capture_output=True, text=True, check=True
+            )
+            report[size] = json.loads(out.stdout.strip().splitlines()[-1])
+            report[size]['file_mb'] = round(os.path.getsize(corpus) / 2 ** 20, 1)
+            print(f"{size} lines: {report[size]['records_per_s']} records/sec, "
+                  f"peak RSS {report[size]['peak_rss_mb']} MB")
+            os.remove(corpus)
+            os.remove(db_path)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
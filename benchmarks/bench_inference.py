@@ -0,0 +1,98 @@
+"""
+Throughput and tail latency of direct model.encode calls versus the
+micro-batching EncodeBatcher under simulated concurrent annotators.
+
+Every simulated request encodes one category's entity list from the corpus,
+which is what /get_entities does on a cache miss.
+
+Usage:
+    python benchmarks/bench_inference.py [--model pritamdeka/S-PubMedBert-MS-MARCO] [--clients 8] [--requests 25]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference import EncodeBatcher  # noqa: E402
+
+
+def load_entity_lists(file_path):
+    lists = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            lists.extend(v for k, v in record.items() if k not in ["text", "text_id"] and v)
+    return lists
+
+
+def run_load(encode, entity_lists, clients, requests_per_client):
+    """Fire requests from `clients` threads at once; returns (wall seconds, per-request latencies)."""
+    latencies = []
+    latencies_lock = threading.Lock()
+    barrier = threading.Barrier(clients)
+
+    def client(client_id):
+        barrier.wait()
+        for i in range(requests_per_client):
+            entities = entity_lists[(client_id * requests_per_client + i) % len(entity_lists)]
+            started = time.perf_counter()
+            encode(entities)
+            elapsed = time.perf_counter() - started
+            with latencies_lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - started, sorted(latencies)
+
+
+def summarize(wall, latencies):
+    return {
+        'requests': len(latencies),
+        'requests_per_s': round(len(latencies) / wall, 1),
+        'p50_ms': round(1000 * latencies[len(latencies) // 2], 1),
+        'p95_ms': round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark direct vs micro-batched encoding.")
+    parser.add_argument('--model', default='pritamdeka/S-PubMedBert-MS-MARCO')
+    parser.add_argument('--input', default='database.jsonl')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=25, help="Requests per client")
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(args.model)
+    entity_lists = load_entity_lists(args.input)
+    model.encode(entity_lists[0])  # Warm-up
+
+    direct = run_load(lambda e: model.encode(e, convert_to_numpy=True), entity_lists, args.clients, args.requests)
+    batcher = EncodeBatcher(model, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    batched = run_load(batcher.encode, entity_lists, args.clients, args.requests)
+
+    print(json.dumps({
+        'model': args.model,
+        'clients': args.clients,
+        'cpu_count': os.cpu_count(),
+        'direct': summarize(*direct),
+        'batched': dict(summarize(*batched), **{
+            'forward_passes': batcher.batches,
+            'mean_batch_size': round(batcher.stats()['mean_batch_size'], 1),
+        }),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Review pagination and annotation export at scale.
+
+Seeds --annotations rows for one user (with notes of --text-chars characters)
+into a temporary SQLite database, then measures, each in a fresh interpreter
+so peak RSS is attributable:
+- legacy: the previous /review query, which loads every annotation with its note body
+- page_first / page_deep: /annotations at the start and near the end (keyset)
+- export_csv / export_jsonl: the full streaming export through the test client
+
+Usage:
+    python benchmarks/bench_review.py [--annotations 1000000] [--text-chars 2000] [--skip-legacy]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETUP = r'''
+import json, sys
+import app
+from migrations import upgrade
+annotations, text_chars = int(sys.argv[1]), int(sys.argv[2])
+categories = ['problems_diagnoses', 'medications', 'findings', 'medical_procedures']
+with app.app.app_context():
+    upgrade(app.db.engine)
+    app.db.session.add(app.User(username='bench', password='x'))
+    notes = (annotations + len(categories) - 1) // len(categories)
+    body = ('Patient with fever and cough treated with aspirin. ' * (text_chars // 50 + 1))[:text_chars]
+    for start in range(0, notes, 10000):
+        app.db.session.execute(app.db.insert(app.TextIndex), [
+            {'text_id': f'note-{i}', 'text': body} for i in range(start, min(start + 10000, notes))
+        ])
+    user_id = app.User.query.filter_by(username='bench').first().id
+    entities = json.dumps(['fever', 'cough', 'aspirin'])
+    for start in range(0, annotations, 10000):
+        app.db.session.execute(app.db.insert(app.MatchResult), [
+            {'text_id': i // len(categories) + 1, 'category': categories[i % len(categories)], 'user_id': user_id,
+             'entities': entities, 'matched': json.dumps(['fever']), 'unmatched': json.dumps(['cough']),
+             'undetected_entity': '[]'}
+            for i in range(start, min(start + 10000, annotations))
+        ])
+    app.db.session.commit()
+'''
+
+PROBE = r'''
+import json, resource, sys, time
+import app
+stage = sys.argv[1]
+client = app.app.test_client()
+with app.app.app_context():
+    user_id = app.User.query.filter_by(username='bench').first().id
+    last_id = app.db.session.query(app.db.func.max(app.MatchResult.id)).scalar()
+with client.session_transaction() as s:
+    s['user_id'] = user_id
+
+started = time.perf_counter()
+result = {}
+if stage == 'legacy':
+    from sqlalchemy.orm import joinedload
+    with app.app.app_context():
+        rows = app.MatchResult.query.options(joinedload(app.MatchResult.text)).filter_by(user_id=user_id).all()
+        result['rows'] = len(rows)
+elif stage.startswith('page'):
+    after = 0 if stage == 'page_first' else last_id - 200
+    timings = []
+    for _ in range(20):
+        t = time.perf_counter()
+        data = client.get(f'/annotations?after={after}&text=preview').get_json()
+        timings.append(time.perf_counter() - t)
+    timings.sort()
+    result['rows'] = len(data['annotations'])
+    result['p50_ms'] = round(1000 * timings[len(timings) // 2], 2)
+else:
+    export_format = stage.split('_')[1]
+    response = client.get(f'/annotations/export?format={export_format}', buffered=False)
+    size = lines = 0
+    for chunk in response.response:
+        size += len(chunk)
+        lines += chunk.count(b'\n')
+    response.close()
+    result['rows'] = lines - (export_format == 'csv')
+    result['mb'] = round(size / 2 ** 20, 1)
+elapsed = time.perf_counter() - started
+result['seconds'] = round(elapsed, 2)
+if stage.startswith(('legacy', 'export')):
+    result['rows_per_s'] = round(result['rows'] / elapsed, 1)
+result['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+print(json.dumps(result))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark review pagination and streaming export.")
+    parser.add_argument('--annotations', type=int, default=1000000)
+    parser.add_argument('--text-chars', type=int, default=2000, help="Length of every note body")
+    parser.add_argument('--skip-legacy', action='store_true', help="Skip loading every row (needs a lot of memory)")
+    args = parser.parse_args()
+
+    report = {'annotations': args.annotations, 'text_chars': args.text_chars}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'review.db')}",
+                   MODEL_LOAD_MODE='lazy', LOG_LEVEL='WARNING')
+        subprocess.run([sys.executable, '-c', SETUP, str(args.annotations), str(args.text_chars)],
+                       cwd=ROOT, env=env, check=True, capture_output=True)
+        stages = ['page_first', 'page_deep', 'export_csv', 'export_jsonl']
+        if not args.skip_legacy:
+            stages.insert(0, 'legacy')
+        for stage in stages:
+            out = subprocess.run([sys.executable, '-c', PROBE, stage], cwd=ROOT, env=env,
+                                 check=True, capture_output=True, text=True)
+            report[stage] = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{stage}: {report[stage]}", file=sys.stderr)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
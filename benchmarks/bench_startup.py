@@ -0,0 +1,70 @@
+"""
+Startup cost of the app per MODEL_LOAD_MODE.
+
+For each mode a fresh interpreter imports app.py and reports how long until
+the import returns, until /login is served, until /get_entities can serve a
+fuzzy match, and until the model is ready. 'eager' behaves like the old
+import-time SentenceTransformer(...) call.
+
+Usage:
+    python benchmarks/bench_startup.py [--modes eager,background,lazy] [--model NAME]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/login')
+first_response = time.perf_counter()
+with app.app.app_context():
+    app.db.create_all()
+client.get('/get_entities/1/medications?method=fuzzy')
+first_fuzzy = time.perf_counter()
+app.model.get()
+ready = time.perf_counter()
+print(json.dumps({
+    'import_s': round(imported - started, 3),
+    'first_login_response_s': round(first_response - started, 3),
+    'first_fuzzy_match_s': round(first_fuzzy - started, 3),
+    'model_ready_s': round(ready - started, 3),
+}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app startup per model load mode.")
+    parser.add_argument('--modes', default='eager,background,lazy')
+    parser.add_argument('--model', default=None, help="Override MODEL_NAME")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    report = {}
+    for mode in args.modes.split(','):
+        # In-memory database so the probe never touches instance/entities.db
+        env = dict(os.environ, MODEL_LOAD_MODE=mode, DATABASE_URI='sqlite://')
+        if args.model:
+            env['MODEL_NAME'] = args.model
+        runs = []
+        for _ in range(args.repeat):
+            out = subprocess.run(
+                [sys.executable, '-c', PROBE], cwd=ROOT, env=env,
+                capture_output=True, text=True, check=True
+            ).stdout
+            runs.append(json.loads(out.strip().splitlines()[-1]))
+        # Median run per metric
+        report[mode] = {key: sorted(r[key] for r in runs)[len(runs) // 2] for key in runs[0]}
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+"""
+Reproducible speed and quality benchmark suite.
+
+For every corpus size this script:
+- generates a synthetic clinical corpus by recombining the sentences of
+  database.jsonl. Note lengths and entity counts vary, some entities are
+  misspelled in the text, and every category list is padded with distractor
+  entities that do not occur in the note. The entities that do occur are the
+  gold lists.
+- imports the corpus into an empty SQLite database.
+- times get_semantic_matches for each --methods entry on a sample of notes.
+  It reports precision, recall and F1 against the gold lists next to
+  throughput and latency.
+- times the index, /get_entities and /save routes through the Flask test
+  client against the imported database.
+
+Each stage runs in a fresh interpreter, so its peak RSS is its own, and uses a
+cold embedding cache in a temporary directory. The corpus depends only on
+--seed and the size. The JSON report (--output) records the commit, so runs
+of different commits can be compared with --baseline.
+
+Usage:
+    python benchmarks/bench_suite.py [--sizes 1000,10000,100000,1000000] [--sample 200]
+        [--methods sentence,fuzzy] [--output report.json] [--baseline previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Metrics where a larger value is better; every other compared metric is a cost
+HIGHER_IS_BETTER = ('per_s', 'precision', 'recall', 'f1')
+# Workload sizes and settings, not results
+WORKLOAD_KEYS = {'calls', 'notes', 'lines', 'imported', 'entities', 'threshold'}
+
+
+def load_sentence_pool(file_path):
+    """
+    Split the seed corpus into sentences and note which entities occur in each.
+    Returns:
+        List of (sentence, {category: [entities]}) and {category: [every entity]}
+    """
+    pool = []
+    vocabulary = {}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            categories = {k: v for k, v in record.items() if k not in ["text", "text_id"] and isinstance(v, list)}
+            for category, entities in categories.items():
+                vocabulary.setdefault(category, [])
+                vocabulary[category].extend(e for e in entities if e not in vocabulary[category])
+            for sentence in re.split(r'(?<=\.)\s+', record["text"].strip()):
+                present = {
+                    category: [e for e in entities if re.search(r'\b' + re.escape(e) + r'\b', sentence, re.IGNORECASE)]
+                    for category, entities in categories.items()
+                }
+                pool.append((sentence, {c: e for c, e in present.items() if e}))
+    return pool, vocabulary
+
+
+def add_typo(entity, rng):
+    """Drop one inner character so the entity no longer matches exactly."""
+    position = rng.randrange(1, len(entity) - 1)
+    return entity[:position] + entity[position + 1:]
+
+
+def generate_note(rng, pool, vocabulary, typo_rate):
+    """Return one synthetic record and its gold entity lists."""
+    # Log-normal sentence count: mostly short notes with a long tail of long ones
+    sentences = rng.choices(pool, k=max(1, min(60, int(rng.lognormvariate(2.0, 0.7)))))
+    parts = []
+    gold = {category: [] for category in vocabulary}
+    for sentence, present in sentences:
+        for category, entities in present.items():
+            for entity in entities:
+                if len(entity) >= 6 and rng.random() < typo_rate:
+                    sentence = re.sub(r'\b' + re.escape(entity) + r'\b', add_typo(entity, rng), sentence,
+                                      count=1, flags=re.IGNORECASE)
+                if entity not in gold[category]:
+                    gold[category].append(entity)
+        parts.append(sentence)
+    text = ' '.join(parts)
+
+    record = {"text": text}
+    lowered = text.lower()
+    for category, entities in vocabulary.items():
+        # Distractors come from the same category's vocabulary, so they look plausible
+        absent = [e for e in entities if e not in gold[category] and e.lower() not in lowered]
+        distractors = rng.sample(absent, min(len(absent), rng.randint(0, len(gold[category]) + 2)))
+        candidates = gold[category] + distractors
+        rng.shuffle(candidates)
+        record[category] = candidates
+    return record, gold
+
+
+def generate_corpus(path, gold_path, notes, seed, seed_corpus, typo_rate):
+    """Write `notes` records to `path` and their gold lists to `gold_path`, one JSON object per line."""
+    pool, vocabulary = load_sentence_pool(seed_corpus)
+    rng = random.Random(f"{seed}-{notes}")
+    characters = entities = 0
+    with open(path, 'w', encoding='utf-8') as out, open(gold_path, 'w', encoding='utf-8') as gold_out:
+        for i in range(notes):
+            record, gold = generate_note(rng, pool, vocabulary, typo_rate)
+            text_id = f"synthetic-{i}"
+            out.write(json.dumps(dict(record, text_id=text_id)) + '\n')
+            gold_out.write(json.dumps(dict(gold, text_id=text_id)) + '\n')
+            characters += len(record["text"])
+            entities += sum(len(v) for k, v in record.items() if k != "text")
+    return {
+        'notes': notes,
+        'file_mb': round(os.path.getsize(path) / 2 ** 20, 1),
+        'mean_note_chars': round(characters / notes, 1),
+        'mean_candidates_per_note': round(entities / notes, 2),
+    }
+
+
+def load_sample(corpus_path, gold_path, sample):
+    """Every (notes // sample)-th record with its gold lists, read without loading the whole corpus."""
+    with open(corpus_path, 'r', encoding='utf-8') as f:
+        notes = sum(1 for _ in f)
+    step = max(1, notes // sample)
+    records = []
+    with open(corpus_path, 'r', encoding='utf-8') as f, open(gold_path, 'r', encoding='utf-8') as g:
+        for i, (line, gold_line) in enumerate(zip(f, g)):
+            if i % step == 0 and len(records) < sample:
+                records.append((json.loads(line), json.loads(gold_line)))
+    return records
+
+
+def record_categories(record):
+    return {k: v for k, v in record.items() if k not in ["text", "text_id"] and isinstance(v, list)}
+
+
+def summarize(latencies, wall):
+    latencies = sorted(latencies)
+    return {
+        'calls': len(latencies),
+        'calls_per_s': round(len(latencies) / wall, 1) if wall else None,
+        'p50_ms': round(1000 * latencies[len(latencies) // 2], 3),
+        'p95_ms': round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 3),
+    }
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def isolate_embedding_cache(app_module, directory):
+    """Point the app at a cold embedding cache so earlier runs cannot speed this one up."""
+    from embedding_cache import EmbeddingCache
+    app_module.embedding_cache = EmbeddingCache(
+        os.path.join(directory, 'embeddings.db'),
+        model_name=app_module.embedding_cache.model_name,
+        max_items=app_module.EMBEDDING_CACHE_SIZE,
+        max_disk_items=app_module.EMBEDDING_DISK_CACHE_SIZE
+    )
+
+
+def run_import(args):
+    """Worker: stream the corpus into the (empty) database."""
+    import app
+    from importer import stream_import
+    from migrations import upgrade
+
+    with app.app.app_context():
+        upgrade(app.db.engine)
+        with open(args.corpus, 'r', encoding='utf-8') as f:
+            report = stream_import(
+                f, app.db.session, app.TextIndex.__table__, app.TextEntity.__table__,
+                batch_size=args.import_batch_size
+            )
+    summary = report.to_dict()
+    summary.pop('errors')
+    summary['peak_rss_mb'] = peak_rss_mb()
+    return summary
+
+
+def run_method(args):
+    """Worker: time one matching method on the sample notes and score it against the gold lists."""
+    import app
+    isolate_embedding_cache(app, args.scratch)
+    records = load_sample(args.corpus, args.gold, args.sample)
+    if args.worker not in app.MODEL_FREE_METHODS:
+        app.model.get()  # Load time is reported separately, not as request latency
+        app.get_semantic_matches('warm-up', ['warm-up'], method=args.worker)
+
+    latencies = []
+    true_positives = false_positives = false_negatives = 0
+    started = time.perf_counter()
+    for record, gold in records:
+        for category, entities in record_categories(record).items():
+            if not entities:
+                continue
+            t = time.perf_counter()
+            matches = app.get_semantic_matches(record["text"], entities, method=args.worker)
+            latencies.append(time.perf_counter() - t)
+            predicted = {m['entity'] for m in matches}
+            expected = set(gold.get(category, []))
+            true_positives += len(predicted & expected)
+            false_positives += len(predicted - expected)
+            false_negatives += len(expected - predicted)
+    wall = time.perf_counter() - started
+
+    precision = true_positives / (true_positives + false_positives) if true_positives + false_positives else 0.0
+    recall = true_positives / (true_positives + false_negatives) if true_positives + false_negatives else 0.0
+    result = summarize(latencies, wall)
+    result.update({
+        'notes': len(records),
+        'notes_per_s': round(len(records) / wall, 1) if wall else None,
+        'threshold': app.get_match_threshold(args.worker),
+        'precision': round(precision, 4),
+        'recall': round(recall, 4),
+        'f1': round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+        'model_load_s': app.model.load_seconds if args.worker not in app.MODEL_FREE_METHODS else None,
+        'peak_rss_mb': peak_rss_mb(),
+    })
+    return result
+
+
+def run_routes(args):
+    """Worker: time the index, /get_entities and /save routes against the imported database."""
+    import app
+    isolate_embedding_cache(app, args.scratch)
+    records = load_sample(args.corpus, args.gold, args.sample)
+    client = app.app.test_client()
+    with app.app.app_context():
+        user = app.User(username='bench', password='x')
+        app.db.session.add(user)
+        app.db.session.commit()
+        user_id = user.id
+    with client.session_transaction() as s:
+        s['user_id'] = user_id
+
+    def time_requests(requests):
+        latencies = []
+        failures = 0
+        started = time.perf_counter()
+        for send in requests:
+            t = time.perf_counter()
+            response = send()
+            latencies.append(time.perf_counter() - t)
+            failures += response.status_code != 200
+        result = summarize(latencies, time.perf_counter() - started)
+        result['failures'] = failures
+        return result
+
+    calls = [(record["text_id"], category) for record, _ in records for category in record_categories(record)]
+    results = {'index': time_requests([lambda: client.get('/')] * len(records))}
+    for method in args.methods:
+        if method not in app.MODEL_FREE_METHODS:
+            app.model.get()
+            client.get(f'/get_entities/{calls[0][0]}/{calls[0][1]}?method={method}')  # Warm-up
+        results[f'get_entities_{method}'] = time_requests([
+            lambda text_id=text_id, category=category: client.get(
+                f'/get_entities/{text_id}/{category}?method={method}'
+            )
+            for text_id, category in calls
+        ])
+
+    def annotation(record, gold):
+        categories = record_categories(record)
+        return {
+            'text_id': record["text_id"],
+            'text': record["text"],
+            'entities': categories,
+            'matched': {c: gold.get(c, []) for c in categories},
+            'unmatched': {c: [e for e in entities if e not in gold.get(c, [])] for c, entities in categories.items()},
+            'undetected_entity': {c: [] for c in categories},
+        }
+
+    results['save'] = time_requests([
+        lambda record=record, gold=gold: client.post('/save', json=annotation(record, gold))
+        for record, gold in records
+    ])
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def run_stage(stage, args, corpus, gold, db_path, scratch):
+    env = dict(
+        os.environ, DATABASE_URI=f'sqlite:///{db_path}', MODEL_NAME=args.model,
+        MODEL_LOAD_MODE='lazy', LOG_LEVEL='WARNING'
+    )
+    command = [
+        sys.executable, os.path.abspath(__file__), '--worker', stage, '--corpus', corpus, '--gold', gold,
+        '--scratch', os.path.join(scratch, stage), '--sample', str(args.sample), '--methods', ','.join(args.methods),
+        '--import-batch-size', str(args.import_batch_size)
+    ]
+    out = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"{stage} stage failed:\n{out.stderr[-2000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """
+    Compare every numeric metric present in both reports.
+    Returns:
+        List of (metric path, baseline value, new value, relative change, regressed)
+    """
+    rows = []
+
+    def walk(new, old, path):
+        for key, value in new.items():
+            if key not in old or key == 'corpus':
+                continue
+            if isinstance(value, dict) and isinstance(old[key], dict):
+                walk(value, old[key], path + [key])
+            elif isinstance(value, (int, float)) and isinstance(old[key], (int, float)) and old[key]:
+                if key in WORKLOAD_KEYS:
+                    continue
+                change = (value - old[key]) / abs(old[key])
+                better = change if key.endswith(HIGHER_IS_BETTER) else -change
+                rows.append(('.'.join(path + [key]), old[key], value, round(change, 4), better < -tolerance))
+
+    walk(report['sizes'], baseline.get('sizes', {}), [])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark matching quality, speed and memory on synthetic corpora.")
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000', help="Comma-separated corpus sizes (notes)")
+    parser.add_argument('--sample', type=int, default=200, help="Notes per size used for method and route timings")
+    parser.add_argument('--methods', default='sentence,fuzzy', help="Comma-separated matching methods")
+    parser.add_argument('--model', default=os.getenv('MODEL_NAME', 'pritamdeka/S-PubMedBert-MS-MARCO'))
+    parser.add_argument('--seed', type=int, default=13)
+    parser.add_argument('--typo-rate', type=float, default=0.15, help="Share of entity occurrences misspelled")
+    parser.add_argument('--import-batch-size', type=int, default=1000)
+    parser.add_argument('--seed-corpus', default=os.path.join(ROOT, 'database.jsonl'))
+    parser.add_argument('--output', default=None, help="Also write the JSON report to this file")
+    parser.add_argument('--baseline', default=None, help="Earlier report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="Relative change counted as a regression in the comparison")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--corpus', help=argparse.SUPPRESS)
+    parser.add_argument('--gold', help=argparse.SUPPRESS)
+    parser.add_argument('--scratch', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.methods = [m.strip() for m in args.methods.split(',') if m.strip()]
+
+    if args.worker:
+        workers = {'import': run_import, 'routes': run_routes}
+        print(json.dumps(workers.get(args.worker, run_method)(args)))
+        return
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'model': args.model,
+        'seed': args.seed,
+        'sample': args.sample,
+        'typo_rate': args.typo_rate,
+        'sizes': {},
+    }
+    for size in (int(s) for s in args.sizes.split(',')):
+        with tempfile.TemporaryDirectory() as tmp:
+            corpus = os.path.join(tmp, 'corpus.jsonl')
+            gold = os.path.join(tmp, 'gold.jsonl')
+            db_path = os.path.join(tmp, 'bench.db')
+            result = {'corpus': generate_corpus(corpus, gold, size, args.seed, args.seed_corpus, args.typo_rate)}
+            result['import'] = run_stage('import', args, corpus, gold, db_path, tmp)
+            result['methods'] = {method: run_stage(method, args, corpus, gold, db_path, tmp) for method in args.methods}
+            result['routes'] = run_stage('routes', args, corpus, gold, db_path, tmp)
+        report['sizes'][str(size)] = result
+        quality = ', '.join(f"{m} F1 {r['f1']} ({r['calls_per_s']} calls/s)" for m, r in result['methods'].items())
+        print(f"{size} notes: import {result['import']['records_per_s']} records/s; {quality}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.tolerance)
+        print(f"\nCompared with {baseline.get('commit')}:", file=sys.stderr)
+        for path, old, new, change, regressed in rows:
+            print(f"{'REGRESSION ' if regressed else ''}{path}: {old} -> {new} ({change:+.1%})", file=sys.stderr)
+        if any(regressed for *_, regressed in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Recall and latency of the IVF chunk index in vector_index.py against exact search.
+
+Uses synthetic clustered unit vectors (no model needed), so it can run on any box.
+
+Usage:
+    python benchmarks/bench_vector_index.py [--rows 200000] [--dim 768] [--spread 1.5] [--nlist 256] [--queries 200] [--k 10]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import ChunkIndex, normalize  # noqa: E402
+
+
+def synthetic_batches(rows, dim, clusters, spread, seed, batch_size=50000):
+    """Yield (vectors, chunk rows) drawn around random cluster centres, like chunks of related notes."""
+    rng = np.random.default_rng(seed)
+    centres = normalize(rng.standard_normal((clusters, dim)))
+    for start in range(0, rows, batch_size):
+        n = min(batch_size, rows - start)
+        labels = rng.integers(clusters, size=n)
+        vectors = centres[labels] + spread * rng.standard_normal((n, dim)).astype(np.float32) / np.sqrt(dim)
+        chunk_rows = np.stack([np.arange(start, start + n), np.zeros(n), np.zeros(n)], axis=1)
+        yield vectors.astype(np.float32), chunk_rows.astype(np.int32)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the IVF chunk index against exact search.")
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--clusters', type=int, default=2000, help="Synthetic topic clusters")
+    parser.add_argument('--spread', type=float, default=1.5, help="Noise norm around each cluster centre")
+    parser.add_argument('--nlist', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nprobe', default='1,4,8,16,32')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        index = ChunkIndex.build(
+            os.path.join(tmp, 'index'), args.dim,
+            synthetic_batches(args.rows, args.dim, args.clusters, args.spread, args.seed),
+            nlist=args.nlist, seed=args.seed
+        )
+        build_s = time.perf_counter() - started
+        rows = len(index)  # Also maps the index files
+
+        rng = np.random.default_rng(args.seed + 1)
+        query_rows = rng.choice(rows, args.queries, replace=False)
+        queries = np.asarray(index.vectors[query_rows], dtype=np.float32)
+        queries += 0.3 * rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(args.dim)
+
+        exact_latencies = []
+        truth = []
+        for q in queries:
+            t = time.perf_counter()
+            truth.append({row for row, _ in index.exact_search(q, k=args.k)})
+            exact_latencies.append(time.perf_counter() - t)
+
+        report = {
+            'rows': rows,
+            'dim': args.dim,
+            'nlist': args.nlist,
+            'k': args.k,
+            'build_s': round(build_s, 2),
+            'index_bytes': sum(os.path.getsize(os.path.join(tmp, 'index', f)) for f in os.listdir(os.path.join(tmp, 'index'))),
+            'exact': {
+                'p50_ms': round(1000 * percentile(exact_latencies, 0.5), 3),
+                'p95_ms': round(1000 * percentile(exact_latencies, 0.95), 3),
+            },
+            'ivf': [],
+        }
+        for nprobe in [int(n) for n in args.nprobe.split(',')]:
+            latencies = []
+            recall = 0.0
+            for q, expected in zip(queries, truth):
+                t = time.perf_counter()
+                found = {row for row, _ in index.search(q, k=args.k, nprobe=nprobe)}
+                latencies.append(time.perf_counter() - t)
+                recall += len(found & expected) / len(expected)
+            report['ivf'].append({
+                'nprobe': nprobe,
+                f'recall@{args.k}': round(recall / len(queries), 4),
+                'p50_ms': round(1000 * percentile(latencies, 0.5), 3),
+                'p95_ms': round(1000 * percentile(latencies, 0.95), 3),
+            })
+        del index
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
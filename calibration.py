@@ -0,0 +1,344 @@
+"""
+Per-category, per-method threshold calibration from annotator verdicts.
+
+Every entity an annotator dragged to matched or unmatched is a labelled
+example for each matching method: its score (cosine similarity for sentence
+and span, rounded fuzz.ratio for fuzzy) is positive if it was matched.
+For a category and method, the threshold with the best F1 over these
+examples becomes the threshold get_semantic_matches uses for that category.
+
+The job is incremental:
+- /save and /delete queue the (text, category) groups they change
+- a run scores only the queued groups, reusing the stored score of every
+  entity it has scored before, so the model only sees new entities
+- each group's samples are replaced and their difference is added to a
+  per-(category, method) histogram of verdicts by score bin
+- thresholds are refitted from the histograms of the touched categories,
+  a sweep over at most a few hundred bins
+
+Categories with fewer than CALIBRATION_MIN_VERDICTS verdicts, or fewer than
+CALIBRATION_MIN_POSITIVES matched or CALIBRATION_MIN_NEGATIVES unmatched ones,
+keep the global threshold. Fitted thresholds stay within the method's
+CALIBRATION_THRESHOLD_RANGE, so a skewed category cannot switch matching off
+or let every candidate through.
+The app reloads calibrated thresholds every THRESHOLD_RELOAD_SECONDS. If the
+match_threshold table cannot be read (a database not yet upgraded), every
+category keeps the global threshold until the next reload.
+
+Usage:
+    python calibration.py run [--methods sentence,span,fuzzy] [--interval 0]
+    python calibration.py rebuild
+    python calibration.py show
+"""
+import argparse
+import logging
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from analytics import add_to_stats, verdicts
+from fuzzy_matching import best_fuzzy_scores
+from models import (
+    TextIndex, MatchResult, CalibrationQueue, CalibrationSample, CalibrationHistogram, MatchThreshold
+)
+from span_matching import best_span_similarities, cosine_similarity_matrix
+
+logger = logging.getLogger(__name__)
+
+# Score bins per threshold unit: 0.01 steps of cosine similarity, whole fuzz.ratio points
+SCORE_BINS = {'sentence': 100, 'span': 100, 'fuzzy': 1}
+CALIBRATED_METHODS = tuple(SCORE_BINS)
+CALIBRATION_MIN_POSITIVES = 20     # Matched verdicts needed before a category gets its own threshold
+CALIBRATION_MIN_NEGATIVES = 20     # Unmatched verdicts needed likewise
+CALIBRATION_MIN_VERDICTS = 100     # Verdicts of both kinds needed likewise
+# Lowest and highest threshold a fit may store per method
+CALIBRATION_THRESHOLD_RANGE = {'sentence': (0.5, 0.95), 'span': (0.5, 0.95), 'fuzzy': (60, 95)}
+CALIBRATION_BATCH_SIZE = 200       # Queued groups scored per transaction
+
+
+def score_bin(method, score):
+    # The epsilon keeps scores that sit exactly on a bin edge (0.29 * 100) in that bin
+    return math.floor(score * SCORE_BINS[method] + 1e-9)
+
+
+def score_entities(method, text, entities, encode):
+    """Score that decides whether `method` matches each entity: Dict of entity -> score."""
+    if method == 'fuzzy':
+        return best_fuzzy_scores(text, entities)
+    if method == 'span':
+        return best_span_similarities(text, entities, encode)
+    entities = list(dict.fromkeys(entities))
+    similarities = cosine_similarity_matrix(encode([text]), encode(entities))[0]
+    return dict(zip(entities, similarities.tolist()))
+
+
+def enqueue(session, groups):
+    """Queue (text_pk, category) groups for the next calibration run."""
+    add_to_stats(session, {(CalibrationQueue, group): {'version': 1} for group in groups})
+
+
+def process_groups(session, queued, methods, encode):
+    """
+    Replace the samples of queued groups and update the histograms by the difference.
+    Args:
+        queued: List of (text_pk, category, version) queue rows
+        methods: Methods to calibrate
+        encode: Callable mapping a list of strings to embeddings
+    Returns:
+        Set of (category, method) whose histogram changed
+    """
+    groups = {(text_pk, category) for text_pk, category, _ in queued}
+    text_pks = sorted({text_pk for text_pk, _ in groups})
+
+    # Current verdicts: entity -> [positives, negatives] per group
+    counts = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    for row in session.execute(
+        select(MatchResult.text_id, MatchResult.category, MatchResult.matched, MatchResult.unmatched)
+        .where(MatchResult.text_id.in_(text_pks))
+    ):
+        if (row.text_id, row.category) in groups:
+            for entity, is_match in verdicts(row).items():
+                counts[(row.text_id, row.category)][entity][0 if is_match else 1] += 1
+
+    group_filter = tuple_(CalibrationSample.text_id, CalibrationSample.category).in_(list(groups))
+    old_samples = defaultdict(dict)
+    for sample in session.scalars(
+        select(CalibrationSample).where(group_filter, CalibrationSample.method.in_(methods))
+    ):
+        old_samples[(sample.text_id, sample.category, sample.method)][sample.entity] = sample
+
+    texts = {}
+    if counts:
+        texts = dict(session.execute(
+            select(TextIndex.id, TextIndex.text).where(TextIndex.id.in_([pk for pk, _ in counts]))
+        ).all())
+
+    changes = defaultdict(Counter)
+    new_samples = []
+    for method in methods:
+        for (text_pk, category) in groups:
+            labelled = counts.get((text_pk, category), {})
+            old = old_samples.get((text_pk, category, method), {})
+            scores = {entity: sample.score for entity, sample in old.items()}
+            if labelled.keys() - scores.keys():
+                # Score the whole labelled list at once: span chunking depends on the entities
+                scores = score_entities(method, texts[text_pk], list(labelled), encode)
+
+            for entity, sample in old.items():
+                stats = changes[(CalibrationHistogram, (category, method, score_bin(method, sample.score)))]
+                stats['positives'] -= sample.positives
+                stats['negatives'] -= sample.negatives
+            for entity, (positives, negatives) in labelled.items():
+                score = float(scores[entity])
+                stats = changes[(CalibrationHistogram, (category, method, score_bin(method, score)))]
+                stats['positives'] += positives
+                stats['negatives'] += negatives
+                new_samples.append({
+                    'text_id': text_pk, 'category': category, 'method': method, 'entity': entity,
+                    'score': score, 'positives': positives, 'negatives': negatives
+                })
+
+    session.execute(delete(CalibrationSample).where(group_filter, CalibrationSample.method.in_(methods)))
+    if new_samples:
+        session.execute(CalibrationSample.__table__.insert(), new_samples)
+    changes = {key: dict(columns) for key, columns in changes.items() if any(columns.values())}
+    add_to_stats(session, changes)
+
+    # A group changed again while it was being scored keeps its queue row for the next run
+    session.execute(delete(CalibrationQueue).where(
+        tuple_(CalibrationQueue.text_id, CalibrationQueue.category, CalibrationQueue.version).in_(queued)
+    ))
+    return {(category, method) for _, (category, method, _) in changes}
+
+
+def fit_threshold(histogram, bins_per_unit, bounds=None):
+    """
+    Threshold with the best F1 over a verdict histogram; ties go to the higher threshold.
+    Args:
+        histogram: Dict of bin -> (positives, negatives)
+        bins_per_unit: Bins per threshold unit (SCORE_BINS of the method)
+        bounds: Optional (lowest, highest) threshold; a best fit outside is clamped to the
+            nearest bound and its F1, precision and recall are those at the bound
+    Returns:
+        (threshold, f1, precision, recall)
+    """
+    total_positives = sum(positives for positives, _ in histogram.values())
+
+    def scored(cut, true_positives, false_positives):
+        f1 = 2 * true_positives / (true_positives + false_positives + total_positives)
+        precision = true_positives / (true_positives + false_positives) if true_positives else 0.0
+        return cut / bins_per_unit, f1, precision, true_positives / total_positives
+
+    true_positives = false_positives = 0
+    best = None
+    for score in sorted(histogram, reverse=True):
+        positives, negatives = histogram[score]
+        true_positives += positives
+        false_positives += negatives
+        f1 = 2 * true_positives / (true_positives + false_positives + total_positives)
+        if best is None or f1 > best[1]:
+            best_cut = score
+            best = scored(score, true_positives, false_positives)
+
+    if bounds:
+        cut = min(max(best_cut, math.ceil(bounds[0] * bins_per_unit - 1e-9)),
+                  math.floor(bounds[1] * bins_per_unit + 1e-9))
+        if cut != best_cut:
+            above = [histogram[score] for score in histogram if score >= cut]
+            best = scored(cut, sum(p for p, _ in above), sum(n for _, n in above))
+    return best
+
+
+def refit(session, targets):
+    """
+    Refit the thresholds of (category, method) pairs from their histograms.
+    Returns:
+        Number of thresholds stored (the others fall back to the global default)
+    """
+    stored = 0
+    for category, method in sorted(targets):
+        histogram = {
+            row.bin: (row.positives, row.negatives) for row in session.scalars(
+                select(CalibrationHistogram).where(
+                    CalibrationHistogram.category == category, CalibrationHistogram.method == method
+                )
+            )
+            if row.positives or row.negatives
+        }
+        positives = sum(p for p, _ in histogram.values())
+        negatives = sum(n for _, n in histogram.values())
+        session.execute(delete(MatchThreshold).where(
+            MatchThreshold.category == category, MatchThreshold.method == method
+        ))
+        if positives < CALIBRATION_MIN_POSITIVES or negatives < CALIBRATION_MIN_NEGATIVES \
+                or positives + negatives < CALIBRATION_MIN_VERDICTS:
+            continue
+        threshold, f1, precision, recall = fit_threshold(
+            histogram, SCORE_BINS[method], CALIBRATION_THRESHOLD_RANGE[method]
+        )
+        session.add(MatchThreshold(
+            category=category, method=method, threshold=threshold, f1=round(f1, 4),
+            precision=round(precision, 4), recall=round(recall, 4),
+            positives=positives, negatives=negatives, updated_at=time.time()
+        ))
+        stored += 1
+    return stored
+
+
+def run(session, methods, encode, batch_size=CALIBRATION_BATCH_SIZE, log=print):
+    """
+    Process the whole queue, committing per batch, then refit the touched thresholds.
+    Returns:
+        (groups processed, thresholds stored)
+    """
+    touched = set()
+    processed = 0
+    while True:
+        queued = [tuple(row) for row in session.execute(
+            select(CalibrationQueue.text_id, CalibrationQueue.category, CalibrationQueue.version)
+            .order_by(CalibrationQueue.text_id, CalibrationQueue.category).limit(batch_size)
+        )]
+        if not queued:
+            break
+        touched |= process_groups(session, queued, methods, encode)
+        session.commit()
+        processed += len(queued)
+        log(f"{processed} groups scored")
+    stored = refit(session, touched)
+    session.commit()
+    return processed, stored
+
+
+def rebuild(session):
+    """Drop every sample, histogram and threshold and queue every annotated group."""
+    for model in (CalibrationSample, CalibrationHistogram, MatchThreshold, CalibrationQueue):
+        session.execute(delete(model))
+    session.execute(CalibrationQueue.__table__.insert().from_select(
+        ['text_id', 'category', 'version'],
+        select(MatchResult.text_id, MatchResult.category, 0).group_by(MatchResult.text_id, MatchResult.category)
+    ))
+
+
+class CalibratedThresholds:
+    """
+    Calibrated thresholds, reloaded from match_threshold at most every `reload_seconds`,
+    so a calibration run takes effect in every worker without a restart.
+    Args:
+        load: Callable returning the rows as (category, method, threshold) tuples
+        reload_seconds: How long loaded thresholds are served before reloading
+    """
+
+    def __init__(self, load, reload_seconds):
+        self.load = load
+        self.reload_seconds = reload_seconds
+        self.thresholds = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def get(self, category, method, default):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at >= self.reload_seconds:
+            with self.lock:
+                if self.loaded_at is None or time.monotonic() - self.loaded_at >= self.reload_seconds:
+                    try:
+                        rows = self.load()
+                    except (OperationalError, ProgrammingError) as e:
+                        # Missing table: matching carries on with the global thresholds
+                        logger.error('calibrated thresholds unavailable; using the global ones',
+                                     extra={'error': str(e)})
+                        rows = []
+                    self.thresholds = {(c, m): t for c, m, t in rows}
+                    self.loaded_at = time.monotonic()
+        return self.thresholds.get((category, method), default)
+
+    def invalidate(self):
+        self.loaded_at = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate per-category matching thresholds from annotations.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help="Score queued annotations and refit their thresholds")
+    run_parser.add_argument('--methods', default=','.join(CALIBRATED_METHODS),
+                            help="Comma-separated methods to calibrate (sentence, span, fuzzy)")
+    run_parser.add_argument('--batch-size', type=int, default=CALIBRATION_BATCH_SIZE, help="Groups per transaction")
+    run_parser.add_argument('--interval', type=float, default=0,
+                            help="Keep running, checking the queue every this many seconds (0 = run once)")
+    subparsers.add_parser('rebuild', help="Discard every calibration result and queue all annotations")
+    subparsers.add_parser('show', help="Print the calibrated thresholds")
+    args = parser.parse_args()
+
+    # Scoring uses the app's model and embedding cache
+    from app import app, db, model, embedding_cache
+    from migrations import upgrade
+
+    with app.app_context():
+        upgrade(db.engine)
+        if args.command == 'rebuild':
+            rebuild(db.session)
+            db.session.commit()
+            print(f"✅ Queued {db.session.query(CalibrationQueue).count()} groups; run `python calibration.py run`")
+        elif args.command == 'show':
+            for row in db.session.scalars(select(MatchThreshold).order_by(MatchThreshold.category, MatchThreshold.method)):
+                print(f"{row.category:<24} {row.method:<9} threshold={row.threshold:g} f1={row.f1} "
+                      f"precision={row.precision} recall={row.recall} ({row.positives}+/{row.negatives}-)")
+        else:
+            methods = [m.strip() for m in args.methods.split(',') if m.strip()]
+            unknown = [m for m in methods if m not in CALIBRATED_METHODS]
+            if unknown:
+                parser.error(f"Unknown method(s): {', '.join(unknown)}")
+            encode = lambda strings: embedding_cache.encode(model, strings)
+            while True:
+                processed, stored = run(db.session, methods, encode, args.batch_size)
+                if processed or not args.interval:
+                    print(f"✅ Scored {processed} groups; {stored} thresholds calibrated")
+                if not args.interval:
+                    break
+                time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from models import SQLITE_BUSY_TIMEOUT_MS, apply_sqlite_pragmas
+
+DISK_PRUNE_TO = 0.9  # Eviction trims the table to this share of max_disk_items, so it runs rarely
+
+
+class EmbeddingCache:
+    """
+    Content-hash keyed store for sentence embeddings.
+
+    Lookups go through an in-memory LRU first and fall back to a SQLite table
+    on disk, so repeated texts and entity lists skip the model forward pass and
+    the cache survives worker restarts. The table is capped at `max_disk_items`
+    rows: past that, the rows read or written longest ago are deleted.
+    Args:
+        db_path: Path of the SQLite file backing the on-disk tier
+        model_name: Name of the model, mixed into every key so a model change never serves stale vectors
+        max_items: Maximum number of embeddings kept in memory
+        max_disk_items: Maximum number of embeddings kept on disk
+    """
+
+    def __init__(self, db_path, model_name, max_items=10000, max_disk_items=200000):
+        self.db_path = db_path
+        self.model_name = model_name
+        self.max_items = max_items
+        self.max_disk_items = max_disk_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+
+        self._conn = None
+        self._conn_pid = None
+        self._disk_items = None  # Row count, refreshed from the table whenever it may exceed the cap
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+    @property
+    def conn(self):
+        # SQLite connections must not cross fork(); each worker process opens its own
+        if self._conn is None or self._conn_pid != os.getpid():
+            # Workers share the file: WAL and a busy timeout, as for the app database
+            self._conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+            self._conn_pid = os.getpid()
+            apply_sqlite_pragmas(self._conn)
+            self._create_table()
+            self._disk_items = self._conn.execute('SELECT count(*) FROM embedding_cache').fetchone()[0]
+        return self._conn
+
+    def _create_table(self):
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS embedding_cache ('
+            'key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL, '
+            'last_access INTEGER NOT NULL DEFAULT 0)'
+        )
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(embedding_cache)')}
+        if 'last_access' not in columns:
+            # A file from before eviction: its rows count as the least recently used
+            try:
+                self._conn.execute('ALTER TABLE embedding_cache ADD COLUMN last_access INTEGER NOT NULL DEFAULT 0')
+            except sqlite3.OperationalError as e:
+                if 'duplicate column' not in str(e):
+                    raise  # Otherwise another worker added it first
+        self._conn.execute('CREATE INDEX IF NOT EXISTS embedding_cache_last_access ON embedding_cache (last_access)')
+        self._conn.commit()
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode('utf-8')).hexdigest()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _load_from_disk(self, keys):
+        found = {}
+        keys = list(keys)
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f'SELECT key, dim, vector FROM embedding_cache WHERE key IN ({placeholders})', chunk
+            ).fetchall()
+            for key, dim, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).reshape(dim)
+        if found:
+            keys = list(found)
+            now = int(time.time())
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                self.conn.execute(
+                    f'UPDATE embedding_cache SET last_access = ? WHERE key IN ({placeholders})', [now, *chunk]
+                )
+            self.conn.commit()
+        return found
+
+    def _evict(self):
+        """Delete the least recently used rows once the table is over max_disk_items."""
+        count = self.conn.execute('SELECT count(*) FROM embedding_cache').fetchone()[0]
+        if count > self.max_disk_items:
+            excess = count - int(self.max_disk_items * DISK_PRUNE_TO)
+            self.conn.execute(
+                'DELETE FROM embedding_cache WHERE key IN '
+                '(SELECT key FROM embedding_cache ORDER BY last_access LIMIT ?)', (excess,)
+            )
+            self.conn.commit()
+            self.disk_evictions += excess
+            count -= excess
+        self._disk_items = count
+
+    def encode(self, model, texts, batch_size=32):
+        """
+        Return a float32 matrix with one embedding per text, encoding only the cache misses.
+        Args:
+            model: SentenceTransformer-compatible object used for the misses
+            texts: List of strings to embed
+            batch_size: Batch size passed to model.encode for the misses
+        """
+        keys = [self._key(t) for t in texts]
+        vectors = {}
+
+        with self._lock:
+            pending = []
+            for key in keys:
+                if key in vectors:
+                    continue
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    vectors[key] = self._memory[key]
+                    self.hits += 1
+                else:
+                    pending.append(key)
+
+            if pending:
+                from_disk = self._load_from_disk(set(pending))
+                for key, vector in from_disk.items():
+                    self._remember(key, vector)
+                vectors.update(from_disk)
+                self.disk_hits += len(from_disk)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+
+        if missing:
+            encoded = model.encode(list(missing.values()), batch_size=batch_size, convert_to_numpy=True)
+            encoded = np.asarray(encoded, dtype=np.float32)
+            with self._lock:
+                self.misses += len(missing)
+                rows = []
+                now = int(time.time())
+                for key, vector in zip(missing.keys(), encoded):
+                    vectors[key] = vector
+                    self._remember(key, vector)
+                    rows.append((key, vector.shape[0], vector.tobytes(), now))
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO embedding_cache (key, dim, vector, last_access) VALUES (?, ?, ?, ?)', rows
+                )
+                self.conn.commit()
+                # Counts replaced rows too; _evict() recounts before deleting anything
+                self._disk_items += len(rows)
+                if self._disk_items > self.max_disk_items:
+                    self._evict()
+
+        if not keys:
+            return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.stack([vectors[key] for key in keys])
+
+    def stats(self):
+        """Return hit/miss counters for sizing the cache."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'memory_items': len(self._memory),
+                'max_items': self.max_items,
+                'disk_items': self._disk_items,
+                'max_disk_items': self.max_disk_items,
+                'disk_evictions': self.disk_evictions,
+            }
@@ -0,0 +1,212 @@
+"""
+Encoder backends for the sentence model.
+
+    torch       fp32 SentenceTransformer (reference)
+    torch-int8  SentenceTransformer with its Linear layers dynamically quantized to int8
+    onnx        the transformer exported to ONNX and run with ONNX Runtime; pooling
+                and normalization are reproduced in numpy
+
+All backends expose the subset of the SentenceTransformer API the app uses:
+encode() and get_sentence_embedding_dimension().
+"""
+import inspect
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to no cross-process locking
+    fcntl = None
+
+ENCODER_BACKENDS = ('torch', 'torch-int8', 'onnx')
+
+
+def load_torch_encoder(model_name):
+    from sentence_transformers import SentenceTransformer
+    encoder = SentenceTransformer(model_name, device='cpu')
+    encoder.eval()
+    return encoder
+
+
+def load_quantized_torch_encoder(model_name):
+    import torch
+    encoder = load_torch_encoder(model_name)
+    return torch.quantization.quantize_dynamic(encoder, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def onnx_export_dir(base_dir, model_name):
+    return os.path.join(base_dir, re.sub(r'[^A-Za-z0-9_.-]+', '__', model_name))
+
+
+def pooling_mode(pooling):
+    if hasattr(pooling, 'get_pooling_mode_str'):
+        return pooling.get_pooling_mode_str()
+    return pooling.pooling_mode  # Newer sentence-transformers releases
+
+
+def export_onnx(model_name, export_dir):
+    """Export the transformer of a SentenceTransformer to ONNX along with its tokenizer and pooling config."""
+    import torch
+    sentence_model = load_torch_encoder(model_name)
+    transformer = sentence_model[0]
+    pooling = sentence_model[1]
+    hf_model = transformer.auto_model
+    tokenizer = transformer.tokenizer
+
+    os.makedirs(export_dir, exist_ok=True)
+    sample = tokenizer(['export sample'], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+
+    class Wrapper(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)))[0]
+
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['token_embeddings'] = {0: 'batch', 1: 'sequence'}
+    export_kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs['dynamo'] = False  # Keep the TorchScript exporter, which honours dynamic_axes
+    torch.onnx.export(
+        Wrapper(hf_model).eval(),
+        tuple(sample[name] for name in input_names),
+        os.path.join(export_dir, 'model.onnx'),
+        input_names=input_names,
+        output_names=['token_embeddings'],
+        dynamic_axes=dynamic_axes,
+        opset_version=17,
+        **export_kwargs
+    )
+    tokenizer.save_pretrained(export_dir)
+    with open(os.path.join(export_dir, 'encoder_config.json'), 'w') as f:
+        json.dump({
+            'model_name': model_name,
+            'pooling': pooling_mode(pooling),
+            'normalize': any(type(module).__name__ == 'Normalize' for module in sentence_model),
+            'max_seq_length': sentence_model.max_seq_length,
+            'dimension': sentence_model.get_sentence_embedding_dimension(),
+            'input_names': input_names,
+        }, f)
+
+
+def ensure_onnx_export(model_name, export_dir):
+    """
+    Export the model into `export_dir` unless a complete export is already there.
+    Workers starting together serialize on a lock file; the export is written to a
+    temporary directory next to the target and renamed into place, and
+    encoder_config.json (written last) marks a complete export.
+    """
+    marker = os.path.join(export_dir, 'encoder_config.json')
+    if os.path.exists(marker):
+        return
+    parent = os.path.dirname(os.path.abspath(export_dir))
+    os.makedirs(parent, exist_ok=True)
+    with open(export_dir.rstrip(os.sep) + '.lock', 'a') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if os.path.exists(marker):
+                return  # Another worker finished the export while this one waited
+            staging = tempfile.mkdtemp(prefix=os.path.basename(export_dir) + '.', dir=parent)
+            try:
+                export_onnx(model_name, staging)
+                # Leftovers of an interrupted export by an older release
+                shutil.rmtree(export_dir, ignore_errors=True)
+                os.replace(staging, export_dir)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class OnnxEncoder:
+    """
+    ONNX Runtime implementation of SentenceTransformer.encode().
+    The model is exported on first use into `export_dir` (this step needs torch);
+    afterwards only onnxruntime and the tokenizer are used.
+    Args:
+        model_name: SentenceTransformer model name or path
+        export_dir: Directory holding model.onnx, the tokenizer and encoder_config.json
+        intra_op_threads: ONNX Runtime intra-op thread count (None = library default)
+    """
+
+    def __init__(self, model_name, export_dir, intra_op_threads=None):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        ensure_onnx_export(model_name, export_dir)
+        with open(os.path.join(export_dir, 'encoder_config.json'), 'r') as f:
+            self.config = json.load(f)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(export_dir, 'model.onnx'), options, providers=['CPUExecutionProvider']
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+
+    def get_sentence_embedding_dimension(self):
+        return self.config['dimension']
+
+    def _pool(self, token_embeddings, attention_mask):
+        mode = self.config['pooling']
+        mask = attention_mask[..., None].astype(np.float32)
+        if mode == 'cls':
+            return token_embeddings[:, 0]
+        if mode == 'max':
+            return np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        if mode == 'mean_sqrt_len_tokens':
+            return summed / np.sqrt(counts)
+        return summed / counts
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        output = np.zeros((len(sentences), self.config['dimension']), dtype=np.float32)
+        # Sort by length so each batch is padded as little as possible
+        order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            features = self.tokenizer(
+                [sentences[i] for i in batch], padding=True, truncation=True,
+                max_length=self.config['max_seq_length'], return_tensors='np'
+            )
+            inputs = {name: features[name].astype(np.int64) for name in self.config['input_names']}
+            token_embeddings = self.session.run(['token_embeddings'], inputs)[0]
+            output[batch] = self._pool(token_embeddings, features['attention_mask'])
+        if self.config['normalize'] or normalize_embeddings:
+            output /= np.clip(np.linalg.norm(output, axis=1, keepdims=True), 1e-12, None)
+        return output[0] if single else output
+
+
+def load_encoder(model_name, backend='torch', onnx_dir=None, intra_op_threads=None):
+    """
+    Build the encoder for a backend name (see ENCODER_BACKENDS).
+    Args:
+        model_name: SentenceTransformer model name or path
+        backend: 'torch', 'torch-int8' or 'onnx'
+        onnx_dir: Base directory for ONNX exports (required for 'onnx')
+        intra_op_threads: Thread count for the ONNX Runtime session
+    """
+    if backend == 'torch':
+        return load_torch_encoder(model_name)
+    if backend == 'torch-int8':
+        return load_quantized_torch_encoder(model_name)
+    if backend == 'onnx':
+        return OnnxEncoder(model_name, onnx_export_dir(onnx_dir, model_name), intra_op_threads=intra_op_threads)
+    raise ValueError(f"Unknown encoder backend: {backend} (expected one of {', '.join(ENCODER_BACKENDS)})")
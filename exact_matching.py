@@ -0,0 +1,180 @@
+"""
+Exact, case-insensitive, word-boundary entity matching in a single pass.
+
+An ExactMatcher case-folds its vocabulary into a trie and compiles the trie
+into one regular expression. Shared prefixes become shared branches, so the
+regex engine scans the folded note once and only descends into branches
+that keep matching, however many entities there are. Each position where the
+regex finds an entity is then walked through the trie to report every entity
+that ends there on a word boundary, so nested entities ("diabetes" inside
+"type 2 diabetes") and repeated occurrences are all returned.
+
+Folding equates the characters re.IGNORECASE does ('ı' and 'i', 'ſ' and 's',
+final and medial sigma) while keeping offsets, so results are those of the
+previous per-entity `\b` regex, which test_exact_matching.py checks.
+
+Matchers are cached by vocabulary, so a category's entity list is compiled
+once and reused across requests.
+"""
+import re
+from functools import lru_cache
+
+EXACT_MATCHER_CACHE_SIZE = 1024  # Distinct vocabularies kept compiled
+
+_END = ''  # Trie key marking the entities that end at a node
+
+
+# Pairs re.IGNORECASE equates whose shared upper case is several characters long:
+# iota and upsilon with dialytika and oxia or tonos, and the 'ſt' and 'st' ligatures
+_FOLD_PAIRS = {'\u1fd3': '\u0390', '\u1fe3': '\u03b0', '\ufb05': '\ufb06'}
+
+
+def _fold_char(char):
+    """The character re.IGNORECASE treats `char` as: its lower case, shared by letters with the same upper case."""
+    if char in _FOLD_PAIRS:
+        return _FOLD_PAIRS[char]
+    lower = char.lower()[0]  # 'İ' lower-cases to 'i' and a combining dot; re keeps the 'i'
+    upper = lower.upper()
+    if len(upper) == 1:
+        return upper.lower()  # 'ı' and 'i', 'ſ' and 's', 'ς' and 'σ' all fold to the second
+    return lower
+
+
+class _FoldTable(dict):
+    """str.translate table folding each non-ASCII character on first sight."""
+
+    def __missing__(self, code):
+        self[code] = folded = _fold_char(chr(code))
+        return folded
+
+
+_FOLD_TABLE = _FoldTable()
+
+
+def fold(text):
+    """Case-fold text one character for one, so offsets stay valid, as re.IGNORECASE compares characters."""
+    if text.isascii():
+        return text.lower()
+    folded = text.lower().upper().lower()
+    if len(folded) == len(text):
+        return folded.replace('ς', 'σ')  # lower() turns a word-final 'Σ' back into 'ς'
+    # Some characters change length on the way ('İ', 'ß'): fold one at a time
+    return text.translate(_FOLD_TABLE)
+
+
+def _is_word(char):
+    return char.isalnum() or char == '_'
+
+
+def is_boundary(text, position):
+    """Whether `\\b` holds at `position` of `text`."""
+    before = position > 0 and _is_word(text[position - 1])
+    after = position < len(text) and _is_word(text[position])
+    return before != after
+
+
+def _trie_pattern(node):
+    """Regex source matching every path of the trie below `node`, each followed by a word boundary."""
+    parts = []
+    # Follow single-child chains iteratively: entities can be long
+    while len(node) == 1 and _END not in node:
+        (char, node), = node.items()
+        parts.append(re.escape(char))
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char != _END]
+    if _END in node:
+        branches.append(r'\b')
+    if len(branches) == 1:
+        parts.append(branches[0])
+    elif branches:
+        parts.append('(?:' + '|'.join(branches) + ')')
+    return ''.join(parts)
+
+
+class ExactMatcher:
+    """
+    Finds every word-boundary, case-insensitive occurrence of a fixed set of entities.
+    Args:
+        entities: Entity strings; duplicates and empty strings are ignored
+    """
+
+    def __init__(self, entities):
+        self.entities = list(dict.fromkeys(e for e in entities if e and e.strip()))
+        self._trie = {}
+        for entity in self.entities:
+            node = self._trie
+            for char in fold(entity):
+                node = node.setdefault(char, {})
+            node.setdefault(_END, []).append(entity)
+        # Case-sensitive over folded text, so the regex engine can skip ahead to candidate first characters
+        self._pattern = re.compile(_trie_pattern(self._trie)) if self._trie else None
+
+    def finditer(self, text):
+        """Yield (entity, start, end) for every occurrence, ordered by start and then longest first."""
+        if self._pattern is None:
+            return
+        folded = fold(text)
+        position = 0
+        while True:
+            m = self._pattern.search(folded, position)
+            if m is None:
+                return
+            start = m.start()
+            # Resume right after this start, so occurrences overlapping this one are found too
+            position = start + 1
+            if not is_boundary(text, start):
+                continue
+            found = []
+            node = self._trie
+            for end in range(start + 1, len(folded) + 1):
+                node = node.get(folded[end - 1])
+                if node is None:
+                    break
+                if _END in node and is_boundary(text, end):
+                    found.extend((entity, start, end) for entity in node[_END])
+            found.sort(key=lambda occurrence: -occurrence[2])
+            yield from found
+
+    def find_matches(self, text):
+        """Every occurrence as a match dict (similarity 1.0), as returned by get_semantic_matches."""
+        return [
+            {
+                'entity': entity,
+                'start': start,
+                'end': end,
+                'matched_text': text[start:end],
+                'similarity': 1.0
+            }
+            for entity, start, end in self.finditer(text)
+        ]
+
+
+@lru_cache(maxsize=EXACT_MATCHER_CACHE_SIZE)
+def _cached_matcher(entities):
+    return ExactMatcher(entities)
+
+
+def get_exact_matcher(entities):
+    """Return the compiled matcher for this entity list, building it on first use."""
+    return _cached_matcher(tuple(entities))
+
+
+def find_exact_matches(text, entities):
+    """
+    Find every exact occurrence of every entity in one pass over the text.
+    Args:
+        text: The text to search in
+        entities: List of entities to find
+    Returns:
+        List of matches ordered by position
+    """
+    return get_exact_matcher(entities).find_matches(text)
+
+
+def split_exact_matches(text, entities):
+    """
+    Return (exact matches, entities without an exact occurrence).
+    Occurrences are word-boundary, case-insensitive and get similarity 1.0.
+    """
+    matches = find_exact_matches(text, entities)
+    found = {m['entity'] for m in matches}
+    return matches, [entity for entity in entities if entity not in found]
@@ -0,0 +1,109 @@
+import re
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from exact_matching import split_exact_matches
+
+TOKEN_PATTERN = re.compile(r'\S+')
+
+
+def tokenize_with_offsets(text):
+    """Split text on whitespace, keeping the (start, end) offsets of every token."""
+    return [(m.start(), m.end()) for m in TOKEN_PATTERN.finditer(text)]
+
+
+def max_ngram_words(entities):
+    """
+    Longest candidate phrase (in words) worth scoring for these entities.
+    One extra word is allowed so that punctuation or an article inside the
+    note does not push the right span out of reach.
+    """
+    return max((len(entity.split()) for entity in entities), default=0) + 1
+
+
+def build_candidates(text, spans, max_words):
+    """
+    Build every 1..max_words word n-gram of the text once.
+    Returns:
+        (phrases, offsets): lower-cased phrases joined with single spaces, and
+        the (start, end) character offsets of each phrase in the original text
+    """
+    words = [text[start:end].lower() for start, end in spans]
+    phrases = []
+    offsets = []
+    for i in range(len(spans)):
+        for j in range(i + 1, min(i + max_words, len(spans)) + 1):
+            phrases.append(' '.join(words[i:j]))
+            offsets.append((spans[i][0], spans[j - 1][1]))
+    return phrases, offsets
+
+
+def find_fuzzy_matches(text, entities, threshold):
+    """
+    Find entities in text by exact match first, then by fuzzy ratio against n-grams.
+    Every exact occurrence is returned; all remaining entities are scored
+    against all candidate phrases in a single rapidfuzz cdist call.
+    Args:
+        text: The text to search in
+        entities: List of entities to find
+        threshold: Minimum fuzz.ratio score (0-100) for a fuzzy match
+    """
+    matches, remaining = split_exact_matches(text, entities)
+
+    if not remaining:
+        return matches
+
+    spans = tokenize_with_offsets(text)
+    phrases, offsets = build_candidates(text, spans, max_ngram_words(remaining))
+    if not phrases:
+        return matches
+
+    # Scores are rounded to whole percentages, so anything that rounds up to the
+    # threshold has to survive the cutoff.
+    scores = process.cdist(
+        [entity.lower() for entity in remaining],
+        phrases,
+        scorer=fuzz.ratio,
+        score_cutoff=max(threshold - 0.5, 0),
+        dtype=np.float32
+    )
+    ratios = np.rint(scores)
+
+    for entity_index, candidate_index in zip(*np.nonzero(ratios >= threshold)):
+        start, end = offsets[candidate_index]
+        matches.append({
+            'entity': remaining[entity_index],
+            'start': start,
+            'end': end,
+            'matched_text': text[start:end],
+            'similarity': float(ratios[entity_index, candidate_index]) / 100.0  # Convert to 0-1 scale
+        })
+
+    return matches
+
+
+def best_fuzzy_scores(text, entities):
+    """
+    Best rounded fuzz.ratio score (0-100) of each entity against the text's n-grams,
+    the score find_fuzzy_matches compares with its threshold. Entities with an
+    exact occurrence score 100, since they match at any threshold.
+    Returns:
+        Dict of entity -> score
+    """
+    matches, remaining = split_exact_matches(text, entities)
+    scores = {m['entity']: 100.0 for m in matches}
+    remaining = list(dict.fromkeys(remaining))
+    if not remaining:
+        return scores
+
+    spans = tokenize_with_offsets(text)
+    phrases, _ = build_candidates(text, spans, max_ngram_words(remaining))
+    if not phrases:
+        scores.update((entity, 0.0) for entity in remaining)
+        return scores
+    ratios = np.rint(process.cdist(
+        [entity.lower() for entity in remaining], phrases, scorer=fuzz.ratio, dtype=np.float32
+    ))
+    scores.update(zip(remaining, ratios.max(axis=1).tolist()))
+    return scores
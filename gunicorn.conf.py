@@ -0,0 +1,24 @@
+"""
+Gunicorn settings.
+
+With MODEL_LOAD_MODE=eager the app, including the sentence model, is loaded
+once in the master process and the forked workers share it copy-on-write:
+
+    MODEL_LOAD_MODE=eager gunicorn app:app
+
+In the default background mode every worker loads its own copy after it
+starts and serves /login, /review and fuzzy matching in the meantime.
+"""
+import gc
+import os
+
+bind = os.getenv('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+preload_app = os.getenv('MODEL_LOAD_MODE', 'background') == 'eager'
+
+
+def pre_fork(server, worker):
+    # Keep the GC from touching (and so copying) objects the master already
+    # allocated, such as the model's Python-side state
+    gc.freeze()
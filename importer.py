@@ -0,0 +1,238 @@
+"""
+Streaming JSONL import shared by the /import_database route and the CLI.
+
+Lines are parsed and validated one at a time and written in bounded batches
+with set-based inserts (one executemany per table per batch), so memory use
+does not grow with the size of the file; only the text_ids seen so far are
+kept, to report repeated ones the same way wherever they fall.
+
+Usage:
+    python importer.py database.jsonl [--batch-size 1000]
+"""
+import argparse
+import json
+import time
+
+from sqlalchemy import distinct, func, insert, select, update
+
+ENTITY_KEY = ['text_id', 'category', 'entity']  # Unique key of text_entity
+
+IMPORT_BATCH_SIZE = 1000  # Records per transaction
+MAX_REPORTED_ERRORS = 100  # Per-line errors kept in the report; the rest are only counted
+
+
+class ImportReport:
+    def __init__(self):
+        self.lines = 0
+        self.imported = 0
+        self.skipped_existing = 0
+        self.entities = 0
+        self.error_count = 0
+        self.errors = []
+        self.write_seconds = 0.0
+        self.started = time.perf_counter()
+
+    def add_error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def to_dict(self):
+        elapsed = self.elapsed
+        return {
+            'lines': self.lines,
+            'imported': self.imported,
+            'skipped_existing': self.skipped_existing,
+            'entities': self.entities,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'elapsed_s': round(elapsed, 2),
+            'records_per_s': round(self.lines / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+def validate_record(record):
+    """Return an error message for an invalid record, or None."""
+    if not isinstance(record, dict):
+        return "Record must be a JSON object"
+    text_id = record.get('text_id')
+    if text_id is None or str(text_id).strip() == '':
+        return "Missing text_id"
+    if len(str(text_id)) > 50:
+        return "text_id longer than 50 characters"
+    if not isinstance(record.get('text'), str) or not record['text'].strip():
+        return "Missing or empty text"
+    categories = {k: v for k, v in record.items() if k not in ["text", "text_id"]}
+    if not categories:
+        return "Record has no category fields"
+    for category, entities in categories.items():
+        if len(category) > 80:
+            return f"Category name longer than 80 characters: {category[:20]}..."
+        if not isinstance(entities, list) or not all(isinstance(e, str) for e in entities):
+            return f"Category '{category}' must be a list of strings"
+    return None
+
+
+def insert_ignoring_duplicates(session, table, index_elements):
+    """INSERT ... ON CONFLICT DO NOTHING where the dialect supports it, plain INSERT otherwise."""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(table)
+    return dialect_insert(table).on_conflict_do_nothing(index_elements=index_elements)
+
+
+def update_category_counts(session, text_table, entity_table, text_ids=None):
+    """Set text_index.category_count from text_entity for some text_ids, or for every text when None."""
+    count = select(func.count(distinct(entity_table.c.category))) \
+        .where(entity_table.c.text_id == text_table.c.text_id).scalar_subquery()
+    statement = update(text_table).values(category_count=count)
+    if text_ids is not None:
+        statement = statement.where(text_table.c.text_id.in_(text_ids))
+    session.execute(statement)
+
+
+def _write_batch(session, text_table, entity_table, batch, report):
+    """Insert the texts of a batch that are not in the database yet, with their entities."""
+    started = time.perf_counter()
+    ids = [record['text_id'] for record in batch]
+    existing = {
+        text_id for (text_id,) in session.execute(
+            select(text_table.c.text_id).where(text_table.c.text_id.in_(ids))
+        )
+    }
+    new_records = [record for record in batch if record['text_id'] not in existing]
+    report.skipped_existing += len(batch) - len(new_records)
+    if new_records:
+        session.execute(
+            insert_ignoring_duplicates(session, text_table, ['text_id']),
+            [{'text_id': r['text_id'], 'text': r['text']} for r in new_records]
+        )
+        # dict.fromkeys drops entities repeated within a category but keeps their order
+        entity_rows = [
+            {'text_id': text_id, 'category': category, 'entity': entity}
+            for text_id, category, entity in dict.fromkeys(
+                (r['text_id'], category, entity)
+                for r in new_records
+                for category, entities in r.items() if category not in ["text", "text_id"]
+                for entity in entities
+            )
+        ]
+        if entity_rows:
+            session.execute(insert_ignoring_duplicates(session, entity_table, ENTITY_KEY), entity_rows)
+            update_category_counts(session, text_table, entity_table, [r['text_id'] for r in new_records])
+        report.entities += len(entity_rows)
+    session.commit()
+    report.imported += len(new_records)
+    report.write_seconds += time.perf_counter() - started
+
+
+def iter_import(lines, session, text_table, entity_table, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Import JSONL records into the text and entity tables, yielding the running
+    ImportReport after every committed batch. Existing text_ids are left untouched;
+    a text_id repeated within the file is an error on every line after the first.
+    Args:
+        lines: Iterable of JSONL lines (str or bytes)
+        session: SQLAlchemy session
+        text_table: The text_index Table
+        entity_table: The text_entity Table
+        batch_size: Records per transaction
+    """
+    report = ImportReport()
+    batch = []
+    seen = set()  # Every text_id of the file so far, not just of the current batch
+
+    for line_number, line in enumerate(lines, start=1):
+        report.lines = line_number
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            report.add_error(line_number, f"Invalid JSON: {e.msg}")
+            continue
+        error = validate_record(record)
+        if error:
+            report.add_error(line_number, error)
+            continue
+
+        record['text_id'] = str(record['text_id'])
+        if record['text_id'] in seen:
+            report.add_error(line_number, f"Duplicate text_id {record['text_id']} in file")
+            continue
+        seen.add(record['text_id'])
+        batch.append(record)
+
+        if len(batch) >= batch_size:
+            _write_batch(session, text_table, entity_table, batch, report)
+            batch = []
+            yield report
+
+    # Always finish with a report, even for files without a full batch or any valid line
+    if batch or report.imported + report.skipped_existing == 0:
+        if batch:
+            _write_batch(session, text_table, entity_table, batch, report)
+        yield report
+
+
+def stream_import(lines, session, text_table, entity_table, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Run iter_import to completion.
+    Args:
+        progress: Optional callable receiving the ImportReport after every batch
+    Returns:
+        ImportReport
+    """
+    report = None
+    for report in iter_import(lines, session, text_table, entity_table, batch_size):
+        if progress:
+            progress(report)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a JSONL file into the text and entity tables.")
+    parser.add_argument('input', help="JSONL file with text_id, text and category fields")
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help="Records per transaction")
+    args = parser.parse_args()
+
+    from flask import Flask
+    from migrations import upgrade
+    from models import configure_database, db, TextIndex, TextEntity
+
+    app = Flask(__name__)
+    configure_database(app)  # Only the database: importing app.py would load the model
+
+    def print_progress(report):
+        print(f"{report.lines} lines, {report.imported} imported, {report.error_count} errors, "
+              f"{report.lines / report.elapsed:.0f} records/sec")
+
+    with app.app_context():
+        upgrade(db.engine)
+        with open(args.input, 'r', encoding='utf-8') as f:
+            report = stream_import(
+                f, db.session, TextIndex.__table__, TextEntity.__table__,
+                batch_size=args.batch_size, progress=print_progress
+            )
+    for error in report.errors:
+        print(f"Line {error['line']}: {error['error']}")
+    if report.error_count > len(report.errors):
+        print(f"... and {report.error_count - len(report.errors)} more errors")
+    summary = report.to_dict()
+    print(f"✅ Imported {summary['imported']} texts and {summary['entities']} entities "
+          f"({summary['skipped_existing']} already existed, {summary['error_count']} invalid lines) "
+          f"in {summary['elapsed_s']}s, {summary['records_per_s']} records/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotReady(Exception):
+    """Raised when the model is still loading (or failed to load) and the caller cannot wait."""
+
+
+class ModelLoader:
+    """
+    Loads a model off the request path and proxies encode() to it once ready.
+
+    `factory` is only called once; heavy imports (torch, sentence_transformers)
+    belong inside it so that importing the app stays fast.
+    Args:
+        factory: Zero-argument callable returning the model
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._model = None
+        self._error = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.load_seconds = None
+
+    @property
+    def state(self):
+        if self._ready.is_set():
+            return 'failed' if self._error else 'ready'
+        return 'loading' if self._thread is not None else 'not_started'
+
+    @property
+    def ready(self):
+        return self._ready.is_set() and self._error is None
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            self._model = self.factory()
+        except Exception as e:
+            self._error = e
+        self.load_seconds = time.perf_counter() - started
+        self._ready.set()
+
+    def start(self):
+        """Start loading in a background thread (no-op if already started)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name='model-loader', daemon=True)
+                self._thread.start()
+
+    def load(self):
+        """Load synchronously in the calling thread, e.g. in a pre-fork master process."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.current_thread()
+                self._load()
+        return self.get()
+
+    def get(self, timeout=None):
+        """Return the model, starting the load if needed and waiting up to `timeout` seconds."""
+        self.start()
+        if not self._ready.wait(timeout):
+            raise ModelNotReady('Model is still loading')
+        if self._error is not None:
+            raise ModelNotReady(f'Model failed to load: {self._error}')
+        return self._model
+
+    def encode(self, *args, **kwargs):
+        return self.get().encode(*args, **kwargs)
+
+    def get_sentence_embedding_dimension(self):
+        return self.get().get_sentence_embedding_dimension()
+
+
+class EncodeBatcher:
+    """
+    Micro-batching front end for a SentenceTransformer-compatible model.
+
+    Concurrent callers submit lists of strings and get futures back. A single
+    worker thread collects requests for up to `max_wait_ms` (or until
+    `max_batch_size` strings are queued), runs one forward pass over all of
+    them and hands every caller its own slice of the result.
+
+    The batcher exposes encode() and get_sentence_embedding_dimension(), so it
+    can be passed anywhere a model is expected (e.g. EmbeddingCache.encode).
+    Args:
+        model: Object with a SentenceTransformer-style encode()
+        max_batch_size: Strings per forward pass before a batch is closed early
+        max_wait_ms: How long the first request of a batch waits for company
+        on_batch: Optional callable(batch size, seconds) invoked after every forward pass
+        timeout: Seconds encode() waits for its result before raising TimeoutError; None waits forever
+    """
+
+    def __init__(self, model, max_batch_size=64, max_wait_ms=5, on_batch=None, timeout=60):
+        self.model = model
+        self.on_batch = on_batch
+        self.timeout = timeout
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(), so each worker process starts its own
+        if self._worker is not None and self._pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or self._pid != os.getpid() or not self._worker.is_alive():
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name='encode-batcher', daemon=True)
+                self._worker.start()
+
+    def submit(self, texts):
+        """Queue a list of strings for encoding; returns a Future of a (len(texts), dim) array."""
+        future = Future()
+        if not texts:
+            future.set_result(np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32))
+            return future
+        self._ensure_worker()
+        self._queue.put((list(texts), future))
+        return future
+
+    def encode(self, sentences, batch_size=None, convert_to_numpy=True, **kwargs):
+        """
+        Blocking, model.encode-compatible wrapper around submit().
+        Raises:
+            concurrent.futures.TimeoutError: No result within `timeout` seconds (the request
+                is cancelled if its batch has not started yet)
+        """
+        single = isinstance(sentences, str)
+        future = self.submit([sentences] if single else sentences)
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+        return result[0] if single else result
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or the window closes."""
+        requests = [self._queue.get()]
+        size = len(requests[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            requests.append(request)
+            size += len(request[0])
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._collect()
+            # Drop callers that gave up before their batch started
+            requests = [(texts, future) for texts, future in requests if future.set_running_or_notify_cancel()]
+            if not requests:
+                continue
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            started = time.perf_counter()
+            # Nothing may escape: this is the only worker, and a dead worker leaves every caller waiting
+            try:
+                embeddings = np.asarray(
+                    self.model.encode(texts, batch_size=self.max_batch_size, convert_to_numpy=True),
+                    dtype=np.float32
+                )
+                offset = 0
+                for request_texts, future in requests:
+                    future.set_result(embeddings[offset:offset + len(request_texts)])
+                    offset += len(request_texts)
+                self.batches += 1
+                self.items += len(texts)
+                if self.on_batch:
+                    self.on_batch(len(texts), time.perf_counter() - started)
+            except Exception as e:
+                failed = [future for _, future in requests if not future.done()]
+                for future in failed:
+                    future.set_exception(e)
+                if not failed:  # Only the on_batch hook failed; the callers have their results
+                    logger.exception('encode batch hook failed')
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+            'queued_requests': self._queue.qsize(),
+        }
@@ -1,55 +1,67 @@
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///entities.db'
-db = SQLAlchemy(app)
-
-# Models
-class TextIndex(db.Model):
-    text_id = db.Column(db.String, primary_key=True)  # Primary key must be set
-    text = db.Column(db.Text, nullable=False)
-    __table_args__ = (
-        db.UniqueConstraint('text_id', 'text', name='unique_text_id'),
-    )
+from importer import ENTITY_KEY, insert_ignoring_duplicates, stream_import, update_category_counts
+from migrations import upgrade
+from models import db, configure_database, TextIndex, TextEntity
 
+app = Flask(__name__)
+configure_database(app)
 
-# Load records function
-def load_all_records_from_jsonl():
-    import json
-    records = []
-    with open("database.jsonl", "r", encoding="utf-8") as f:
-        for line in f:
-            records.append(json.loads(line))
-    return records
+DATA_FILE = "database.jsonl"
+ENTITY_BATCH_SIZE = 5000
 
 # Initialize only once
 def initialize_texts_once():
     if TextIndex.query.first():  # Already initialized
         return
-    records = load_all_records_from_jsonl()
-    
-    # Build set of new unique (text_id, text) pairs
-    existing_pairs = {(t.text_id, t.text) for t in TextIndex.query.all()}
-    new_records = [
-        TextIndex(text_id=record['text_id'], text=record['text'])
-        for record in records
-        if (record['text_id'], record['text']) not in existing_pairs
-    ]
-    
-    db.session.add_all(new_records)
+    with open(DATA_FILE, "r", encoding="utf-8") as f:
+        report = stream_import(f, db.session, TextIndex.__table__, TextEntity.__table__)
+    print(f"✅ Initialized {report.imported} new text records with {report.entities} entities.")
+    for error in report.errors:
+        print(f"Line {error['line']}: {error['error']}")
+
+# Build the (text_id, category, entity) lookup table once, for databases
+# whose texts were imported before entities were stored
+def initialize_entities_once():
+    if TextEntity.query.first():  # Already initialized
+        return
+    import json
+    count = 0
+    rows = []
+    with open(DATA_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for category, entities in record.items():
+                if category in ["text", "text_id"] or not isinstance(entities, list):
+                    continue
+                rows.extend(
+                    {'text_id': str(record['text_id']), 'category': category, 'entity': entity}
+                    for entity in entities
+                )
+            if len(rows) >= ENTITY_BATCH_SIZE:
+                db.session.execute(insert_ignoring_duplicates(db.session, TextEntity.__table__, ENTITY_KEY), rows)
+                count += len(rows)
+                rows = []
+    if rows:
+        db.session.execute(insert_ignoring_duplicates(db.session, TextEntity.__table__, ENTITY_KEY), rows)
+        count += len(rows)
+    update_category_counts(db.session, TextIndex.__table__, TextEntity.__table__)
     db.session.commit()
-    print(f"✅ Initialized {len(new_records)} new text records.")
+    print(f"✅ Initialized {count} entity records.")
 
 # Manual init route
 @app.route('/init_texts')
 def init_texts_route():
     initialize_texts_once()
+    initialize_entities_once()
     return "Texts initialized."
 
 # Run app
 if __name__ == "__main__":
     with app.app_context():
-        db.create_all()  # Ensure tables exist
+        upgrade(db.engine)  # Ensure tables exist and are up to date
         initialize_texts_once()
+        initialize_entities_once()
     app.run(debug=True)
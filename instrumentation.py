@@ -0,0 +1,178 @@
+"""
+Structured logging, stage timers, Prometheus-format metrics and slow-request profiling.
+
+Metrics are kept per process and rendered in the Prometheus text exposition
+format, so /metrics needs no extra dependency. Under gunicorn every worker
+reports its own series; scrape them per worker or aggregate in Prometheus.
+"""
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond regex work up to slow model loads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line with the level, logger, message and any `extra` fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((k, v) for k, v in vars(record).items() if k not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(logger, level='INFO', fmt='json'):
+    """Send `logger` to stderr at `level`, as JSON lines ('json') or plain text ('text')."""
+    handler = logging.StreamHandler()
+    if fmt == 'json':
+        handler.setFormatter(JsonLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    logger.handlers[:] = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{str(v)}"'.replace('\n', ' ') for k, v in labels) + '}'
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with optional labels.
+    Args:
+        name: Metric name
+        documentation: HELP text
+        labelnames: Label names; observe() takes their values in the same order
+        buckets: Upper bounds of the buckets (+Inf is added)
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: (list(s[0]), s[1], s[2]) for labels, s in self._series.items()}
+        for labelvalues, (counts, total, count) in sorted(series.items()):
+            labels = list(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_format_labels(labels + [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(labels + [("le", "+Inf")])} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return '\n'.join(lines)
+
+
+def render_sample(name, documentation, metric_type, samples):
+    """
+    Render a counter or gauge whose values are read at scrape time.
+    Args:
+        samples: List of (labels dict, value)
+    """
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {metric_type}']
+    lines.extend(f'{name}{_format_labels(sorted(labels.items()))} {value}' for labels, value in samples)
+    return '\n'.join(lines)
+
+
+STAGE_SECONDS = Histogram(
+    'clinmatch_stage_seconds', 'Time spent per processing stage (stages may nest, e.g. encode inside span_match)',
+    labelnames=('stage',)
+)
+REQUEST_SECONDS = Histogram(
+    'clinmatch_request_seconds', 'Request latency by endpoint, HTTP method and status',
+    labelnames=('endpoint', 'method', 'status')
+)
+ENCODE_BATCH_SIZE = Histogram(
+    'clinmatch_encode_batch_size', 'Strings per coalesced model forward pass', buckets=BATCH_SIZE_BUCKETS
+)
+ENCODE_BATCH_SECONDS = Histogram('clinmatch_encode_batch_seconds', 'Duration of each model forward pass')
+
+
+@contextmanager
+def timed(stage):
+    """Observe the duration of the block in clinmatch_stage_seconds{stage=...}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage)
+
+
+def observe_encode_batch(size, seconds):
+    """EncodeBatcher callback recording batch sizes and forward-pass durations."""
+    ENCODE_BATCH_SIZE.observe(size)
+    ENCODE_BATCH_SECONDS.observe(seconds)
+
+
+class SlowRequestProfiler:
+    """
+    Profile requests with cProfile and keep the report of those slower than a threshold.
+    Only the request thread is profiled; reports go to `directory` as
+    <unix ms>-<endpoint>.prof (load with pstats or snakeviz).
+    Args:
+        directory: Output directory for .prof files
+        threshold_ms: Requests at least this slow are dumped
+    """
+
+    def __init__(self, directory, threshold_ms):
+        self.directory = directory
+        self.threshold = threshold_ms / 1000.0
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # Another profiler is already active in this interpreter
+            return None
+        return profiler
+
+    def finish(self, profiler, endpoint, seconds):
+        """Stop `profiler`; returns the report path if the request was slow, else None."""
+        if profiler is None:
+            return None
+        profiler.disable()
+        if seconds < self.threshold:
+            return None
+        path = os.path.join(self.directory, f"{int(time.time() * 1000)}-{endpoint}.prof")
+        profiler.dump_stats(path)
+        return path
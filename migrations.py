@@ -0,0 +1,379 @@
+"""
+Versioned schema migrations.
+
+The schema_version table records the last applied migration. upgrade() runs
+the pending ones in order and bumps the version after each. Every migration
+inspects the live schema before changing it, so databases created by
+db.create_all() or by older releases of the app converge on the same schema.
+
+Migrations never use models.py or the application code: each one carries its
+table definitions and SQL as they were at its version, so replaying it on an
+old database does the same thing today as when it was released. Derived data
+that only the application can compute (the analytics aggregates) is marked
+stale by its migration and recomputed with the current code once the schema
+has reached the latest version.
+
+Usage:
+    python migrations.py upgrade
+    python migrations.py current
+"""
+import argparse
+import json
+
+from flask import Flask
+from sqlalchemy import (
+    Column, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text, UniqueConstraint,
+    bindparam, delete, inspect, select, text
+)
+from sqlalchemy.orm import Session
+
+from analytics import rebuild as rebuild_analytics
+from models import configure_database, db
+
+version_metadata = MetaData()
+schema_version = Table('schema_version', version_metadata, Column('version', Integer, nullable=False))
+# Derived data to recompute with the current code once the schema is at the latest version
+stale_data = Table('schema_stale_data', version_metadata, Column('name', String(40), primary_key=True))
+REFRESHES = {'analytics': rebuild_analytics}
+
+# Tables as of migration 1, the first versioned release
+schema_v1 = MetaData()
+Table(
+    'user', schema_v1,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(80), unique=True, nullable=False),
+    Column('password', String(120), nullable=False),
+)
+Table(
+    'text_index', schema_v1,
+    Column('id', Integer, primary_key=True),
+    Column('text_id', String(50), unique=True, nullable=False),
+    Column('text', Text, nullable=False),
+)
+Table(
+    'text_entity', schema_v1,
+    Column('id', Integer, primary_key=True),
+    Column('text_id', String(50), nullable=False),
+    Column('category', String(80), nullable=False),
+    Column('entity', Text, nullable=False),
+    Index('ix_text_entity_text_id_category', 'text_id', 'category'),
+)
+match_result_v1 = Table(
+    'match_result', schema_v1,
+    Column('id', Integer, primary_key=True),
+    Column('text_id', Integer, ForeignKey('text_index.id'), nullable=False),
+    Column('category', String(80), nullable=False),
+    Column('entities', Text, nullable=False),
+    Column('matched', Text, nullable=True),
+    Column('unmatched', Text, nullable=True),
+    Column('undetected_entity', Text, nullable=True),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    UniqueConstraint('user_id', 'text_id', 'category', name='unique_annotation'),
+    Index('ix_match_result_text_id', 'text_id'),
+)
+Table(
+    'precomputed_match', schema_v1,
+    Column('id', Integer, primary_key=True),
+    Column('text_id', String(50), nullable=False),
+    Column('category', String(80), nullable=False),
+    Column('method', String(20), nullable=False),
+    Column('threshold', Float, nullable=False),
+    Column('entities', Text, nullable=False),
+    Column('matches', Text, nullable=False),
+    UniqueConstraint('text_id', 'category', 'method', name='unique_precomputed_match'),
+)
+
+
+def referenced_tables(metadata):
+    """Key-only stand-ins for the tables later migrations reference; never created."""
+    Table('user', metadata, Column('id', Integer, primary_key=True))
+    Table('text_index', metadata, Column('id', Integer, primary_key=True))
+    return metadata
+
+
+# Tables added by migration 6
+schema_v6 = referenced_tables(MetaData())
+analytics_tables_v6 = [
+    Table(
+        'annotator_stats', schema_v6,
+        Column('user_id', Integer, ForeignKey('user.id'), primary_key=True),
+        Column('category', String(80), primary_key=True),
+        *(Column(name, Integer, nullable=False, default=0)
+          for name in ('annotations', 'matched', 'unmatched', 'undetected')),
+    ),
+    Table(
+        'agreement_stats', schema_v6,
+        Column('category', String(80), primary_key=True),
+        Column('user_a', Integer, ForeignKey('user.id'), primary_key=True),
+        Column('user_b', Integer, ForeignKey('user.id'), primary_key=True),
+        *(Column(name, Integer, nullable=False, default=0)
+          for name in ('both_matched', 'both_unmatched', 'only_a_matched', 'only_b_matched')),
+    ),
+    Table(
+        'text_category_stats', schema_v6,
+        Column('text_id', Integer, ForeignKey('text_index.id'), primary_key=True),
+        Column('category', String(80), primary_key=True),
+        *(Column(name, Integer, nullable=False, default=0) for name in ('annotators', 'agreed', 'disagreed')),
+        Index('ix_text_category_stats_disagreed', 'disagreed', 'text_id', 'category'),
+    ),
+    Table(
+        'matcher_stats', schema_v6,
+        Column('category', String(80), primary_key=True),
+        Column('method', String(20), primary_key=True),
+        *(Column(name, Integer, nullable=False, default=0)
+          for name in ('true_positives', 'false_positives', 'false_negatives', 'true_negatives')),
+    ),
+]
+
+# Tables added by migration 7
+schema_v7 = referenced_tables(MetaData())
+calibration_tables_v7 = [
+    Table(
+        'calibration_queue', schema_v7,
+        Column('text_id', Integer, ForeignKey('text_index.id'), primary_key=True),
+        Column('category', String(80), primary_key=True),
+        Column('version', Integer, nullable=False, default=0),
+    ),
+    Table(
+        'calibration_sample', schema_v7,
+        Column('text_id', Integer, ForeignKey('text_index.id'), primary_key=True),
+        Column('category', String(80), primary_key=True),
+        Column('method', String(20), primary_key=True),
+        Column('entity', Text, primary_key=True),
+        Column('score', Float, nullable=False),
+        Column('positives', Integer, nullable=False, default=0),
+        Column('negatives', Integer, nullable=False, default=0),
+    ),
+    Table(
+        'calibration_histogram', schema_v7,
+        Column('category', String(80), primary_key=True),
+        Column('method', String(20), primary_key=True),
+        Column('bin', Integer, primary_key=True),
+        Column('positives', Integer, nullable=False, default=0),
+        Column('negatives', Integer, nullable=False, default=0),
+    ),
+    Table(
+        'match_threshold', schema_v7,
+        Column('category', String(80), primary_key=True),
+        Column('method', String(20), primary_key=True),
+        *(Column(name, Float, nullable=False) for name in ('threshold', 'f1', 'precision', 'recall')),
+        Column('positives', Integer, nullable=False),
+        Column('negatives', Integer, nullable=False),
+        Column('updated_at', Float, nullable=False),
+    ),
+]
+
+
+def mark_stale(conn, name):
+    """Have upgrade() recompute derived data `name` (a REFRESHES key) with the current code."""
+    if conn.execute(select(stale_data.c.name).where(stale_data.c.name == name)).first() is None:
+        conn.execute(stale_data.insert().values(name=name))
+
+
+def create_tables(conn):
+    """Create the tables of the first versioned schema that do not exist yet."""
+    schema_v1.create_all(conn)
+
+
+def match_result_text_pk(conn):
+    """match_result.text_id becomes an integer foreign key to text_index.id (the value it always held)."""
+    columns = {c['name']: c for c in inspect(conn).get_columns('match_result')}
+    if isinstance(columns['text_id']['type'], Integer):
+        return
+
+    if conn.dialect.name == 'sqlite':
+        # SQLite cannot alter a column type: rebuild the table and copy the rows over
+        conn.execute(text('ALTER TABLE match_result RENAME TO match_result_old'))
+        match_result_v1.create(conn)
+        conn.execute(text(
+            'INSERT INTO match_result (id, text_id, category, entities, matched, unmatched, undetected_entity, user_id) '
+            'SELECT id, CAST(text_id AS INTEGER), category, entities, matched, unmatched, undetected_entity, user_id '
+            'FROM match_result_old'
+        ))
+        conn.execute(text('DROP TABLE match_result_old'))
+    elif conn.dialect.name == 'postgresql':
+        for fk in inspect(conn).get_foreign_keys('match_result'):
+            if fk['constrained_columns'] == ['text_id']:
+                conn.execute(text(f'ALTER TABLE match_result DROP CONSTRAINT {fk["name"]}'))
+        conn.execute(text('ALTER TABLE match_result ALTER COLUMN text_id TYPE INTEGER USING text_id::integer'))
+        conn.execute(text(
+            'ALTER TABLE match_result ADD CONSTRAINT match_result_text_id_fkey '
+            'FOREIGN KEY (text_id) REFERENCES text_index (id)'
+        ))
+    else:
+        raise RuntimeError(f"No match_result.text_id migration for {conn.dialect.name}")
+
+
+def match_result_indexes(conn):
+    """Index match_result on (user_id, text_id, category) and on text_id."""
+    inspector = inspect(conn)
+    covered = [index['column_names'] for index in inspector.get_indexes('match_result')]
+    covered += [constraint['column_names'] for constraint in inspector.get_unique_constraints('match_result')]
+    if ['user_id', 'text_id', 'category'] not in covered:
+        conn.execute(text(
+            'CREATE INDEX ix_match_result_user_id_text_id_category ON match_result (user_id, text_id, category)'
+        ))
+    if not any(columns[:1] == ['text_id'] for columns in covered):
+        conn.execute(text('CREATE INDEX ix_match_result_text_id ON match_result (text_id)'))
+
+
+def match_result_json_lists(conn, batch_size=1000):
+    """Rewrite comma-joined entity lists saved by older releases as JSON arrays."""
+    fields = ('entities', 'matched', 'unmatched', 'undetected_entity')
+    table = match_result_v1
+
+    def to_json(value):
+        if value is None or value.startswith('['):
+            return value
+        return json.dumps(value.split(', ') if value else [])
+
+    statement = table.update().where(table.c.id == bindparam('row_id')).values(
+        {field: bindparam(f'new_{field}') for field in fields}
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(table.c.id, *(table.c[field] for field in fields))
+            .where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        updates = [
+            dict({f'new_{field}': to_json(value) for field, value in zip(fields, row[1:])}, row_id=row[0])
+            for row in rows
+            if any(value is not None and not value.startswith('[') for value in row[1:])
+        ]
+        if updates:
+            conn.execute(statement, updates)
+        last_id = rows[-1][0]
+
+
+def match_result_keyset_index(conn):
+    """Index match_result on (user_id, id) for keyset pagination."""
+    if not any(index['column_names'] == ['user_id', 'id'] for index in inspect(conn).get_indexes('match_result')):
+        conn.execute(text('CREATE INDEX ix_match_result_user_id_id ON match_result (user_id, id)'))
+
+
+def analytics_tables(conn):
+    """Create the analytics aggregate tables; they are filled from the existing annotations after upgrading."""
+    for table in analytics_tables_v6:
+        table.create(conn, checkfirst=True)
+    mark_stale(conn, 'analytics')
+
+
+def calibration_tables(conn):
+    """Create the threshold calibration tables and queue the existing annotations for calibration."""
+    for table in calibration_tables_v7:
+        table.create(conn, checkfirst=True)
+        conn.execute(delete(table))
+    conn.execute(text(
+        'INSERT INTO calibration_queue (text_id, category, version) '
+        'SELECT text_id, category, 0 FROM match_result GROUP BY text_id, category'
+    ))
+
+
+def text_index_category_count(conn):
+    """Store each text's number of entity categories on text_index for the text listing."""
+    if 'category_count' not in {c['name'] for c in inspect(conn).get_columns('text_index')}:
+        conn.execute(text('ALTER TABLE text_index ADD COLUMN category_count INTEGER NOT NULL DEFAULT 0'))
+    conn.execute(text(
+        'UPDATE text_index SET category_count = (SELECT count(DISTINCT category) FROM text_entity '
+        'WHERE text_entity.text_id = text_index.text_id)'
+    ))
+
+
+def text_entity_unique_key(conn):
+    """Drop duplicate text_entity rows left by re-imports and add the (text_id, category, entity) unique key."""
+    inspector = inspect(conn)
+    covered = [constraint['column_names'] for constraint in inspector.get_unique_constraints('text_entity')]
+    covered += [index['column_names'] for index in inspector.get_indexes('text_entity') if index['unique']]
+    if ['text_id', 'category', 'entity'] in covered:
+        return
+    conn.execute(text(
+        'DELETE FROM text_entity WHERE id NOT IN '
+        '(SELECT min(id) FROM text_entity GROUP BY text_id, category, entity)'
+    ))
+    conn.execute(text('CREATE UNIQUE INDEX unique_text_entity ON text_entity (text_id, category, entity)'))
+
+
+# Append new migrations at the end; never reorder or remove released ones
+MIGRATIONS = [
+    (1, 'create tables', create_tables),
+    (2, 'match_result.text_id references text_index.id', match_result_text_pk),
+    (3, 'match_result indexes', match_result_indexes),
+    (4, 'match_result entity lists as JSON', match_result_json_lists),
+    (5, 'match_result (user_id, id) index', match_result_keyset_index),
+    (6, 'analytics aggregates', analytics_tables),
+    (7, 'threshold calibration', calibration_tables),
+    (8, 'text_index.category_count', text_index_category_count),
+    (9, 'text_entity unique key', text_entity_unique_key),
+]
+
+
+def current_version(conn):
+    if not inspect(conn).has_table('schema_version'):
+        return 0
+    return conn.execute(select(schema_version.c.version)).scalar() or 0
+
+
+def upgrade(engine, target=None):
+    """
+    Apply pending migrations up to `target` (default: latest), one transaction each, then
+    recompute the derived data they marked stale if the schema is at the latest version.
+    Returns:
+        List of applied migration versions
+    """
+    with engine.begin() as conn:
+        version_metadata.create_all(conn)
+        if conn.execute(select(schema_version.c.version)).first() is None:
+            conn.execute(schema_version.insert().values(version=0))
+
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        with engine.begin() as conn:
+            if current_version(conn) >= version:
+                continue
+            print(f"Applying migration {version}: {description}")
+            migrate(conn)
+            conn.execute(schema_version.update().values(version=version))
+        applied.append(version)
+
+    with engine.begin() as conn:
+        if current_version(conn) < MIGRATIONS[-1][0]:
+            return applied  # The current code only runs against the latest schema
+        stale = [name for (name,) in conn.execute(select(stale_data.c.name).order_by(stale_data.c.name))]
+    for name in stale:
+        with engine.begin() as conn:
+            print(f"Recomputing {name}")
+            with Session(bind=conn) as session:
+                REFRESHES[name](session)
+                session.flush()
+            conn.execute(delete(stale_data).where(stale_data.c.name == name))
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the database schema version.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    upgrade_parser = subparsers.add_parser('upgrade', help="Apply pending migrations")
+    upgrade_parser.add_argument('--target', type=int, default=None, help="Stop after this version")
+    subparsers.add_parser('current', help="Print the applied schema version")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    configure_database(app)
+    with app.app_context():
+        if args.command == 'upgrade':
+            applied = upgrade(db.engine, args.target)
+            with db.engine.connect() as conn:
+                version = current_version(conn)
+            print(f"✅ Schema at version {version} ({len(applied)} migrations applied)")
+        else:
+            with db.engine.connect() as conn:
+                print(current_version(conn))
+
+
+if __name__ == "__main__":
+    main()
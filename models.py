@@ -0,0 +1,215 @@
+"""
+Database models and engine configuration shared by app.py, init_db.py and the CLIs.
+
+SQLite connections get WAL journaling, synchronous=NORMAL and a busy timeout
+so concurrent annotators do not hit 'database is locked'; embedding_cache.py
+applies the same settings to its own file. PostgreSQL gets a
+sized, pre-pinged connection pool.
+"""
+import os
+import sqlite3
+
+from dotenv import load_dotenv
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+load_dotenv()  # The settings below may come from .env, also for init_db.py and the CLIs
+
+DEFAULT_DATABASE_URI = 'sqlite:///entities.db'
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))              # Persistent connections per process
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))        # Extra connections under bursts
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))        # Seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))      # Seconds before a connection is replaced
+
+db = SQLAlchemy()
+
+
+def apply_sqlite_pragmas(connection):
+    """Set the busy timeout, journal mode and synchronous level on a sqlite3 connection."""
+    cursor = connection.cursor()
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.execute(f'PRAGMA journal_mode={SQLITE_JOURNAL_MODE}')
+    cursor.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+    cursor.close()
+
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        apply_sqlite_pragmas(dbapi_connection)
+
+
+def engine_options(uri):
+    """Return SQLALCHEMY_ENGINE_OPTIONS for a database URI."""
+    if uri.startswith('sqlite'):
+        return {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    if uri.startswith('postgresql'):
+        return {
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': DB_MAX_OVERFLOW,
+            'pool_timeout': DB_POOL_TIMEOUT,
+            'pool_recycle': DB_POOL_RECYCLE,
+            'pool_pre_ping': True,
+        }
+    return {}
+
+
+def configure_database(app):
+    """Point `app` at DATABASE_URI with the engine options of its backend and bind `db` to it."""
+    uri = os.getenv('DATABASE_URI', DEFAULT_DATABASE_URI)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(uri)
+    db.init_app(app)
+
+
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password = db.Column(db.String(120), nullable=False)
+
+class TextIndex(db.Model):
+    __tablename__ = 'text_index'
+    id = db.Column(db.Integer, primary_key=True)
+    text_id = db.Column(db.String(50), unique=True, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    # Distinct categories of the text in text_entity, kept by the code that inserts entities
+    category_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+class TextEntity(db.Model):
+    __tablename__ = 'text_entity'
+    id = db.Column(db.Integer, primary_key=True)
+    text_id = db.Column(db.String(50), nullable=False)
+    category = db.Column(db.String(80), nullable=False)
+    entity = db.Column(db.Text, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_text_entity_text_id_category', 'text_id', 'category'),
+        # Re-imports and repeated saves insert with ON CONFLICT DO NOTHING against this key
+        db.UniqueConstraint('text_id', 'category', 'entity', name='unique_text_entity'),
+    )
+
+class MatchResult(db.Model):
+    __tablename__ = 'match_result'
+    id = db.Column(db.Integer, primary_key=True)
+    text_id = db.Column(db.Integer, db.ForeignKey('text_index.id'), nullable=False)  # TextIndex.id
+    category = db.Column(db.String(80), nullable=False)
+    entities = db.Column(db.Text, nullable=False)            # JSON-encoded list
+    matched = db.Column(db.Text, nullable=True)              # JSON-encoded list
+    unmatched = db.Column(db.Text, nullable=True)            # JSON-encoded list
+    undetected_entity = db.Column(db.Text, nullable=True)    # JSON-encoded list
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+    text = db.relationship('TextIndex', backref='match_results')
+
+    __table_args__ = (
+        # Also serves as the (user_id, text_id, category) lookup index
+        db.UniqueConstraint('user_id', 'text_id', 'category', name='unique_annotation'),
+        db.Index('ix_match_result_text_id', 'text_id'),
+        # Keyset pagination of a user's annotations in id order
+        db.Index('ix_match_result_user_id_id', 'user_id', 'id'),
+    )
+
+class PrecomputedMatch(db.Model):
+    __tablename__ = 'precomputed_match'
+    id = db.Column(db.Integer, primary_key=True)
+    text_id = db.Column(db.String(50), nullable=False)
+    category = db.Column(db.String(80), nullable=False)
+    method = db.Column(db.String(20), nullable=False)
+    threshold = db.Column(db.Float, nullable=False)
+    entities = db.Column(db.Text, nullable=False)  # JSON-encoded list
+    matches = db.Column(db.Text, nullable=False)   # JSON-encoded list
+
+    __table_args__ = (
+        db.UniqueConstraint('text_id', 'category', 'method', name='unique_precomputed_match'),
+    )
+
+# Analytics aggregates (analytics.py), kept up to date by /save and /delete
+
+class AnnotatorStats(db.Model):
+    __tablename__ = 'annotator_stats'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    category = db.Column(db.String(80), primary_key=True)
+    annotations = db.Column(db.Integer, nullable=False, default=0)
+    matched = db.Column(db.Integer, nullable=False, default=0)
+    unmatched = db.Column(db.Integer, nullable=False, default=0)
+    undetected = db.Column(db.Integer, nullable=False, default=0)
+
+class AgreementStats(db.Model):
+    """Verdicts of two annotators (user_a < user_b) on the entities both labelled: Cohen's kappa inputs."""
+    __tablename__ = 'agreement_stats'
+    category = db.Column(db.String(80), primary_key=True)
+    user_a = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    user_b = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    both_matched = db.Column(db.Integer, nullable=False, default=0)
+    both_unmatched = db.Column(db.Integer, nullable=False, default=0)
+    only_a_matched = db.Column(db.Integer, nullable=False, default=0)
+    only_b_matched = db.Column(db.Integer, nullable=False, default=0)
+
+class TextCategoryStats(db.Model):
+    __tablename__ = 'text_category_stats'
+    text_id = db.Column(db.Integer, db.ForeignKey('text_index.id'), primary_key=True)  # TextIndex.id
+    category = db.Column(db.String(80), primary_key=True)
+    annotators = db.Column(db.Integer, nullable=False, default=0)
+    agreed = db.Column(db.Integer, nullable=False, default=0)       # Entities labelled alike by 2+ annotators
+    disagreed = db.Column(db.Integer, nullable=False, default=0)    # Entities labelled both ways
+
+    __table_args__ = (
+        # Most disputed notes first on the dashboard
+        db.Index('ix_text_category_stats_disagreed', 'disagreed', 'text_id', 'category'),
+    )
+
+class MatcherStats(db.Model):
+    __tablename__ = 'matcher_stats'
+    category = db.Column(db.String(80), primary_key=True)
+    method = db.Column(db.String(20), primary_key=True)
+    true_positives = db.Column(db.Integer, nullable=False, default=0)
+    false_positives = db.Column(db.Integer, nullable=False, default=0)
+    false_negatives = db.Column(db.Integer, nullable=False, default=0)
+    true_negatives = db.Column(db.Integer, nullable=False, default=0)
+
+# Threshold calibration (calibration.py)
+
+class CalibrationQueue(db.Model):
+    """(text, category) groups whose annotations changed since the last calibration run."""
+    __tablename__ = 'calibration_queue'
+    text_id = db.Column(db.Integer, db.ForeignKey('text_index.id'), primary_key=True)  # TextIndex.id
+    category = db.Column(db.String(80), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)  # Bumped by every change while queued
+
+class CalibrationSample(db.Model):
+    """A labelled entity of a group: its cached score and the annotators' verdicts."""
+    __tablename__ = 'calibration_sample'
+    text_id = db.Column(db.Integer, db.ForeignKey('text_index.id'), primary_key=True)  # TextIndex.id
+    category = db.Column(db.String(80), primary_key=True)
+    method = db.Column(db.String(20), primary_key=True)
+    entity = db.Column(db.Text, primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    positives = db.Column(db.Integer, nullable=False, default=0)   # Annotators who matched the entity
+    negatives = db.Column(db.Integer, nullable=False, default=0)   # Annotators who unmatched it
+
+class CalibrationHistogram(db.Model):
+    """Verdicts per score bin, summed over every CalibrationSample of a category and method."""
+    __tablename__ = 'calibration_histogram'
+    category = db.Column(db.String(80), primary_key=True)
+    method = db.Column(db.String(20), primary_key=True)
+    bin = db.Column(db.Integer, primary_key=True)
+    positives = db.Column(db.Integer, nullable=False, default=0)
+    negatives = db.Column(db.Integer, nullable=False, default=0)
+
+class MatchThreshold(db.Model):
+    """Calibrated threshold of a category and method; the global default applies without a row."""
+    __tablename__ = 'match_threshold'
+    category = db.Column(db.String(80), primary_key=True)
+    method = db.Column(db.String(20), primary_key=True)
+    threshold = db.Column(db.Float, nullable=False)
+    f1 = db.Column(db.Float, nullable=False)
+    precision = db.Column(db.Float, nullable=False)
+    recall = db.Column(db.Float, nullable=False)
+    positives = db.Column(db.Integer, nullable=False)
+    negatives = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)  # Unix time
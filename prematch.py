@@ -0,0 +1,147 @@
+"""
+Precompute entity matches for the whole corpus so /get_entities can serve them
+without running the model on the request path.
+
+Usage:
+    python prematch.py [--input database.jsonl] [--batch-size 256] [--methods sentence,fuzzy] [--rebuild]
+
+The run is resumable: results are committed once per batch and texts that
+already have precomputed rows are skipped on the next run.
+"""
+import argparse
+import json
+import sys
+import time
+
+from app import (
+    app, db, model, embedding_cache, PrecomputedMatch, get_semantic_matches,
+    get_match_threshold, MATCH_METHODS
+)
+from migrations import upgrade
+from span_matching import span_encode_inputs
+
+
+def stream_records(file_path):
+    """Yield one parsed record per line without loading the whole file."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping line {line_number}: {e}", file=sys.stderr)
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def record_categories(record):
+    return {k: v for k, v in record.items() if k not in ["text", "text_id"] and isinstance(v, list)}
+
+
+def prematch_batch(records, methods, encode_batch_size):
+    """Compute and stage PrecomputedMatch rows for one batch of records."""
+    if 'sentence' in methods or 'span' in methods:
+        # Warm the embedding cache with one large batched encode so that
+        # get_semantic_matches below only does cache lookups.
+        to_encode = []
+        for record in records:
+            text = record.get("text", "")
+            if 'sentence' in methods:
+                to_encode.append(text)
+            for entities in record_categories(record).values():
+                if 'sentence' in methods:
+                    to_encode.extend(entities)
+                if 'span' in methods:
+                    # Exactly what find_span_matches encodes: chunks and entities left after exact matches
+                    to_encode.extend(span_encode_inputs(text, entities))
+        embedding_cache.encode(model, to_encode, batch_size=encode_batch_size)
+
+    rows = []
+    for record in records:
+        text = record.get("text", "")
+        text_id = str(record.get("text_id", ""))
+        for category, entities in record_categories(record).items():
+            for method in methods:
+                matches = get_semantic_matches(text, entities, method=method, category=category)
+                rows.append(PrecomputedMatch(
+                    text_id=text_id,
+                    category=category,
+                    method=method,
+                    threshold=get_match_threshold(method, category),
+                    entities=json.dumps(entities),
+                    matches=json.dumps(matches)
+                ))
+    # Replace partial results left by an earlier run with a different method list
+    PrecomputedMatch.query.filter(
+        PrecomputedMatch.text_id.in_([str(r.get("text_id", "")) for r in records]),
+        PrecomputedMatch.method.in_(methods)
+    ).delete(synchronize_session=False)
+    db.session.add_all(rows)
+    return len(rows)
+
+
+def run(file_path, batch_size, methods, rebuild, encode_batch_size):
+    if rebuild:
+        PrecomputedMatch.query.filter(PrecomputedMatch.method.in_(methods)).delete(synchronize_session=False)
+        db.session.commit()
+
+    # A text is done once it has rows for every requested method
+    done = {
+        text_id for (text_id,) in db.session.query(PrecomputedMatch.text_id)
+        .filter(PrecomputedMatch.method.in_(methods))
+        .group_by(PrecomputedMatch.text_id)
+        .having(db.func.count(db.distinct(PrecomputedMatch.method)) == len(methods))
+    }
+    if done:
+        print(f"Resuming: {len(done)} texts already precomputed")
+
+    pending = (r for r in stream_records(file_path) if str(r.get("text_id", "")) not in done)
+
+    started = time.perf_counter()
+    texts_done = 0
+    rows_done = 0
+    for records in batched(pending, batch_size):
+        rows_done += prematch_batch(records, methods, encode_batch_size)
+        db.session.commit()
+        texts_done += len(records)
+        elapsed = time.perf_counter() - started
+        print(f"{texts_done} texts, {rows_done} rows, {texts_done / elapsed:.1f} texts/sec")
+
+    elapsed = time.perf_counter() - started
+    rate = texts_done / elapsed if elapsed else 0.0
+    print(f"✅ Precomputed {texts_done} texts ({rows_done} rows) in {elapsed:.1f}s, {rate:.1f} texts/sec")
+    print(f"Embedding cache: {embedding_cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute entity matches for a JSONL corpus.")
+    parser.add_argument('--input', default='database.jsonl', help="JSONL corpus to process")
+    parser.add_argument('--batch-size', type=int, default=256, help="Texts per batch/commit")
+    parser.add_argument('--encode-batch-size', type=int, default=64, help="Batch size for the model forward pass")
+    parser.add_argument('--methods', default='sentence,fuzzy', help="Comma-separated matching methods (sentence, span, fuzzy, exact)")
+    parser.add_argument('--rebuild', action='store_true', help="Discard existing results for these methods first")
+    args = parser.parse_args()
+
+    methods = [m.strip() for m in args.methods.split(',') if m.strip()]
+    unknown = [m for m in methods if m not in MATCH_METHODS]
+    if unknown:
+        parser.error(f"Unknown method(s): {', '.join(unknown)}")
+
+    with app.app_context():
+        upgrade(db.engine)
+        run(args.input, args.batch_size, methods, args.rebuild, args.encode_batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import re
+
+import numpy as np
+
+from exact_matching import split_exact_matches
+from fuzzy_matching import tokenize_with_offsets
+
+SENTENCE_PATTERN = re.compile(r'[^.!?\n]+[.!?]*')
+MAX_WINDOW_WORDS = 12  # Longest sliding window, in words
+
+
+def split_sentences(text):
+    """Return (start, end) offsets of each sentence, with surrounding whitespace trimmed."""
+    spans = []
+    for m in SENTENCE_PATTERN.finditer(text):
+        chunk = m.group()
+        stripped = chunk.strip()
+        if stripped:
+            start = m.start() + (len(chunk) - len(chunk.lstrip()))
+            spans.append((start, start + len(stripped)))
+    return spans
+
+
+def window_sizes(entities):
+    """Window lengths (in words) to slide over the text: one per distinct entity length."""
+    sizes = {min(max(len(entity.split()), 1), MAX_WINDOW_WORDS) for entity in entities}
+    return sorted(sizes)
+
+
+def sliding_windows(tokens, size):
+    """
+    Return (start, end) offsets of word windows of the given size over tokenized
+    text, each overlapping the previous one by half its length.
+    """
+    windows = []
+    stride = max(size // 2, 1)
+    last_start = max(len(tokens) - size, 0)
+    for i in range(0, last_start + 1, stride):
+        window = tokens[i:i + size]
+        if window:
+            windows.append((window[0][0], window[-1][1]))
+    if tokens and last_start % stride:
+        # Make sure the tail of the text is covered
+        windows.append((tokens[last_start][0], tokens[-1][1]))
+    return windows
+
+
+def split_chunks(text, entities):
+    """
+    Split text into overlapping chunks with character offsets.
+    Chunks are every sentence plus sliding word windows sized after the entities.
+    Returns:
+        Sorted list of unique (start, end) offsets
+    """
+    chunks = set(split_sentences(text))
+    tokens = tokenize_with_offsets(text)
+    for size in window_sizes(entities):
+        chunks.update(sliding_windows(tokens, size))
+    return sorted(chunks)
+
+
+def cosine_similarity_matrix(a, b):
+    """Cosine similarity between every row of a and every row of b."""
+    a = a / np.clip(np.linalg.norm(a, axis=1, keepdims=True), 1e-12, None)
+    b = b / np.clip(np.linalg.norm(b, axis=1, keepdims=True), 1e-12, None)
+    return a @ b.T
+
+
+def span_encode_inputs(text, entities):
+    """Return the strings find_span_matches will encode, so callers can batch several calls into one."""
+    _, remaining = split_exact_matches(text, entities)
+    if not remaining:
+        return []
+    chunks = split_chunks(text, remaining)
+    if not chunks:
+        return []
+    return [text[start:end] for start, end in chunks] + remaining
+
+
+def find_span_matches(text, entities, threshold, encode):
+    """
+    Find the best matching span of text for each entity.
+    An exact (word-boundary, case-insensitive) occurrence wins outright;
+    otherwise the chunk with the highest cosine similarity is returned if it
+    reaches the threshold.
+    Args:
+        text: The text to search in
+        entities: List of entities to find
+        threshold: Minimum cosine similarity (0-1) for a semantic span match
+        encode: Callable mapping a list of strings to a 2-D embedding matrix
+    """
+    matches, remaining = split_exact_matches(text, entities)
+    if not remaining:
+        return matches
+
+    chunks = split_chunks(text, remaining)
+    if not chunks:
+        return matches
+
+    chunk_embeddings = encode([text[start:end] for start, end in chunks])
+    entity_embeddings = encode(remaining)
+    similarities = cosine_similarity_matrix(entity_embeddings, chunk_embeddings)
+    best = similarities.argmax(axis=1)
+
+    for entity_index, chunk_index in enumerate(best):
+        similarity = float(similarities[entity_index, chunk_index])
+        if similarity >= threshold:
+            start, end = chunks[chunk_index]
+            matches.append({
+                'entity': remaining[entity_index],
+                'start': start,
+                'end': end,
+                'matched_text': text[start:end],
+                'similarity': similarity,
+                'approximate': True
+            })
+
+    return matches
+
+
+def best_span_similarities(text, entities, encode):
+    """
+    Cosine similarity of each entity to its best chunk, the score find_span_matches
+    compares with its threshold. Entities with an exact occurrence score 1.0, and
+    entities with no chunk to compare with -1.0.
+    Returns:
+        Dict of entity -> similarity
+    """
+    matches, remaining = split_exact_matches(text, entities)
+    scores = {m['entity']: 1.0 for m in matches}
+    remaining = list(dict.fromkeys(remaining))
+    chunks = split_chunks(text, remaining) if remaining else []
+    if not chunks:
+        scores.update((entity, -1.0) for entity in remaining)
+        return scores
+    similarities = cosine_similarity_matrix(encode(remaining), encode([text[start:end] for start, end in chunks]))
+    scores.update(zip(remaining, similarities.max(axis=1).tolist()))
+    return scores
@@ -0,0 +1,133 @@
+"""
+Tests of the incremental analytics aggregates: after any sequence of saves and
+deletes, sequential or concurrent, the tables must equal analytics.rebuild().
+
+Run with `python -m pytest` from the repository root.
+"""
+import os
+import random
+import tempfile
+import threading
+import time
+
+import pytest
+
+# Set before app.py reads them: a throwaway database and no model load (the routes below never match)
+os.environ['DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'entities.db')
+os.environ['MODEL_LOAD_MODE'] = 'lazy'
+
+import app as clinmatch  # noqa: E402
+from analytics import STAT_MODELS, rebuild, snapshot  # noqa: E402
+
+NOTES = {
+    'n1': ("Aspirin 100 mg daily and ibuprofen as needed. Denies chest pain, reports fever.",
+           {'medications': ['aspirin', 'ibuprofen', 'paracetamol'], 'findings': ['chest pain', 'fever']}),
+    'n2': ("Type 2 diabetes on metformin. Knee replacement in 2019.",
+           {'problems_diagnoses': ['type 2 diabetes', 'hypertension'], 'medications': ['metformin'],
+            'medical_procedures': ['knee replacement']}),
+}
+USER_IDS = (1, 2, 3)
+
+
+@pytest.fixture
+def client():
+    clinmatch.app.config['TESTING'] = True
+    with clinmatch.app.app_context():
+        clinmatch.db.drop_all()
+        clinmatch.db.create_all()
+        for user_id in USER_IDS:
+            clinmatch.db.session.add(clinmatch.User(id=user_id, username=f'annotator{user_id}', password='x'))
+        clinmatch.db.session.commit()
+    return clinmatch.app.test_client()
+
+
+def log_in(client, user_id):
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+
+
+def annotation(text_id, rng):
+    """A /save payload for a note with a random verdict on every entity."""
+    text, entities = NOTES[text_id]
+    payload = {'text_id': text_id, 'text': text, 'entities': entities,
+               'matched': {}, 'unmatched': {}, 'undetected_entity': {}}
+    for category, entity_list in entities.items():
+        payload['matched'][category] = [e for e in entity_list if rng.random() < 0.5]
+        payload['unmatched'][category] = [e for e in entity_list if e not in payload['matched'][category]]
+        payload['undetected_entity'][category] = ['tachycardia'] if rng.random() < 0.3 else []
+    return payload
+
+
+def stat_rows():
+    """Every aggregate row with a non-zero counter (rebuild() does not create all-zero rows)."""
+    rows = {}
+    for model in STAT_MODELS:
+        table = model.__table__
+        keys = len(table.primary_key.columns)
+        rows[table.name] = sorted(
+            tuple(row) for row in clinmatch.db.session.execute(clinmatch.db.select(table)) if any(row[keys:])
+        )
+    return rows
+
+
+def assert_matches_rebuild():
+    with clinmatch.app.app_context():
+        incremental = stat_rows()
+        rebuild(clinmatch.db.session)
+        clinmatch.db.session.commit()
+        assert incremental == stat_rows()
+        return incremental
+
+
+def test_record_changes_matches_rebuild(client):
+    rng = random.Random(7)
+    for step in range(40):
+        user_id = rng.choice(USER_IDS)
+        log_in(client, user_id)
+        if step % 5 == 4:
+            with clinmatch.app.app_context():
+                record = clinmatch.MatchResult.query.filter_by(user_id=user_id).first()
+                record_id = record.id if record else None
+            if record_id:
+                assert client.post(f'/delete/{record_id}').get_json()['status'] == 'success'
+            continue
+        response = client.post('/save', json=annotation(rng.choice(sorted(NOTES)), rng))
+        assert response.status_code == 200, response.get_json()
+
+    totals = assert_matches_rebuild()
+    assert totals['annotator_stats'] and totals['agreement_stats']
+
+
+def test_concurrent_saves_of_one_group(client, monkeypatch):
+    rng = random.Random(11)
+    log_in(client, 1)
+    assert client.post('/save', json=annotation('n1', rng)).status_code == 200
+
+    # Widen the window between the snapshot and the write: without the lock both saves
+    # snapshot the same state and the second one's difference is computed against it
+    def slow_snapshot(session, groups):
+        before = snapshot(session, groups)
+        time.sleep(0.3)
+        return before
+    monkeypatch.setattr(clinmatch, 'analytics_snapshot', slow_snapshot)
+
+    payloads = {user_id: annotation('n1', rng) for user_id in (2, 3)}
+    start = threading.Barrier(len(payloads))
+    statuses = {}
+
+    def save(user_id):
+        thread_client = clinmatch.app.test_client()
+        log_in(thread_client, user_id)
+        start.wait()
+        statuses[user_id] = thread_client.post('/save', json=payloads[user_id]).status_code
+
+    threads = [threading.Thread(target=save, args=(user_id,)) for user_id in payloads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == {2: 200, 3: 200}
+    totals = assert_matches_rebuild()
+    annotators = {row[0] for row in totals['annotator_stats']}
+    assert annotators == set(USER_IDS)
@@ -0,0 +1,68 @@
+"""
+Tests of the ASGI adapter: header translation and the login check on /asgi/stats.
+
+Run with `python -m pytest` from the repository root.
+"""
+import asyncio
+import json
+import os
+import tempfile
+
+# Set before app.py reads them: a throwaway database and no model load
+os.environ['DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'entities.db')
+os.environ['MODEL_LOAD_MODE'] = 'lazy'
+
+import app as clinmatch  # noqa: E402
+from asgi import AsgiApp, build_environ  # noqa: E402
+
+
+def test_repeated_cookie_headers_are_joined_with_semicolons():
+    scope = {'method': 'GET', 'path': '/', 'headers': [
+        (b'cookie', b'session=abc'), (b'accept', b'text/html'), (b'cookie', b'theme=dark'), (b'accept', b'*/*'),
+    ]}
+    environ = build_environ(scope, None)
+    assert environ['HTTP_COOKIE'] == 'session=abc; theme=dark'
+    assert environ['HTTP_ACCEPT'] == 'text/html,*/*'
+
+
+def call(application, path, cookies=()):
+    """Status and JSON body of one GET through the ASGI app; each cookie is sent as its own header."""
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+             'headers': [(b'cookie', cookie.encode()) for cookie in cookies]}
+    messages = []
+    sent_body = False
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await asyncio.Event().wait()  # The client never hangs up
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    body = b''.join(m.get('body', b'') for m in messages if m['type'] == 'http.response.body')
+    return messages[0]['status'], json.loads(body)
+
+
+def session_cookie(user_id):
+    """The signed Flask session cookie of a logged-in user."""
+    client = clinmatch.app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+    cookie = client.get_cookie(clinmatch.app.config['SESSION_COOKIE_NAME'])
+    return f'{cookie.key}={cookie.value}'
+
+
+def test_asgi_stats_requires_login():
+    application = AsgiApp(clinmatch.app, inference_workers=1, inference_queue_size=1, light_workers=1)
+    try:
+        assert call(application, '/asgi/stats') == (401, {'error': 'Not authenticated'})
+        status, stats = call(application, '/asgi/stats', ['theme=dark', session_cookie(1)])
+        assert status == 200
+        assert stats == {'in_flight': 0, 'capacity': 2, 'rejected': 0, 'cancelled': 0}
+    finally:
+        application.inference.executor.shutdown()
+        application.light_executor.shutdown()
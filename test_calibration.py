@@ -0,0 +1,117 @@
+"""
+Tests of the threshold fit on known verdict histograms and of when refit() stores a threshold.
+
+Run with `python -m pytest` from the repository root.
+"""
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from calibration import (
+    CALIBRATION_MIN_NEGATIVES, CALIBRATION_MIN_POSITIVES, CALIBRATION_MIN_VERDICTS,
+    CALIBRATION_THRESHOLD_RANGE, SCORE_BINS, CalibratedThresholds, fit_threshold, refit
+)
+from models import CalibrationHistogram, MatchThreshold
+
+
+def test_separable_histogram_fits_the_lowest_positive_bin():
+    histogram = {90: (5, 0), 85: (5, 0), 70: (0, 4), 60: (0, 6)}
+    assert fit_threshold(histogram, 100) == (0.85, 1.0, 1.0, 1.0)
+
+
+def test_ties_go_to_the_higher_threshold():
+    # Cutting at 0.7 or 0.6 gives the same F1: both only add the empty gap
+    histogram = {70: (4, 0), 60: (0, 0), 50: (0, 4)}
+    assert fit_threshold(histogram, 100)[0] == 0.7
+
+
+def test_overlapping_histogram():
+    histogram = {90: (8, 1), 80: (2, 3), 70: (0, 6)}
+    threshold, f1, precision, recall = fit_threshold(histogram, 100)
+    assert threshold == 0.9
+    assert f1 == pytest.approx(16 / 19)
+    assert (precision, recall) == (pytest.approx(8 / 9), 0.8)
+
+
+def test_fuzzy_scores_use_whole_points():
+    histogram = {92: (6, 0), 81: (4, 1), 64: (0, 9)}
+    assert fit_threshold(histogram, SCORE_BINS['fuzzy'], CALIBRATION_THRESHOLD_RANGE['fuzzy'])[0] == 81
+
+
+def test_fit_above_the_range_is_clamped_to_its_top():
+    histogram = {99: (10, 0), 90: (0, 10)}
+    assert fit_threshold(histogram, 100)[0] == 0.99
+    assert fit_threshold(histogram, 100, (0.5, 0.95)) == (0.95, 1.0, 1.0, 1.0)
+
+
+def test_fit_below_the_range_is_clamped_to_its_bottom():
+    histogram = {60: (10, 0), 45: (10, 0), 20: (0, 10)}
+    assert fit_threshold(histogram, 100)[0] == 0.45
+    threshold, f1, precision, recall = fit_threshold(histogram, 100, (0.5, 0.95))
+    assert (threshold, precision, recall) == (0.5, 1.0, 0.5)
+    assert f1 == pytest.approx(2 / 3)
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    for model in (CalibrationHistogram, MatchThreshold):
+        model.__table__.create(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def store_histogram(session, category, method, histogram):
+    session.add_all(
+        CalibrationHistogram(category=category, method=method, bin=score, positives=positives, negatives=negatives)
+        for score, (positives, negatives) in histogram.items()
+    )
+    session.flush()
+
+
+def stored_thresholds(session):
+    return {(row.category, row.method): row.threshold for row in session.scalars(select(MatchThreshold))}
+
+
+def test_refit_needs_enough_verdicts(session):
+    # Enough of each kind, but fewer verdicts in total than CALIBRATION_MIN_VERDICTS
+    positives = CALIBRATION_MIN_POSITIVES
+    negatives = max(CALIBRATION_MIN_NEGATIVES, CALIBRATION_MIN_VERDICTS - positives - 1)
+    store_histogram(session, 'medications', 'sentence', {90: (positives, 0), 60: (0, negatives)})
+    assert refit(session, {('medications', 'sentence')}) == 0
+    assert stored_thresholds(session) == {}
+
+    store_histogram(session, 'medications', 'sentence', {30: (0, 1)})
+    assert refit(session, {('medications', 'sentence')}) == 1
+    assert stored_thresholds(session) == {('medications', 'sentence'): 0.9}
+
+
+def test_refit_stores_the_clamped_threshold(session):
+    store_histogram(session, 'findings', 'sentence', {98: (CALIBRATION_MIN_VERDICTS, 0), 70: (0, CALIBRATION_MIN_VERDICTS)})
+    store_histogram(session, 'findings', 'fuzzy', {100: (CALIBRATION_MIN_VERDICTS, 0), 40: (0, CALIBRATION_MIN_VERDICTS)})
+    assert refit(session, {('findings', 'sentence'), ('findings', 'fuzzy')}) == 2
+    assert stored_thresholds(session) == {
+        ('findings', 'sentence'): CALIBRATION_THRESHOLD_RANGE['sentence'][1],
+        ('findings', 'fuzzy'): CALIBRATION_THRESHOLD_RANGE['fuzzy'][1],
+    }
+
+
+def test_missing_threshold_table_falls_back_to_the_default(caplog):
+    engine = create_engine('sqlite://')
+
+    def load():
+        with engine.connect() as conn:
+            return conn.execute(select(MatchThreshold.category, MatchThreshold.method, MatchThreshold.threshold)).all()
+
+    thresholds = CalibratedThresholds(load, reload_seconds=60)
+    assert thresholds.get('findings', 'sentence', 0.7) == 0.7
+    assert 'calibrated thresholds unavailable' in caplog.text
+
+    # Once the table exists, the next reload picks its rows up
+    MatchThreshold.__table__.create(engine)
+    with Session(engine) as session:
+        session.add(MatchThreshold(category='findings', method='sentence', threshold=0.8, f1=1.0, precision=1.0,
+                                   recall=1.0, positives=50, negatives=50, updated_at=0.0))
+        session.commit()
+    thresholds.invalidate()
+    assert thresholds.get('findings', 'sentence', 0.7) == 0.8
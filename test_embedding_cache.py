@@ -0,0 +1,80 @@
+"""
+Tests of the embedding cache's SQLite tier: connection settings, eviction of
+the least recently used rows past max_disk_items and files from before eviction.
+
+Run with `python -m pytest` from the repository root.
+"""
+import sqlite3
+
+import numpy as np
+import pytest
+
+import embedding_cache
+from embedding_cache import EmbeddingCache
+
+DIM = 4
+
+
+class CountingModel:
+    """Stand-in for the sentence model: a fixed vector per text, counting the texts it encodes."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True):
+        self.encoded.extend(texts)
+        return np.array([[len(text), 1, 2, 3] for text in texts], dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000]
+    monkeypatch.setattr(embedding_cache.time, 'time', lambda: now[0])
+    return now
+
+
+def stored_keys(cache):
+    return {row[0] for row in sqlite3.connect(cache.db_path).execute('SELECT key FROM embedding_cache')}
+
+
+def test_connection_uses_wal_and_a_busy_timeout(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'embeddings.db'), 'model')
+    assert cache.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert cache.conn.execute('PRAGMA busy_timeout').fetchone()[0] == embedding_cache.SQLITE_BUSY_TIMEOUT_MS
+
+
+def test_least_recently_used_rows_are_evicted(tmp_path, clock):
+    cache = EmbeddingCache(str(tmp_path / 'embeddings.db'), 'model', max_items=1, max_disk_items=10)
+    model = CountingModel()
+    texts = [f'text {i}' for i in range(10)]
+    for text in texts:
+        cache.encode(model, [text])
+        clock[0] += 1
+    # A disk hit refreshes the oldest text, so the next ones are evicted instead
+    cache.encode(model, ['text 0'])
+    assert model.encoded == texts
+
+    cache.encode(model, ['text 10'])
+    # Over the cap: trimmed to 90% of it, least recently used first
+    assert stored_keys(cache) == {cache._key(text) for text in ['text 0', *texts[3:], 'text 10']}
+    assert cache.stats()['disk_items'] == 9
+    assert cache.stats()['disk_evictions'] == 2
+
+
+def test_file_from_before_eviction_is_upgraded(tmp_path):
+    path = str(tmp_path / 'embeddings.db')
+    cache = EmbeddingCache(path, 'model')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE embedding_cache (key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL)')
+    conn.execute('INSERT INTO embedding_cache VALUES (?, ?, ?)',
+                 (cache._key('old'), DIM, np.arange(DIM, dtype=np.float32).tobytes()))
+    conn.commit()
+
+    model = CountingModel()
+    assert cache.encode(model, ['old']).tolist() == [[0, 1, 2, 3]]
+    assert model.encoded == []
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(embedding_cache)')]
+    assert columns == ['key', 'dim', 'vector', 'last_access']
@@ -0,0 +1,97 @@
+"""
+Tests of the single-pass exact matcher against the per-entity `\\b` regex it
+replaced: word boundaries next to punctuation, overlapping and nested
+entities, and case folding beyond ASCII.
+
+Run with `python -m pytest` from the repository root.
+"""
+import re
+
+import pytest
+
+from exact_matching import ExactMatcher, find_exact_matches
+
+
+def regex_occurrences(text, entities):
+    """Every (possibly overlapping) occurrence found by the old `\\b` + entity + `\\b` case-insensitive regex."""
+    found = set()
+    for entity in dict.fromkeys(entities):
+        if entity.strip():
+            for m in re.finditer(r'\b(?=(' + re.escape(entity) + r')\b)', text, re.IGNORECASE):
+                found.add((entity, m.start(), m.end(1)))
+    return found
+
+
+def regex_first_matches(text, entities):
+    """What the old lookup returned: the first occurrence of each entity."""
+    matches = {}
+    for entity in entities:
+        m = re.search(r'\b' + re.escape(entity) + r'\b', text, re.IGNORECASE)
+        if m:
+            matches[entity] = (m.start(), m.end())
+    return matches
+
+
+def assert_matches_regex(text, entities):
+    occurrences = list(ExactMatcher(entities).finditer(text))
+    assert len(occurrences) == len(set(occurrences))
+    assert set(occurrences) == regex_occurrences(text, entities)
+    first = {}
+    for match in find_exact_matches(text, entities):
+        first.setdefault(match['entity'], (match['start'], match['end']))
+    assert first == regex_first_matches(text, entities)
+    return occurrences
+
+
+@pytest.mark.parametrize('text, entities', [
+    ("Aspirin, (aspirin); ASPIRIN. aspirins aspirin-induced x_aspirin 2aspirin aspirin", ['aspirin']),
+    ("Given s.c. twice, then (s.c.) b.i.d.", ['s.c.', 'b.i.d', 'b.i.d.']),
+    ("C++ and c#, not c++11.", ['c++', 'c#']),
+    ("Dose: 1.5 mg; 1.5mg; 21.5 mg", ['1.5 mg', 'mg']),
+    ("Pain (chest) chest-pain", ['(chest)', 'chest', 'chest-pain']),
+])
+def test_word_boundaries_next_to_punctuation(text, entities):
+    assert_matches_regex(text, entities)
+
+
+def test_entities_ending_in_punctuation_need_a_word_after_them():
+    # `\b` after a final '.' only holds before a word character, as in the old regex
+    text = "s.c. daily, s.c.x"
+    assert regex_occurrences(text, ['s.c.']) == {('s.c.', 12, 16)}
+    assert list(ExactMatcher(['s.c.']).finditer(text)) == [('s.c.', 12, 16)]
+
+
+def test_nested_and_overlapping_entities():
+    text = "Type 2 diabetes mellitus; type 2 diabetes."
+    entities = ['type 2 diabetes', 'diabetes', 'diabetes mellitus', 'type 2', 'mellitus type']
+    occurrences = assert_matches_regex(text, entities)
+    # Ordered by start, longest first at a shared start
+    assert occurrences == [
+        ('type 2 diabetes', 0, 15), ('type 2', 0, 6), ('diabetes mellitus', 7, 24), ('diabetes', 7, 15),
+        ('type 2 diabetes', 26, 41), ('type 2', 26, 32), ('diabetes', 33, 41),
+    ]
+
+
+def test_repeated_and_self_overlapping_entities():
+    assert_matches_regex("pain pain pain", ['pain pain', 'pain'])
+    assert [start for _, start, _ in ExactMatcher(['pain pain']).finditer("pain pain pain")] == [0, 5]
+
+
+@pytest.mark.parametrize('text, entities', [
+    ("Café CAFÉ cafe", ['café', 'cafe']),          # Accented letters fold by case only, not to ASCII
+    ("Ödem ÖDEM ödem Oedem", ['ödem']),
+    ("İstanbul ISTANBUL ıstanbul", ['istanbul']),  # Dotted and dotless i are one letter to re
+    ("ſepsis SEPSIS", ['sepsis']),
+    ("5 µg, 5 μg, 5 ΜG", ['µg']),
+    ("ΟΔΟΣ οδος", ['οδος', 'οδοσ']),               # Final sigma
+    ("Straße STRASSE straẞe", ['straße', 'strasse']),
+    ("2 \u212a units", ['k units']),               # Kelvin sign
+])
+def test_case_folding_matches_ignorecase(text, entities):
+    assert assert_matches_regex(text, entities)
+
+
+def test_offsets_index_the_original_text():
+    text = "İİ ſ Σ aspirin"
+    match, = find_exact_matches(text, ['aspirin'])
+    assert text[match['start']:match['end']] == match['matched_text'] == 'aspirin'
@@ -0,0 +1,63 @@
+"""
+Tests of the micro-batching encode worker: failures in a batch must reach its
+callers without stopping the worker.
+
+Run with `python -m pytest` from the repository root.
+"""
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+import pytest
+
+from inference import EncodeBatcher
+
+
+class FakeModel:
+    """Encodes a string as [len(string), 1]; strings starting with 'fail' raise."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.release.set()
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True):
+        self.release.wait()
+        if any(text.startswith('fail') for text in texts):
+            raise RuntimeError('forward pass failed')
+        return np.array([[len(text), 1] for text in texts], dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+
+def test_callers_get_their_own_rows():
+    batcher = EncodeBatcher(FakeModel(), max_wait_ms=50)
+    futures = [batcher.submit(['a' * n, 'b']) for n in (1, 2, 3)]
+    assert [future.result(timeout=5)[:, 0].tolist() for future in futures] == [[1, 1], [2, 1], [3, 1]]
+
+
+def test_model_error_fails_the_batch_and_the_worker_survives():
+    batcher = EncodeBatcher(FakeModel(), max_wait_ms=0)
+    with pytest.raises(RuntimeError, match='forward pass failed'):
+        batcher.encode(['fail'])
+    assert batcher.encode('abc').tolist() == [3, 1]
+
+
+def test_hook_error_keeps_results_and_the_worker():
+    def broken_hook(size, seconds):
+        raise ValueError('metrics unavailable')
+
+    batcher = EncodeBatcher(FakeModel(), max_wait_ms=0, on_batch=broken_hook)
+    assert batcher.encode(['ab']).tolist() == [[2, 1]]
+    assert batcher.encode(['abcd']).tolist() == [[4, 1]]
+    assert batcher._worker.is_alive()
+
+
+def test_encode_times_out():
+    model = FakeModel()
+    model.release.clear()
+    batcher = EncodeBatcher(model, max_wait_ms=0, timeout=0.2)
+    with pytest.raises(FutureTimeoutError):
+        batcher.encode(['stuck'])
+    model.release.set()
+    assert batcher.encode(['ok']).tolist() == [[2, 1]]
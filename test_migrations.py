@@ -0,0 +1,85 @@
+"""
+Tests of the versioned migrations: a fresh upgrade must produce the schema of
+models.py, and an old database must reach it with its derived data filled in.
+
+Run with `python -m pytest` from the repository root.
+"""
+import json
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from migrations import MIGRATIONS, current_version, upgrade
+from models import db
+
+
+def schema(engine):
+    """Columns, primary key, unique column sets and plain indexes of every table."""
+    inspector = inspect(engine)
+    tables = {}
+    for name in inspector.get_table_names():
+        if name.startswith('schema_'):
+            continue
+        uniques = {tuple(c['column_names']) for c in inspector.get_unique_constraints(name)}
+        indexes = set()
+        for index in inspector.get_indexes(name):
+            (uniques if index['unique'] else indexes).add(tuple(index['column_names']))
+        tables[name] = {
+            'columns': {c['name']: (type(c['type']).__name__, c['nullable']) for c in inspector.get_columns(name)},
+            'primary_key': tuple(inspector.get_pk_constraint(name)['constrained_columns']),
+            'uniques': uniques,
+            'indexes': indexes,
+        }
+    return tables
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'entities.db'}")
+    yield engine
+    engine.dispose()
+
+
+def test_fresh_upgrade_matches_the_models(engine, tmp_path):
+    assert upgrade(engine) == [version for version, _, _ in MIGRATIONS]
+    reference = create_engine(f"sqlite:///{tmp_path / 'reference.db'}")
+    db.metadata.create_all(reference)
+    assert schema(engine) == schema(reference)
+    assert upgrade(engine) == []
+
+
+def test_old_database_is_upgraded_with_its_derived_data(engine):
+    upgrade(engine, target=5)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO user (id, username, password) VALUES (1, 'a', 'x'), (2, 'b', 'x')"))
+        conn.execute(text("INSERT INTO text_index (id, text_id, text) VALUES (1, 'n1', 'Aspirin daily, no fever.')"))
+        conn.execute(text(
+            "INSERT INTO text_entity (text_id, category, entity) VALUES "
+            "('n1', 'medications', 'aspirin'), ('n1', 'medications', 'aspirin'), ('n1', 'findings', 'fever')"
+        ))
+        for user_id, matched in ((1, ['aspirin']), (2, [])):
+            conn.execute(text(
+                "INSERT INTO match_result (text_id, category, entities, matched, unmatched, undetected_entity, user_id) "
+                "VALUES (1, 'medications', :entities, :matched, :unmatched, '[]', :user_id)"
+            ), {'entities': json.dumps(['aspirin']), 'matched': json.dumps(matched),
+                'unmatched': json.dumps(['aspirin'] if not matched else []), 'user_id': user_id})
+
+    # Stopping before the latest version leaves the analytics for later: the current code needs the latest schema
+    assert upgrade(engine, target=6) == [6]
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT count(*) FROM annotator_stats')).scalar() == 0
+        assert conn.execute(text('SELECT name FROM schema_stale_data')).scalars().all() == ['analytics']
+
+    upgrade(engine)
+    with engine.connect() as conn:
+        assert current_version(conn) == MIGRATIONS[-1][0]
+        assert conn.execute(text('SELECT count(*) FROM schema_stale_data')).scalar() == 0
+        assert conn.execute(text(
+            'SELECT user_id, annotations, matched, unmatched FROM annotator_stats ORDER BY user_id'
+        )).all() == [(1, 1, 1, 0), (2, 1, 0, 1)]
+        assert conn.execute(text(
+            'SELECT both_matched, only_a_matched, only_b_matched FROM agreement_stats'
+        )).all() == [(0, 1, 0)]
+        assert conn.execute(text('SELECT text_id, category FROM calibration_queue')).all() == [(1, 'medications')]
+        assert conn.execute(text('SELECT category_count FROM text_index')).scalar() == 2
+        assert conn.execute(text('SELECT count(*) FROM text_entity')).scalar() == 2
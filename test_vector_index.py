@@ -0,0 +1,71 @@
+"""
+Tests of the chunk index's on-disk consistency: torn appends, rebuilds under
+appenders and model/dimension checks.
+
+Run with `python -m pytest` from the repository root.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from vector_index import ChunkIndex
+
+DIM = 16
+
+
+def batches(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(rows, DIM)).astype(np.float32)
+    chunks = np.array([(row, 0, 10) for row in range(rows)], dtype=np.int32)
+    yield vectors, chunks
+
+
+@pytest.fixture
+def index(tmp_path):
+    return ChunkIndex.build(str(tmp_path / 'vector_index'), DIM, batches(200), nlist=4, model_name='model-a')
+
+
+def test_search_finds_an_appended_row(index):
+    vector = np.ones(DIM, dtype=np.float32)
+    index.add(vector[None], np.array([(999, 3, 8)], dtype=np.int32))
+    row, similarity = index.search(vector, k=1, nprobe=4)[0]
+    assert index.chunk(row) == (999, 3, 8)
+    assert similarity == pytest.approx(1.0, abs=1e-3)
+
+
+def test_torn_append_is_refused_then_truncated(index):
+    # A crash after the vector and chunk writes, before the assignment
+    with open(index._path('vectors.f16'), 'ab') as f:
+        f.write(np.zeros(DIM, dtype=np.float16).tobytes())
+    with open(index._path('chunks.i32'), 'ab') as f:
+        f.write(np.array([1, 2, 3], dtype=np.int32).tobytes())
+    reader = ChunkIndex(index.directory)
+    with pytest.raises(ValueError, match='different row counts'):
+        reader.search(np.ones(DIM, dtype=np.float32))
+
+    index.add(np.ones((1, DIM), dtype=np.float32), np.array([(500, 0, 4)], dtype=np.int32))
+    assert len(reader) == 201
+    assert reader.chunk(200) == (500, 0, 4)
+    sizes = {name: os.path.getsize(index._path(name)) for name in ('vectors.f16', 'chunks.i32', 'assignments.i32')}
+    assert sizes == {'vectors.f16': 201 * DIM * 2, 'chunks.i32': 201 * 12, 'assignments.i32': 201 * 4}
+
+
+def test_lock_file_survives_a_rebuild(index):
+    lock_path = index.directory + '.lock'
+    assert os.path.exists(lock_path)
+    with open(lock_path) as before:
+        inode = os.fstat(before.fileno()).st_ino
+    ChunkIndex.build(index.directory, DIM, batches(50, seed=1), nlist=4, model_name='model-a')
+    assert os.stat(lock_path).st_ino == inode
+    assert not os.path.exists(os.path.join(index.directory, 'lock'))
+    assert len(index) == 50  # The live object follows the swap
+
+
+def test_other_model_or_dimension_is_refused(index):
+    with pytest.raises(ValueError, match='model-a'):
+        len(ChunkIndex(index.directory, model_name='model-b'))
+    with pytest.raises(ValueError, match='dimensions'):
+        index.add(np.ones((1, DIM + 1), dtype=np.float32), np.array([(1, 0, 1)], dtype=np.int32))
+    with pytest.raises(ValueError, match='dimensions'):
+        index.search(np.ones(DIM + 1, dtype=np.float32))
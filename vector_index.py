@@ -0,0 +1,371 @@
+"""
+Persistent approximate nearest-neighbour index over text chunks of every note.
+
+Vectors are stored as a float16 memory-mapped matrix and grouped into an
+inverted file (IVF): a spherical k-means over a sample of the vectors gives
+`nlist` centroids, every chunk is assigned to its nearest centroid, and a
+query only scores the chunks of its `nprobe` closest lists.
+
+Usage:
+    python vector_index.py build [--nlist 256] [--window-words 8] [--batch-size 64]
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from fuzzy_matching import tokenize_with_offsets
+from span_matching import split_sentences, sliding_windows
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+INDEX_WINDOW_WORDS = 8  # Word window length used when chunking notes for the index
+
+
+def chunk_text(text, window_words=INDEX_WINDOW_WORDS):
+    """Return sorted (start, end) offsets of the sentences and word windows of a note."""
+    chunks = set(split_sentences(text))
+    chunks.update(sliding_windows(tokenize_with_offsets(text), window_words))
+    return sorted(chunks)
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.clip(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12, None)
+
+
+def spherical_kmeans(vectors, nlist, iterations=10, seed=0):
+    """Cluster unit vectors by cosine similarity; returns (nlist, dim) unit centroids."""
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = (vectors @ centroids.T).argmax(axis=1)
+        for c in range(nlist):
+            members = vectors[assignments == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # Re-seed empty clusters so every list stays useful
+                centroids[c] = vectors[rng.integers(len(vectors))]
+        centroids = normalize(centroids)
+    return centroids
+
+
+class ChunkIndex:
+    """
+    IVF index of note chunk embeddings stored under one directory.
+
+    Files:
+        meta.json        dim, nlist, chunk window length and model name
+        vectors.f16      (N, dim) float16 unit vectors, append-only
+        chunks.i32       (N, 3) int32 rows of (TextIndex.id, start, end), append-only
+        assignments.i32  (N,) int32 inverted list of every row, append-only
+        centroids.npy    (nlist, dim) float32 list centroids
+    Appends and rebuilds serialize on `<directory>.lock`, next to the directory so
+    that the lock survives build() swapping the directory out.
+
+    Args:
+        directory: Index directory
+        model_name: Model the caller encodes with; an index built with another model is refused
+    """
+
+    def __init__(self, directory, model_name=None):
+        self.directory = directory
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._loaded_rows = -1
+        self._loaded_meta = None  # (inode, mtime) of the meta.json that meta and centroids came from
+        self.meta = None
+        self.centroids = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def exists(self):
+        return os.path.exists(self._path('meta.json')) and os.path.exists(self._path('centroids.npy'))
+
+    def _row_files(self):
+        """(file name, bytes per row) of the three append-only files."""
+        return [('vectors.f16', self.meta['dim'] * 2), ('chunks.i32', 12), ('assignments.i32', 4)]
+
+    def _file_rows(self):
+        """Rows in each append-only file, as a fraction when a row was only partly written."""
+        return [os.path.getsize(self._path(name)) / row_bytes for name, row_bytes in self._row_files()]
+
+    def _truncate_torn_rows(self):
+        """Cut the files back to the rows all three hold in full (call under the file lock)."""
+        rows = int(min(self._file_rows()))
+        for name, row_bytes in self._row_files():
+            if os.path.getsize(self._path(name)) != rows * row_bytes:
+                os.truncate(self._path(name), rows * row_bytes)
+
+    def _load_meta(self):
+        """Reload meta and centroids if the index was rebuilt (build() swaps in a new meta.json)."""
+        stat = os.stat(self._path('meta.json'))
+        if (stat.st_ino, stat.st_mtime_ns) != self._loaded_meta:
+            with open(self._path('meta.json'), 'r') as f:
+                meta = json.load(f)
+            if self.model_name and meta.get('model_name') and meta['model_name'] != self.model_name:
+                raise ValueError(
+                    f"Vector index in {self.directory} was built with {meta['model_name']}, "
+                    f"not {self.model_name}; rebuild it"
+                )
+            self.meta = meta
+            self.centroids = np.load(self._path('centroids.npy'))
+            self._loaded_meta = (stat.st_ino, stat.st_mtime_ns)
+            self._loaded_rows = -1
+
+    def _load(self, locked=False):
+        """
+        Load meta and centroids, and remap the files if they were extended since the
+        last load, e.g. by another worker. Files holding different row counts are
+        refused; while an append is in progress the check is repeated once it finished.
+        Args:
+            locked: The caller holds the file lock
+        """
+        self._load_meta()
+        file_rows = self._file_rows()
+        if len(set(file_rows)) > 1 and not locked:
+            with self._file_lock():
+                file_rows = self._file_rows()
+        if len(set(file_rows)) > 1 or file_rows[0] != int(file_rows[0]):
+            raise ValueError(
+                f"Vector index files in {self.directory} hold different row counts "
+                f"{[round(rows, 2) for rows in file_rows]} after an interrupted append; "
+                f"the next add() truncates them, or rebuild the index"
+            )
+        rows = int(file_rows[0])
+        if rows == self._loaded_rows:
+            return
+        dim = self.meta['dim']
+        if rows:
+            self.vectors = np.memmap(self._path('vectors.f16'), dtype=np.float16, mode='r', shape=(rows, dim))
+            self.chunks = np.memmap(self._path('chunks.i32'), dtype=np.int32, mode='r', shape=(rows, 3))
+            assignments = np.memmap(self._path('assignments.i32'), dtype=np.int32, mode='r', shape=(rows,))
+        else:
+            self.vectors = np.zeros((0, dim), dtype=np.float16)
+            self.chunks = np.zeros((0, 3), dtype=np.int32)
+            assignments = np.zeros(0, dtype=np.int32)
+        self._order = np.argsort(assignments, kind='stable').astype(np.int64)
+        self._bounds = np.searchsorted(assignments[self._order], np.arange(len(self.centroids) + 1))
+        self._loaded_rows = rows
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return self._loaded_rows
+
+    def _check_dim(self, vectors):
+        if vectors.shape[-1] != self.meta['dim']:
+            raise ValueError(f"Vectors have {vectors.shape[-1]} dimensions, the index {self.meta['dim']}")
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Exclusive lock shared by every process appending to (or swapping) this index."""
+        with open(self.directory.rstrip(os.sep) + '.lock', 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, vectors, chunks, assignments):
+        with open(self._path('vectors.f16'), 'ab') as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float16).tobytes())
+        with open(self._path('chunks.i32'), 'ab') as f:
+            f.write(np.ascontiguousarray(chunks, dtype=np.int32).tobytes())
+        with open(self._path('assignments.i32'), 'ab') as f:
+            f.write(np.ascontiguousarray(assignments, dtype=np.int32).tobytes())
+
+    def add(self, vectors, chunks):
+        """
+        Append chunk embeddings to a built index.
+        Args:
+            vectors: (n, dim) embeddings
+            chunks: (n, 3) rows of (TextIndex.id, start, end)
+        """
+        if not len(vectors):
+            return
+        vectors = normalize(vectors)
+        # Assign and append under the file lock, so a concurrent rebuild cannot swap
+        # in new centroids between the two
+        with self._lock, self._file_lock():
+            # Rows torn by an appender that crashed mid-write are dropped first, so the
+            # three files stay row-aligned
+            self._load_meta()
+            self._truncate_torn_rows()
+            self._load(locked=True)
+            self._check_dim(vectors)
+            assignments = (vectors @ self.centroids.T).argmax(axis=1)
+            self._append(vectors, chunks, assignments)
+
+    def search(self, query, k=10, nprobe=8):
+        """
+        Approximate top-k search.
+        Returns:
+            List of (row, similarity) sorted by decreasing similarity
+        """
+        query = normalize(query)
+        with self._lock:
+            self._load()
+            self._check_dim(query)
+            order, bounds, vectors = self._order, self._bounds, self.vectors
+        nprobe = min(nprobe, len(self.centroids))
+        lists = np.argsort(-(self.centroids @ query))[:nprobe]
+        candidates = np.concatenate([order[bounds[c]:bounds[c + 1]] for c in lists])
+        if not len(candidates):
+            return []
+        candidates.sort()  # Sequential reads from the memory map
+        scores = vectors[candidates].astype(np.float32) @ query
+        return self._top_k(candidates, scores, k)
+
+    def exact_search(self, query, k=10, block_size=65536):
+        """Brute-force top-k over every row; used as ground truth for benchmarks."""
+        query = normalize(query)
+        with self._lock:
+            self._load()
+            self._check_dim(query)
+            vectors = self.vectors
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), block_size):
+            scores[start:start + block_size] = vectors[start:start + block_size].astype(np.float32) @ query
+        return self._top_k(np.arange(len(vectors)), scores, k)
+
+    @staticmethod
+    def _top_k(rows, scores, k):
+        if len(rows) > k:
+            keep = np.argpartition(-scores, k)[:k]
+            rows, scores = rows[keep], scores[keep]
+        ranked = np.argsort(-scores)
+        return [(int(rows[i]), float(scores[i])) for i in ranked]
+
+    def add_text(self, model, text_pk, text, batch_size=64):
+        """Chunk and encode one note the same way the index was built, then append it."""
+        with self._lock:
+            self._load()
+        chunks = chunk_text(text, self.meta.get('window_words', INDEX_WINDOW_WORDS))
+        if not chunks:
+            return 0
+        vectors = model.encode([text[start:end] for start, end in chunks], batch_size=batch_size, convert_to_numpy=True)
+        self.add(vectors, np.array([(text_pk, start, end) for start, end in chunks], dtype=np.int32))
+        return len(chunks)
+
+    def chunk(self, row):
+        """Return (TextIndex.id, start, end) of a row."""
+        text_pk, start, end = self.chunks[row]
+        return int(text_pk), int(start), int(end)
+
+    @classmethod
+    def build(cls, directory, dim, batches, nlist=256, window_words=INDEX_WINDOW_WORDS,
+              sample_size=100000, model_name=None, seed=0):
+        """
+        Build a new index from batches of (vectors, chunks) and swap it into place.
+        Vectors are streamed to disk first; k-means then trains on a sample and
+        all rows are assigned block by block, so memory stays bounded.
+        """
+        staging = directory.rstrip(os.sep) + '.building'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        index = cls(staging)
+
+        rows = 0
+        with open(index._path('vectors.f16'), 'wb') as vf, open(index._path('chunks.i32'), 'wb') as cf:
+            for vectors, chunks in batches:
+                vf.write(normalize(vectors).astype(np.float16).tobytes())
+                cf.write(np.ascontiguousarray(chunks, dtype=np.int32).tobytes())
+                rows += len(vectors)
+        if not rows:
+            shutil.rmtree(staging)
+            raise ValueError("No chunks to index")
+
+        vectors = np.memmap(index._path('vectors.f16'), dtype=np.float16, mode='r', shape=(rows, dim))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(rows, min(sample_size, rows), replace=False))
+        centroids = spherical_kmeans(vectors[sample].astype(np.float32), nlist, seed=seed)
+        np.save(index._path('centroids.npy'), centroids)
+
+        with open(index._path('assignments.i32'), 'wb') as af:
+            for start in range(0, rows, 65536):
+                block = vectors[start:start + 65536].astype(np.float32)
+                af.write((block @ centroids.T).argmax(axis=1).astype(np.int32).tobytes())
+        del vectors
+
+        with open(index._path('meta.json'), 'w') as f:
+            json.dump({
+                'dim': dim,
+                'nlist': len(centroids),
+                'window_words': window_words,
+                'model_name': model_name
+            }, f)
+
+        # Swap under the live index's lock, so appends land either before the swap
+        # (and are dropped with the old index) or after it, with the new centroids
+        retired = directory.rstrip(os.sep) + '.old'
+        shutil.rmtree(retired, ignore_errors=True)
+        with cls(directory)._file_lock():
+            if os.path.exists(directory):
+                os.replace(directory, retired)
+            os.replace(staging, directory)
+        shutil.rmtree(retired, ignore_errors=True)
+        return cls(directory, model_name)
+
+
+def build_from_database(nlist, window_words, batch_size, texts_per_batch=256):
+    """Encode the chunks of every TextIndex row and build the index used by app.py."""
+    from app import app, db, model, TextIndex, MODEL_NAME, VECTOR_INDEX_DIR
+
+    def batches():
+        started = time.perf_counter()
+        texts = chunks_done = 0
+        pending = []
+        query = db.session.query(TextIndex.id, TextIndex.text).order_by(TextIndex.id).yield_per(texts_per_batch)
+        for text_pk, text in query:
+            pending.extend((text_pk, start, end, text[start:end]) for start, end in chunk_text(text, window_words))
+            texts += 1
+            if texts % texts_per_batch == 0:
+                yield encode_batch(pending)
+                chunks_done += len(pending)
+                pending = []
+                rate = texts / (time.perf_counter() - started)
+                print(f"{texts} texts, {chunks_done} chunks, {rate:.1f} texts/sec")
+        if pending:
+            yield encode_batch(pending)
+
+    def encode_batch(pending):
+        vectors = model.encode([p[3] for p in pending], batch_size=batch_size, convert_to_numpy=True)
+        return vectors, np.array([p[:3] for p in pending], dtype=np.int32)
+
+    with app.app_context():
+        index = ChunkIndex.build(
+            VECTOR_INDEX_DIR, model.get_sentence_embedding_dimension(), batches(),
+            nlist=nlist, window_words=window_words, model_name=MODEL_NAME
+        )
+    print(f"✅ Indexed {len(index)} chunks into {VECTOR_INDEX_DIR}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the corpus-wide chunk vector index.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help="Build the index from every text in the database")
+    build.add_argument('--nlist', type=int, default=256, help="Number of inverted lists (k-means clusters)")
+    build.add_argument('--window-words', type=int, default=INDEX_WINDOW_WORDS, help="Words per window chunk")
+    build.add_argument('--batch-size', type=int, default=64, help="Batch size for the model forward pass")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_from_database(args.nlist, args.window_words, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()